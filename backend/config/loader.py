@@ -9,7 +9,7 @@ import os
 import json
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional
 from functools import lru_cache
 import threading
 
@@ -90,6 +90,7 @@ class ConfigLoader:
                 
             self._data: Optional[ServicesData] = None
             self._config_path: Optional[Path] = None
+            self._invalidation_listeners: List[Callable[[], None]] = []
             self._find_config_file()
             self._initialized = True
             
@@ -265,8 +266,20 @@ class ConfigLoader:
         self._data = None
         self.format_price.cache_clear()
         self.get_all_services_text.cache_clear()
+        for listener in self._invalidation_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"⚠️ Config invalidation listener failed: {e}")
         logger.info("🔄 Config cache invalidated")
 
+    def add_invalidation_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Подписка на сброс кеша: зависимые кеши (например, ответы чата)
+        сбрасываются вместе с конфигурацией
+        """
+        self._invalidation_listeners.append(listener)
+
 # ============================================================================
 # ГЛОБАЛЬНЫЙ SINGLETON ЭКЗЕМПЛЯР
 # ============================================================================
@@ -0,0 +1,268 @@
+"""
+Единый MongoDB-клиент NeuroExpert
+=================================
+Один ``AsyncIOMotorClient`` на процесс для всех путей кода
+(frontend/api/index.py, routes.py, backend/server.py).
+
+Профили развёртывания (``MONGO_PROFILE``):
+
+* ``serverless`` (по умолчанию на Vercel) — ленивое подключение, маленький
+  пул без прогретых соединений (``minPoolSize=0``), короткие таймауты;
+  клиент — глобальный объект модуля и переживает тёплые вызовы функции;
+* ``server`` — долгоживущий процесс: большой пул, ``minPoolSize`` держит
+  прогретые соединения, при старте выполняется ``ping``.
+
+Пул инструментирован ``ConnectionPoolListener``: ожидание выдачи
+соединения (checkout wait), отказы выдачи и число открытых/занятых
+соединений публикуются в Prometheus (``mongo_pool_*``).
+
+Переопределения через окружение:
+    MONGO_PROFILE=serverless|server
+    MONGO_MAX_POOL_SIZE=20
+    MONGO_MIN_POOL_SIZE=0
+    MONGO_WAIT_QUEUE_TIMEOUT_MS=2000
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+logger = logging.getLogger("neuroexpert.db")
+
+MONGO_PROFILES: dict[str, dict[str, Any]] = {
+    "serverless": {
+        "maxPoolSize": 10,
+        "minPoolSize": 0,              # без прогрева: холодный старт не открывает лишних соединений
+        "maxIdleTimeMS": 60000,
+        "serverSelectionTimeoutMS": 3000,
+        "connectTimeoutMS": 5000,
+        "socketTimeoutMS": 20000,
+        "waitQueueTimeoutMS": 2000,
+        "retryWrites": True,
+        "retryReads": True,
+    },
+    "server": {
+        "maxPoolSize": 50,
+        "minPoolSize": 10,
+        "maxIdleTimeMS": 30000,
+        "serverSelectionTimeoutMS": 5000,
+        "connectTimeoutMS": 10000,
+        "socketTimeoutMS": 30000,
+        "waitQueueTimeoutMS": 5000,
+        "retryWrites": True,
+        "retryReads": True,
+    },
+}
+
+_ENV_OVERRIDES = {
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+}
+
+MONGO_CONFIG = {
+    'url': os.getenv('MONGO_URL'),
+    'db_name': os.getenv('DB_NAME'),
+    'profile': os.getenv('MONGO_PROFILE', 'serverless' if os.getenv('VERCEL') else 'server').lower(),
+}
+
+# ──────────────────────────────
+# Метрики пула
+# ──────────────────────────────
+POOL_CHECKOUT_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the MongoDB pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total",
+    "Failed MongoDB pool checkouts by reason",
+    labelnames=("reason",),
+)
+
+POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections",
+    "Open MongoDB pool connections",
+    multiprocess_mode="livesum",
+)
+
+POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out",
+    "MongoDB connections currently checked out",
+    multiprocess_mode="livesum",
+)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    События пула → Prometheus.
+
+    pymongo ≥ 4.7 сообщает ``duration`` в событиях выдачи; для более
+    старых версий время ожидания измеряется от ``check_out_started``
+    (выдача синхронна в потоке исполнителя Motor, поэтому thread-local).
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self.checkouts = 0
+        self.failures = 0
+
+    def _wait(self, event: Any) -> Optional[float]:
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration
+        started = getattr(self._local, "started", None)
+        return time.perf_counter() - started if started is not None else None
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        wait = self._wait(event)
+        if wait is not None:
+            POOL_CHECKOUT_WAIT.observe(wait)
+        self.checkouts += 1
+        POOL_CHECKED_OUT.inc()
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        wait = self._wait(event)
+        if wait is not None:
+            POOL_CHECKOUT_WAIT.observe(wait)
+        self.failures += 1
+        POOL_CHECKOUT_FAILURES.labels(reason=str(event.reason)).inc()
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        POOL_CHECKED_OUT.dec()
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        POOL_CONNECTIONS.inc()
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        POOL_CONNECTIONS.dec()
+
+    def connection_ready(self, event: Any) -> None:
+        pass
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        logger.warning("MongoDB pool cleared: %s", event.address)
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+
+pool_listener = PoolMetricsListener()
+
+# ──────────────────────────────
+# Клиент
+# ──────────────────────────────
+_client: Optional[AsyncIOMotorClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def client_options(profile: Optional[str] = None) -> dict[str, Any]:
+    """Параметры клиента для профиля с учётом переопределений из окружения."""
+    name = (profile or MONGO_CONFIG['profile']).lower()
+    if name not in MONGO_PROFILES:
+        raise ValueError(f"Unknown MONGO_PROFILE: {name!r} (expected one of {sorted(MONGO_PROFILES)})")
+    options = dict(MONGO_PROFILES[name])
+    for key, env in _ENV_OVERRIDES.items():
+        value = os.getenv(env)
+        if value:
+            options[key] = int(value)
+    options["minPoolSize"] = min(options["minPoolSize"], options["maxPoolSize"])
+    return options
+
+
+def get_client(url: Optional[str] = None, profile: Optional[str] = None) -> AsyncIOMotorClient:
+    """
+    Общий клиент процесса (создаётся лениво, без сетевых операций).
+
+    Motor привязывает клиент к event loop при первой операции; если
+    вызов пришёл из другого loop (serverless-рантайм пересоздал его
+    между вызовами), клиент пересоздаётся.
+    """
+    global _client, _client_loop
+
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if _client is not None and loop is not None and _client_loop is not None and loop is not _client_loop:
+        logger.info("Event loop changed, recreating MongoDB client")
+        _client.close()
+        _client = None
+
+    if _client is None:
+        mongo_url = url or MONGO_CONFIG['url'] or os.getenv('MONGO_URL')
+        if not mongo_url:
+            raise RuntimeError("MONGO_URL is not configured")
+        options = client_options(profile)
+        _client = AsyncIOMotorClient(mongo_url, event_listeners=[pool_listener], **options)
+        logger.info(
+            "MongoDB client created",
+            extra={
+                "profile": profile or MONGO_CONFIG['profile'],
+                "max_pool_size": options["maxPoolSize"],
+                "min_pool_size": options["minPoolSize"],
+            },
+        )
+    if loop is not None and _client_loop is not loop:
+        _client_loop = loop
+    return _client
+
+
+def get_database(name: Optional[str] = None) -> AsyncIOMotorDatabase:
+    """База данных на общем клиенте."""
+    db_name = name or MONGO_CONFIG['db_name'] or os.getenv('DB_NAME')
+    if not db_name:
+        raise RuntimeError("DB_NAME is not configured")
+    return get_client()[db_name]
+
+
+async def connect(profile: Optional[str] = None) -> AsyncIOMotorDatabase:
+    """
+    Подготовить подключение при старте приложения.
+
+    В профиле ``server`` выполняется ``ping`` (ошибка подключения видна
+    сразу, пул начинает прогреваться до ``minPoolSize``); в ``serverless``
+    соединение откроет первый реальный запрос.
+    """
+    client = get_client(profile=profile)
+    if (profile or MONGO_CONFIG['profile']) == "server":
+        await client.admin.command("ping")
+    return get_database()
+
+
+def close_client() -> None:
+    global _client, _client_loop
+    if _client is not None:
+        _client.close()
+        _client = None
+        _client_loop = None
+        logger.info("MongoDB client closed")
+
+
+def pool_stats() -> dict[str, Any]:
+    return {
+        "profile": MONGO_CONFIG['profile'],
+        "connected": _client is not None,
+        "checkouts": pool_listener.checkouts,
+        "checkout_failures": pool_listener.failures,
+    }
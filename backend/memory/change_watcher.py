@@ -0,0 +1,228 @@
+"""
+Сброс и прогрев кэша контекстов по change stream MongoDB
+========================================================
+ChatService сбрасывает кэш SmartContext после своей записи, но записи из
+других развёртываний (backend/server.py и Vercel-функция работают с одной
+базой, админские скрипты) оставляют контекст в Redis устаревшим до
+истечения TTL. ``ContextChangeWatcher`` читает change stream базы по
+``chat_messages`` (у ``contact_forms`` нет ``session_id`` — заявки на
+контекст сессии не влияют):
+
+* любая вставка/изменение/удаление документа с ``session_id`` сбрасывает
+  кэш контекста этой сессии (``SmartContext.invalidate_session``); для
+  удалений session_id берётся из недавно увиденных вставок;
+* сессии, писавшие в последние ``CONTEXT_WATCHER_ACTIVE_SECONDS``,
+  считаются активными — их контекст пересобирается заранее (прогрев,
+  с небольшой задержкой, чтобы пачка записей дала одну пересборку);
+* после обрыва поток возобновляется с последнего resume token; ошибка
+  обработки одного события записывается в лог и не останавливает поток.
+
+Change stream требует replica set (Atlas — всегда; локально достаточно
+``mongod --replSet rs0`` и ``rs.initiate()``). На standalone-сервере
+наблюдатель пишет предупреждение и выключается. Включается
+``CONTEXT_WATCHER=1``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Mapping, Optional, Sequence
+
+from prometheus_client import Counter
+
+logger = logging.getLogger("neuroexpert.change_watcher")
+
+CHANGE_WATCHER_CONFIG = {
+    'enabled': os.getenv('CONTEXT_WATCHER', '0').lower() in ('1', 'true', 'yes'),
+    'collections': ('chat_messages',),
+    'prewarm': os.getenv('CONTEXT_WATCHER_PREWARM', '1').lower() in ('1', 'true', 'yes'),
+    'active_window': float(os.getenv('CONTEXT_WATCHER_ACTIVE_SECONDS', '600')),
+    'prewarm_delay': float(os.getenv('CONTEXT_WATCHER_PREWARM_DELAY_MS', '250')) / 1000,
+    'prewarm_concurrency': int(os.getenv('CONTEXT_WATCHER_PREWARM_CONCURRENCY', '4')),
+    'retry_backoff': float(os.getenv('CONTEXT_WATCHER_RETRY_SECONDS', '5')),
+}
+
+# Change streams not supported (standalone mongod)
+_CHANGE_STREAMS_UNSUPPORTED = frozenset({40573})
+_WATCHED_OPERATIONS = ("insert", "update", "replace", "delete")
+
+CHANGE_WATCHER_EVENTS = Counter(
+    "context_watcher_events_total",
+    "Change stream events handled by the context watcher",
+    labelnames=("collection", "action"),
+)
+
+
+class ContextChangeWatcher:
+    """Фоновый читатель change stream, сбрасывающий и прогревающий контексты."""
+
+    def __init__(
+        self,
+        database: Callable[[], Any],
+        context: Any,
+        collections: Sequence[str] = CHANGE_WATCHER_CONFIG['collections'],
+        prewarm: bool = CHANGE_WATCHER_CONFIG['prewarm'],
+        active_window: float = CHANGE_WATCHER_CONFIG['active_window'],
+        prewarm_delay: float = CHANGE_WATCHER_CONFIG['prewarm_delay'],
+        prewarm_concurrency: int = CHANGE_WATCHER_CONFIG['prewarm_concurrency'],
+        retry_backoff: float = CHANGE_WATCHER_CONFIG['retry_backoff'],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        # Фабрика базы (db.connection.get_database): клиент пересоздаётся
+        # при смене event loop, поэтому базу не храним
+        self.database = database
+        self.context = context
+        self.collections = tuple(collections)
+        self.prewarm = prewarm
+        self.active_window = active_window
+        self.prewarm_delay = prewarm_delay
+        self.retry_backoff = retry_backoff
+        self.clock = clock
+        self.resume_token: Optional[Mapping[str, Any]] = None
+        # _id документа → session_id: у события удаления есть только _id
+        self._sessions_by_id: OrderedDict[Any, str] = OrderedDict()
+        self._active: dict[str, float] = {}
+        self._prewarm_tasks: dict[str, asyncio.Task] = {}
+        self._prewarm_slots = asyncio.Semaphore(prewarm_concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.events = 0
+
+    # ──────────────────────────────
+    # Жизненный цикл
+    # ──────────────────────────────
+
+    def start(self) -> None:
+        """Запустить чтение потока в текущем event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="context-change-watcher")
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, *self._prewarm_tasks.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._prewarm_tasks.clear()
+
+    async def _run(self) -> None:
+        from pymongo.errors import OperationFailure, PyMongoError
+
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(self.collections)},
+            "operationType": {"$in": list(_WATCHED_OPERATIONS)},
+        }}]
+        while True:
+            try:
+                async with self.database().watch(
+                    pipeline, full_document="updateLookup", resume_after=self.resume_token
+                ) as stream:
+                    logger.info("Context watcher tailing %s", ", ".join(self.collections))
+                    async for change in stream:
+                        try:
+                            await self.handle(change)
+                        except Exception as exc:  # noqa: BLE001
+                            # Одно событие (например, сбой Redis при сбросе)
+                            # не должно останавливать наблюдатель
+                            CHANGE_WATCHER_EVENTS.labels(
+                                collection=change.get("ns", {}).get("coll", ""), action="failed"
+                            ).inc()
+                            logger.warning("Context watcher failed to handle a change: %s", exc)
+                        self.resume_token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if exc.code in _CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams unavailable (no replica set), context watcher disabled")
+                    return
+                logger.warning("Context watcher stream failed: %s", exc)
+            except PyMongoError as exc:
+                logger.warning("Context watcher stream failed: %s", exc)
+            await asyncio.sleep(self.retry_backoff)
+
+    # ──────────────────────────────
+    # События
+    # ──────────────────────────────
+
+    async def handle(self, change: Mapping[str, Any]) -> Optional[str]:
+        """Обработать событие потока; вернуть затронутый session_id."""
+        self.events += 1
+        collection = change.get("ns", {}).get("coll", "")
+        document_id = (change.get("documentKey") or {}).get("_id")
+        document = change.get("fullDocument") or {}
+
+        session_id = document.get("session_id")
+        if session_id and document_id is not None:
+            self._remember(document_id, session_id)
+        elif document_id is not None:
+            session_id = self._sessions_by_id.get(document_id)
+
+        if not session_id:
+            CHANGE_WATCHER_EVENTS.labels(collection=collection, action="unresolved").inc()
+            return None
+
+        await self.context.invalidate_session(session_id)
+        CHANGE_WATCHER_EVENTS.labels(collection=collection, action="invalidated").inc()
+
+        now = self.clock()
+        self._active[session_id] = now
+        self._expire_inactive(now)
+        if self.prewarm and change.get("operationType") != "delete":
+            self._schedule_prewarm(session_id)
+        return session_id
+
+    def active_sessions(self) -> list[str]:
+        self._expire_inactive(self.clock())
+        return list(self._active)
+
+    def _remember(self, document_id: Any, session_id: str) -> None:
+        self._sessions_by_id[document_id] = session_id
+        self._sessions_by_id.move_to_end(document_id)
+        while len(self._sessions_by_id) > 10_000:
+            self._sessions_by_id.popitem(last=False)
+
+    def _expire_inactive(self, now: float) -> None:
+        cutoff = now - self.active_window
+        for session_id in [sid for sid, seen in self._active.items() if seen < cutoff]:
+            del self._active[session_id]
+
+    # ──────────────────────────────
+    # Прогрев
+    # ──────────────────────────────
+
+    def _schedule_prewarm(self, session_id: str) -> None:
+        task = self._prewarm_tasks.get(session_id)
+        if task is not None and not task.done():
+            # пересборка уже запланирована — пачка записей даст одну
+            return
+        self._prewarm_tasks[session_id] = asyncio.create_task(self._prewarm(session_id))
+
+    async def _prewarm(self, session_id: str) -> None:
+        try:
+            await asyncio.sleep(self.prewarm_delay)
+            async with self._prewarm_slots:
+                await self.context.get_context(session_id=session_id, db=self.database())
+            CHANGE_WATCHER_EVENTS.labels(collection="chat_messages", action="prewarmed").inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Context prewarm failed for %s: %s", session_id, exc)
+        finally:
+            if self._prewarm_tasks.get(session_id) is asyncio.current_task():
+                del self._prewarm_tasks[session_id]
+
+
+def build_change_watcher(database: Optional[Callable[[], Any]], context: Any = None) -> Optional[ContextChangeWatcher]:
+    """Наблюдатель при CONTEXT_WATCHER=1 (и доступном SmartContext), иначе None."""
+    if not CHANGE_WATCHER_CONFIG['enabled'] or database is None:
+        return None
+    if context is None:
+        try:
+            from memory.smart_context import smart_context as context
+        except ImportError as exc:
+            logger.warning("Smart context unavailable, context watcher disabled: %s", exc)
+            return None
+    return ContextChangeWatcher(database, context)
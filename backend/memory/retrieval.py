@@ -0,0 +1,139 @@
+"""
+Локальный поиск релевантной истории
+===================================
+SmartContext держит в контексте последние, важные и сжатые сообщения, но
+не может вернуть старую реплику, относящуюся к текущему вопросу (например,
+конверсию, которую пользователь назвал 30 ходов назад). Этот модуль даёт
+ему retrieval-уровень без GPU и внешних моделей:
+
+* ``HashedNgramEmbedder`` — feature hashing основ слов и символьных 3-грамм в
+  вектор ``dim`` (по умолчанию 256), L2-нормированный. Вектор — чистая
+  функция текста, поэтому его можно хранить рядом с сообщением
+  (``chat_messages.embeddings``, float16) и пересчитывать при отсутствии;
+* ``top_k`` — косинусная близость одним умножением матрицы на вектор и
+  ``argpartition``: доли миллисекунды на окно из 400 сообщений.
+
+numpy импортируется при первом вызове, а не при загрузке модуля. В
+serverless-манифесте (frontend/api/requirements.txt) numpy нет — без него
+retrieval выключен по умолчанию.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import os
+import re
+import unicodedata
+import zlib
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Optional, Sequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def numpy_available() -> bool:
+    """Установлен ли numpy (без импорта: find_spec только ищет модуль)."""
+    try:
+        return importlib.util.find_spec("numpy") is not None
+    except ValueError:
+        return False
+
+
+RETRIEVAL_CONFIG = {
+    'enabled': (
+        os.getenv('SMART_CONTEXT_RETRIEVAL', '1').lower() in ('1', 'true', 'yes')
+        and numpy_available()
+    ),
+    'dim': int(os.getenv('SMART_CONTEXT_EMBEDDING_DIM', '256')),
+    'top_k': int(os.getenv('SMART_CONTEXT_RETRIEVAL_TOP_K', '4')),
+    # Ниже этой косинусной близости сообщение не считается относящимся к вопросу
+    'min_score': float(os.getenv('SMART_CONTEXT_RETRIEVAL_MIN_SCORE', '0.25')),
+}
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+    return _NON_WORD_RE.sub(" ", text).strip()
+
+
+# Служебные и вопросительные слова совпадают почти у любых двух реплик
+_STOPWORDS = frozenset("""
+    и в во на с со к ко по о об от до за из у же ли бы не ни но а или что как
+    это этот эта эти тот та те так там тут где когда какой какая какое какие
+    каких каким кто чем чего мой моя мое мои наш ваш вы вам вас мы нам нас
+    я мне меня он она они его ее их есть был была было были будет для при
+    про уже еще очень можно нужно нужен нужна надо
+""".split())
+
+
+def _features(text: str, size: int = 3) -> list[str]:
+    """Основа слова (первые 6 букв) и символьные 3-граммы внутри слов."""
+    features: list[str] = []
+    for word in _normalize(text).split():
+        if word in _STOPWORDS or (len(word) < 3 and not word.isdigit()):
+            continue
+        features.append(f"w:{word[:6]}")
+        padded = f"<{word}>"
+        features.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return features
+
+
+class HashedNgramEmbedder:
+    """Детерминированные эмбеддинги feature hashing (без обучения и сети)."""
+
+    def __init__(self, dim: int = RETRIEVAL_CONFIG['dim']) -> None:
+        self.dim = dim
+        self._embed_cached = lru_cache(maxsize=4096)(self._embed)
+
+    def embed(self, text: str) -> np.ndarray:
+        return self._embed_cached(text)
+
+    def _embed(self, text: str) -> np.ndarray:
+        import numpy as np
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = _features(text)
+        if not features:
+            return vector
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        # старший бит — знак признака: коллизии хэшей взаимно гасятся
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, (hashes % self.dim).astype(np.intp), signs)
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        vector.setflags(write=False)
+        return vector
+
+    def to_bytes(self, vector: np.ndarray) -> bytes:
+        import numpy as np
+
+        return vector.astype(np.float16).tobytes()
+
+    def from_bytes(self, payload: Any) -> Optional[np.ndarray]:
+        """Вектор из ``chat_messages.embeddings`` или None, если размерность другая."""
+        import numpy as np
+
+        raw = bytes(payload)
+        if len(raw) != self.dim * 2:
+            return None
+        return np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+
+    def encode(self, text: str) -> bytes:
+        return self.to_bytes(self.embed(text))
+
+
+def top_k(query: np.ndarray, vectors: Sequence[np.ndarray], k: int, min_score: float) -> list[int]:
+    """Индексы до ``k`` векторов, ближайших к ``query``, в порядке убывания близости."""
+    import numpy as np
+
+    if not vectors or k <= 0:
+        return []
+    scores = np.stack(vectors) @ query
+    k = min(k, len(scores))
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    ordered = candidates[np.argsort(-scores[candidates])]
+    return [int(i) for i in ordered if scores[i] >= min_score]
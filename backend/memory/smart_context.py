@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import os
+import threading
 import time
+from datetime import datetime, timezone
 from dataclasses import dataclass, field
 from functools import lru_cache
 from typing import (
@@ -13,17 +17,35 @@ from typing import (
     Literal,
     Optional,
     Sequence,
+    TYPE_CHECKING,
     TypedDict,
 )
 
-import tiktoken
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
 from prometheus_client import Counter, Histogram
-from redis.asyncio import Redis
+
+from memory.retrieval import RETRIEVAL_CONFIG, HashedNgramEmbedder, top_k
+
+if TYPE_CHECKING:  # тяжёлые модули нужны только для аннотаций
+    import tiktoken
+    from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+    from redis.asyncio import Redis
 
 logger = logging.getLogger("smart_context")
 logger.setLevel(logging.INFO)
 
+# ──────────────────────────────
+# tiktoken: ленивая загрузка и локальный кэш BPE
+# ──────────────────────────────
+# BPE-файлы кладутся в репозиторий скриптом scripts/vendor_tiktoken.py;
+# при наличии каталога tiktoken читает их с диска и не ходит в сеть
+VENDORED_TIKTOKEN_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vendor", "tiktoken_cache"
+)
+if os.path.isdir(VENDORED_TIKTOKEN_DIR):
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", VENDORED_TIKTOKEN_DIR)
+
+DEFAULT_ENCODING = "cl100k_base"
+
 # ──────────────────────────────
 # Prometheus metrics
 # ──────────────────────────────
@@ -46,6 +68,12 @@ PROM_HISTORY_LENGTH = Histogram(
     buckets=(1, 4, 8, 16, 32, 64, 96, 128),
 )
 
+PROM_RETRIEVED = Counter(
+    "smart_context_retrieved_messages_total",
+    "Older messages brought back into context by relevance to the query",
+    labelnames=("model",),
+)
+
 
 ChatRole = Literal["system", "user", "assistant"]
 
@@ -63,16 +91,70 @@ SummarizerCallable = Callable[[Sequence[ChatMessage]], Awaitable[str]]
 
 
 _encoding_cache: dict[str, tiktoken.Encoding] = {}
+_unavailable_encodings: set[str] = set()
+_encoding_lock = threading.Lock()
 
 
-def _resolve_encoding(name: str) -> tiktoken.Encoding:
+def _resolve_encoding(name: str) -> Optional[tiktoken.Encoding]:
+    """
+    Кодировка по имени (загружается один раз).
+
+    Если BPE-файла нет в кэше и скачать его не удалось, возвращает None
+    и больше не пытается: подсчёт переходит на приближённую оценку,
+    а не повторяет сетевой запрос на каждое сообщение.
+    """
     encoding = _encoding_cache.get(name)
-    if encoding is None:
-        encoding = tiktoken.get_encoding(name)
+    if encoding is not None or name in _unavailable_encodings:
+        return encoding
+    with _encoding_lock:
+        # одновременные первые запросы из пула потоков читают BPE один раз
+        encoding = _encoding_cache.get(name)
+        if encoding is not None or name in _unavailable_encodings:
+            return encoding
+        import tiktoken
+
+        try:
+            encoding = tiktoken.get_encoding(name)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(
+                "Кодировка %s недоступна (%s), токены считаются приближённо; "
+                "см. scripts/vendor_tiktoken.py",
+                name,
+                exc,
+            )
+            _unavailable_encodings.add(name)
+            return None
         _encoding_cache[name] = encoding
     return encoding
 
 
+def _encoding_name_for_model(model_name: str) -> str:
+    """Имя кодировки для модели (без загрузки BPE-файла)."""
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_name_for_model(model_name)
+    except KeyError:
+        logger.warning(
+            "Модель %s не найдена в tiktoken, используем %s",
+            model_name,
+            DEFAULT_ENCODING,
+        )
+        return DEFAULT_ENCODING
+
+
+def _as_epoch(value: Any, default: float = 0.0) -> float:
+    """Метка времени документа в секундах: chat_messages хранит datetime."""
+    if value is None:
+        return default
+    if isinstance(value, datetime):
+        # datetime.utcnow() без tzinfo: иначе .timestamp() сочтёт его местным временем
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
 @dataclass(slots=True)
 class _MessageEnvelope:
     """Вспомогательная обёртка сообщения с предрасчитанными токенами."""
@@ -80,6 +162,37 @@ class _MessageEnvelope:
     tokens: int
 
 
+@dataclass(slots=True)
+class _ContextParts:
+    """
+    Не зависящая от вопроса часть контекста — то, что кэшируется в Redis.
+
+    ``candidates`` — сообщения, ушедшие в сводки: из них retrieval
+    возвращает близкие к вопросу реплики целиком.
+    """
+    recent: list[_MessageEnvelope]
+    pinned: list[_MessageEnvelope]
+    summaries: list[_MessageEnvelope]
+    candidates: list[_MessageEnvelope]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                name: [[env.message, env.tokens] for env in getattr(self, name)]
+                for name in ("recent", "pinned", "summaries", "candidates")
+            },
+            ensure_ascii=False,
+        )
+
+    @classmethod
+    def from_json(cls, payload: str | bytes) -> "_ContextParts":
+        data = json.loads(payload)
+        return cls(**{
+            name: [_MessageEnvelope(ChatMessage(**message), tokens) for message, tokens in data[name]]
+            for name in ("recent", "pinned", "summaries", "candidates")
+        })
+
+
 @dataclass(slots=True)
 class SmartContext:
     """
@@ -87,9 +200,12 @@ class SmartContext:
 
     Основные возможности:
     * асинхронный доступ к MongoDB (Motor) с оптимизированной выборкой;
-    * Redis-кэширование готовых контекстов (TTL, JSON-сериализация);
+    * Redis-кэширование не зависящей от вопроса части контекста (последние,
+      важные сообщения и сводки; TTL, JSON-сериализация);
     * LRU-кэш подсчёта токенов;
     * AI-суммаризация старых сообщений и приоритизация важных реплик;
+    * retrieval: старые реплики, близкие к текущему вопросу (``query``),
+      возвращаются в контекст целиком (``memory.retrieval``);
     * Прометеевские метрики и агрегирование статистики в Redis;
     * Полное логирование и graceful degradation.
 
@@ -129,21 +245,38 @@ class SmartContext:
     db_batch_size: int = 100
     db_fetch_limit: int = 400
     collection_name: str = "chat_messages"
+    retrieval: bool = RETRIEVAL_CONFIG['enabled']
+    retrieval_top_k: int = RETRIEVAL_CONFIG['top_k']
+    retrieval_min_score: float = RETRIEVAL_CONFIG['min_score']
+    embedder: HashedNgramEmbedder = field(default_factory=HashedNgramEmbedder)
 
-    encoding: tiktoken.Encoding = field(init=False, repr=False)
-    encoding_name: str = field(init=False, repr=False)
+    _encoding_name: Optional[str] = field(default=None, init=False, repr=False)
 
-    def __post_init__(self) -> None:
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.model_name)
-        except KeyError:
-            logger.warning(
-                "Модель %s не найдена в tiktoken, используем cl100k_base",
-                self.model_name,
-            )
-            self.encoding = tiktoken.get_encoding("cl100k_base")
-        self.encoding_name = self.encoding.name
-        _encoding_cache[self.encoding_name] = self.encoding
+    # Кодировка загружается при первом get_context (load_encoding, в пуле
+    # потоков), а не в конструкторе: импорт tiktoken и чтение BPE не попадают
+    # в холодный старт и не блокируют event loop
+
+    @property
+    def encoding_name(self) -> str:
+        if self._encoding_name is None:
+            self._encoding_name = _encoding_name_for_model(self.model_name)
+        return self._encoding_name
+
+    @property
+    def encoding(self) -> Optional[tiktoken.Encoding]:
+        return _resolve_encoding(self.encoding_name)
+
+    async def load_encoding(self) -> Optional[tiktoken.Encoding]:
+        """
+        Загрузить кодировку в пуле потоков.
+
+        Чтение (а без вендоренного кэша — скачивание) BPE занимает сотни
+        миллисекунд; синхронно в event loop оно задержало бы все запросы.
+        """
+        name = self._encoding_name
+        if name is not None and (name in _encoding_cache or name in _unavailable_encodings):
+            return _encoding_cache.get(name)
+        return await asyncio.to_thread(lambda: self.encoding)
 
     # ──────────────────────────────
     # Публичный API
@@ -153,6 +286,7 @@ class SmartContext:
         self,
         session_id: str,
         db: AsyncIOMotorDatabase,
+        query: Optional[str] = None,
     ) -> list[ChatMessage]:
         """
         Вернуть оптимальный контекст для заданной сессии.
@@ -163,6 +297,10 @@ class SmartContext:
             Идентификатор диалога.
         db:
             Экземпляр асинхронной БД (Motor).
+        query:
+            Текущий вопрос пользователя. С ним (и включённым retrieval)
+            близкие к вопросу реплики из сводок добавляются к кэшированной
+            части контекста целиком.
 
         Returns
         -------
@@ -172,38 +310,38 @@ class SmartContext:
         if not session_id:
             raise ValueError("session_id не может быть пустым")
 
+        await self.load_encoding()
         start_time = time.perf_counter()
         cache_key = self._build_cache_key(session_id)
+        if not (query and self.retrieval):
+            query = None
 
-        cached = await self._try_load_from_cache(cache_key)
-        if cached is not None:
-            await self._record_metrics(
-                tokens=sum(self.count_tokens(msg["content"]) for msg in cached),
-                duration=time.perf_counter() - start_time,
-                returned=len(cached),
-                session_id=session_id,
-            )
-            return cached
-
-        try:
-            raw_messages = await self._fetch_messages(session_id, db)
-        except Exception as exc:  # noqa: BLE001
-            logger.exception("Ошибка при загрузке сообщений %s: %s", session_id, exc)
-            return []
+        parts = await self._try_load_from_cache(cache_key)
+        raw_messages: Sequence[dict[str, Any]] = ()
+        if parts is None:
+            try:
+                raw_messages = await self._fetch_messages(session_id, db)
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Ошибка при загрузке сообщений %s: %s", session_id, exc)
+                return []
 
-        if not raw_messages:
-            await self._record_metrics(0, time.perf_counter() - start_time, 0, session_id)
-            return []
+            if not raw_messages:
+                await self._record_metrics(0, time.perf_counter() - start_time, 0, session_id)
+                return []
 
-        try:
-            context, token_count = await self._build_context(raw_messages)
-        except Exception as exc:  # noqa: BLE001
-            logger.exception("Ошибка при формировании контекста %s", session_id)
-            # graceful degradation: берём последние сообщения без обработки
-            context = self._fallback_recent_history(raw_messages)
-            token_count = sum(self.count_tokens(msg["content"]) for msg in context)
+            try:
+                parts = await self._build_parts(raw_messages)
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Ошибка при формировании контекста %s", session_id)
+                # graceful degradation: берём последние сообщения без обработки
+                parts = None
+                context = self._fallback_recent_history(raw_messages)
+                token_count = sum(self.count_tokens(msg["content"]) for msg in context)
+            if parts is not None:
+                await self._store_in_cache(cache_key, parts)
 
-        await self._store_in_cache(cache_key, context)
+        if parts is not None:
+            context, token_count = self._assemble(parts, query, raw_messages)
 
         await self._record_metrics(
             tokens=token_count,
@@ -233,6 +371,22 @@ class SmartContext:
         except Exception as exc:  # noqa: BLE001
             logger.exception("Не удалось создать индексы: %s", exc)
 
+    def index_record(self, record: dict[str, Any]) -> None:
+        """
+        Добавить к документу chat_messages эмбеддинги реплик
+        (``embeddings.user`` / ``embeddings.assistant``), чтобы retrieval не
+        пересчитывал их при каждой сборке контекста.
+        """
+        if not self.retrieval:
+            return
+        embeddings = {
+            role: self.embedder.encode(record[field_name])
+            for role, field_name in (("user", "user_message"), ("assistant", "ai_response"))
+            if record.get(field_name)
+        }
+        if embeddings:
+            record["embeddings"] = embeddings
+
     async def invalidate_session(self, session_id: str) -> None:
         """Сбросить кэш контекста и метрик для конкретной сессии."""
         if not self.redis_client:
@@ -258,6 +412,9 @@ class SmartContext:
     @lru_cache(maxsize=8192)
     def _count_tokens_cached(encoding_name: str, text: str) -> int:
         encoding = _resolve_encoding(encoding_name)
+        if encoding is None:
+            # ~3 символа на токен для смешанного русского/английского текста
+            return len(text) // 3 + 1
         return len(encoding.encode(text))
 
     # ──────────────────────────────
@@ -275,9 +432,9 @@ class SmartContext:
             {"$sort": {"timestamp": 1}},
             {
                 "$project": {
+                    # оставляем только нужные поля (inclusion-проекция:
+                    # исключать можно только _id, иначе MongoDB отклоняет этап)
                     "_id": 0,
-                    "session_id": 0,
-                    # оставляем только нужные поля
                     "timestamp": 1,
                     "importance": {"$ifNull": ["$importance", 0.0]},
                     "tags": 1,
@@ -285,6 +442,7 @@ class SmartContext:
                     "ai_response": 1,
                     "messages": 1,
                     "metadata": 1,
+                    "embeddings": 1,
                 }
             },
             {"$limit": self.db_fetch_limit},
@@ -299,10 +457,14 @@ class SmartContext:
     async def _build_context(
         self,
         message_docs: Sequence[dict[str, Any]],
+        query: Optional[str] = None,
     ) -> tuple[list[ChatMessage], int]:
+        parts = await self._build_parts(message_docs)
+        return self._assemble(parts, query, message_docs)
+
+    async def _build_parts(self, message_docs: Sequence[dict[str, Any]]) -> _ContextParts:
+        """Последние, важные сообщения и сводки остальных — без учёта вопроса."""
         timeline = self._normalize_messages(message_docs)
-        if not timeline:
-            return [], 0
 
         envelopes = [
             _MessageEnvelope(message=msg, tokens=self.count_tokens(msg["content"]))
@@ -313,11 +475,40 @@ class SmartContext:
         recent = envelopes[-min_count:]
         earlier = envelopes[:-min_count]
 
-        pinned = [env for env in earlier if env.message.get("importance", 0.0) >= self.pinned_threshold]
-        summarizable = [env for env in earlier if env not in pinned]
+        # Один проход: проверка `env not in pinned` сравнивала словари и
+        # давала O(n²) на длинных сессиях
+        pinned: list[_MessageEnvelope] = []
+        summarizable: list[_MessageEnvelope] = []
+        for env in earlier:
+            if env.message.get("importance", 0.0) >= self.pinned_threshold:
+                pinned.append(env)
+            else:
+                summarizable.append(env)
 
         summary_budget = int(self.max_tokens * self.summary_tokens_ratio)
         summaries = await self._summaries_for(summarizable, summary_budget)
+        return _ContextParts(recent, pinned, summaries, summarizable)
+
+    def _assemble(
+        self,
+        parts: _ContextParts,
+        query: Optional[str] = None,
+        message_docs: Sequence[dict[str, Any]] = (),
+    ) -> tuple[list[ChatMessage], int]:
+        """
+        Уложить части контекста (и реплики, близкие к вопросу) в ``max_tokens``.
+        ``message_docs`` — документы из MongoDB с сохранёнными эмбеддингами
+        (пусто, если части взяты из кэша).
+        """
+        recent, pinned, summaries = parts.recent, parts.pinned, parts.summaries
+        retrieved: list[_MessageEnvelope] = []
+        if query and parts.candidates:
+            # Релевантные вопросу реплики идут в контекст целиком, поверх сводки
+            try:
+                retrieved = self._retrieve(query, parts.candidates, self._stored_vectors(message_docs))
+            except Exception as exc:  # noqa: BLE001
+                # без retrieval контекст остаётся прежним, история не теряется
+                logger.warning("Retrieval недоступен: %s", exc)
 
         recent_tokens = sum(env.tokens for env in recent)
         if recent_tokens > self.max_tokens:
@@ -329,19 +520,55 @@ class SmartContext:
         pinned_kept, pinned_tokens = self._trim_to_budget(pinned, budget_left)
         budget_left -= pinned_tokens
 
+        retrieved_kept, retrieved_tokens = self._trim_to_budget(retrieved, budget_left)
+        budget_left -= retrieved_tokens
+        if retrieved_kept:
+            PROM_RETRIEVED.labels(model=self.model_name).inc(len(retrieved_kept))
+
         summary_kept, summary_tokens = self._trim_to_budget(summaries, budget_left)
 
-        final_envelopes = summary_kept + pinned_kept + recent
-        total_tokens = summary_tokens + pinned_tokens + recent_tokens
+        older = sorted(pinned_kept + retrieved_kept, key=lambda env: env.message.get("timestamp", 0.0))
+        final_envelopes = summary_kept + older + recent
+        total_tokens = summary_tokens + pinned_tokens + retrieved_tokens + recent_tokens
         return [env.message for env in final_envelopes], total_tokens
 
+    def _retrieve(
+        self,
+        query: str,
+        candidates: Sequence[_MessageEnvelope],
+        stored: dict[str, Any],
+    ) -> list[_MessageEnvelope]:
+        """
+        Top-k старых реплик по косинусной близости к вопросу. Векторы без
+        сохранённых (контекст из кэша) считает LRU-кэш эмбеддера.
+        """
+        vectors = []
+        for env in candidates:
+            vector = stored.get(env.message["content"])
+            vectors.append(vector if vector is not None else self.embedder.embed(env.message["content"]))
+        indices = top_k(self.embedder.embed(query), vectors, self.retrieval_top_k, self.retrieval_min_score)
+        return [candidates[i] for i in indices]
+
+    def _stored_vectors(self, message_docs: Sequence[dict[str, Any]]) -> dict[str, Any]:
+        # Эмбеддинг — функция текста, поэтому ключом служит сам текст реплики
+        stored: dict[str, Any] = {}
+        for doc in message_docs:
+            embeddings = doc.get("embeddings") or {}
+            for role, field_name in (("user", "user_message"), ("assistant", "ai_response")):
+                payload, content = embeddings.get(role), doc.get(field_name)
+                if payload is not None and content:
+                    vector = self.embedder.from_bytes(payload)
+                    if vector is not None:
+                        stored[content] = vector
+        return stored
+
     def _normalize_messages(
         self,
         docs: Sequence[dict[str, Any]],
     ) -> list[ChatMessage]:
         messages: list[ChatMessage] = []
         for doc in docs:
-            timestamp = float(doc.get("timestamp", 0.0))
+            timestamp = _as_epoch(doc.get("timestamp"))
             importance = float(doc.get("importance", 0.0))
             metadata = doc.get("metadata") or {}
             tags = doc.get("tags") or []
@@ -355,7 +582,7 @@ class SmartContext:
                             ChatMessage(
                                 role=role,
                                 content=content,
-                                timestamp=float(item.get("timestamp", timestamp)),
+                                timestamp=_as_epoch(item.get("timestamp"), timestamp),
                                 importance=float(item.get("importance", importance)),
                                 metadata=item.get("metadata", metadata),
                             )
@@ -482,20 +709,20 @@ class SmartContext:
     # ──────────────────────────────
 
     def _build_cache_key(self, session_id: str) -> str:
-        return f"smartctx:{self.model_name}:{session_id}:{self.max_tokens}"
+        # parts: в кэше части контекста (_ContextParts), а не готовый список
+        return f"smartctx:parts:{self.model_name}:{session_id}:{self.max_tokens}"
 
     def _build_metrics_key(self, session_id: str) -> str:
         return f"smartctx:metrics:{session_id}"
 
-    async def _try_load_from_cache(self, cache_key: str) -> Optional[list[ChatMessage]]:
+    async def _try_load_from_cache(self, cache_key: str) -> Optional[_ContextParts]:
         if not self.redis_client:
             return None
         try:
             cached = await self.redis_client.get(cache_key)
             if cached is None:
                 return None
-            data = json.loads(cached)
-            return [ChatMessage(**msg) for msg in data]
+            return _ContextParts.from_json(cached)
         except Exception as exc:  # noqa: BLE001
             logger.warning("Не удалось прочитать кэш Redis: %s", exc)
             return None
@@ -503,12 +730,12 @@ class SmartContext:
     async def _store_in_cache(
         self,
         cache_key: str,
-        context: Sequence[ChatMessage],
+        parts: _ContextParts,
     ) -> None:
         if not self.redis_client:
             return
         try:
-            payload = json.dumps(context, ensure_ascii=False)
+            payload = parts.to_json()
             await self.redis_client.set(cache_key, payload, ex=self.session_cache_ttl)
         except Exception as exc:  # noqa: BLE001
             logger.debug("Сохранение контекста в Redis провалилось: %s", exc)
@@ -545,3 +772,22 @@ class SmartContext:
             await pipe.execute()
         except Exception as exc:  # noqa: BLE001
             logger.debug("Не удалось записать метрики в Redis: %s", exc)
+
+
+# ──────────────────────────────
+# Экземпляр по умолчанию
+# ──────────────────────────────
+
+def _default_redis_client() -> Optional[Redis]:
+    """Redis для кэша контекстов (SMART_CONTEXT_REDIS_URL / REDIS_URL) или None."""
+    url = os.getenv("SMART_CONTEXT_REDIS_URL") or os.getenv("REDIS_URL")
+    if not url:
+        return None
+    from redis.asyncio import Redis
+
+    return Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.5)
+
+
+# Общий экземпляр для backend/server.py и frontend/api/routes.py. Конструктор
+# не делает I/O: кодировка и соединение с Redis появляются при первом запросе
+smart_context = SmartContext(redis_client=_default_redis_client())
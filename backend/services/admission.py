@@ -0,0 +1,233 @@
+"""
+Admission control для LLM-вызовов
+=================================
+Без ограничений всплеск трафика превращается в неограниченное число
+одновременных запросов к провайдеру, лавину 429 и пачку 500 у клиентов.
+Перед каждым провайдером стоит ``ProviderAdmission``:
+
+* token bucket — не больше ``rate`` запросов в секунду (с запасом ``burst``);
+* семафор — не больше ``concurrency`` запросов в полёте;
+* ограниченная очередь ожидания — не больше ``queue_size`` ждущих, каждый
+  ждёт не дольше ``max_wait`` секунд;
+* переполненная очередь или истёкшее ожидание — сразу
+  ``AdmissionRejected`` (HTTP 503 с Retry-After), без похода к провайдеру.
+
+``AdmissionControlledClient`` ставит контроль между LLMRouter и шлюзом:
+failover на другого провайдера проходит через его собственную очередь,
+поэтому перегрузка одного провайдера разгружается на второй.
+
+Настройки: ``LLM_RATE_PER_SECOND``, ``LLM_BURST``, ``LLM_MAX_CONCURRENCY``,
+``LLM_QUEUE_SIZE``, ``LLM_QUEUE_TIMEOUT_SECONDS``; для провайдера —
+с префиксом ``LLM_<PROVIDER>_`` (например ``LLM_OPENAI_RATE_PER_SECOND``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from services.chat_service import ServiceUnavailableError
+from services.llm import LLMClient, LLMRequest
+
+logger = logging.getLogger("neuroexpert.admission")
+
+PROVIDERS = ("anthropic", "openai")
+
+
+def _provider_setting(provider: str, name: str, default: str) -> float:
+    return float(os.getenv(f"LLM_{provider.upper()}_{name}", os.getenv(f"LLM_{name}", default)))
+
+
+ADMISSION_CONFIG = {
+    'enabled': os.getenv('LLM_ADMISSION', '1').lower() in ('1', 'true', 'yes'),
+    'providers': {
+        provider: {
+            'rate': _provider_setting(provider, 'RATE_PER_SECOND', '5'),
+            'burst': _provider_setting(provider, 'BURST', '10'),
+            'concurrency': int(_provider_setting(provider, 'MAX_CONCURRENCY', '8')),
+            'queue_size': int(_provider_setting(provider, 'QUEUE_SIZE', '32')),
+            'max_wait': _provider_setting(provider, 'QUEUE_TIMEOUT_SECONDS', '10'),
+        }
+        for provider in PROVIDERS
+    },
+}
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "llm_admission_queue_depth",
+    "LLM requests waiting for admission",
+    labelnames=("provider",),
+    multiprocess_mode="livesum",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "llm_admission_in_flight",
+    "Admitted LLM requests currently in flight",
+    labelnames=("provider",),
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT = Histogram(
+    "llm_admission_wait_seconds",
+    "Time spent waiting for LLM admission",
+    labelnames=("provider",),
+    buckets=(0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+ADMISSION_REJECTED = Counter(
+    "llm_admission_rejected_total",
+    "LLM requests rejected by admission control",
+    labelnames=("provider", "reason"),
+)
+
+
+class AdmissionRejected(ServiceUnavailableError):
+    """Провайдер перегружен: очередь полна или ожидание истекло."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float) -> None:
+        super().__init__("AI service is overloaded, please retry later", retry_after=retry_after)
+        self.provider = provider
+        self.reason = reason
+
+
+class TokenBucket:
+    """Классический token bucket: ``rate`` токенов в секунду, ёмкость ``burst``."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Взять токен; 0 — успешно, иначе секунды до появления токена."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class ProviderAdmission:
+    """Rate limit + семафор + ограниченная очередь для одного провайдера."""
+
+    def __init__(
+        self,
+        provider: str,
+        rate: float,
+        burst: float,
+        concurrency: int,
+        queue_size: int,
+        max_wait: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.in_flight = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _sem(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def retry_after(self) -> float:
+        """Оценка времени разгрузки очереди при текущем rate limit."""
+        rate = self.bucket.rate or 1.0
+        return max(1.0, min(self.max_wait, (self.waiting + self.in_flight) / rate))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(provider=self.provider, reason=reason).inc()
+        logger.warning("LLM admission rejected: provider=%s reason=%s waiting=%s", self.provider, reason, self.waiting)
+        return AdmissionRejected(self.provider, reason, self.retry_after())
+
+    async def _enter(self, semaphore: asyncio.Semaphore) -> None:
+        await semaphore.acquire()
+        try:
+            while (delay := self.bucket.take()) > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            semaphore.release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        semaphore = self._sem()
+        if self.waiting == 0 and not semaphore.locked() and self.bucket.take() == 0:
+            # Быстрый путь: свободный слот и токен — без очереди
+            await semaphore.acquire()
+            ADMISSION_WAIT.labels(provider=self.provider).observe(0.0)
+        else:
+            await self._wait_in_queue(semaphore)
+
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.labels(provider=self.provider).inc()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.labels(provider=self.provider).dec()
+            semaphore.release()
+
+    async def _wait_in_queue(self, semaphore: asyncio.Semaphore) -> None:
+        if self.waiting >= self.queue_size:
+            raise self._reject("queue_full")
+
+        self.waiting += 1
+        ADMISSION_QUEUE_DEPTH.labels(provider=self.provider).inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._enter(semaphore), self.max_wait)
+        except asyncio.TimeoutError:
+            raise self._reject("timeout") from None
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUE_DEPTH.labels(provider=self.provider).dec()
+            ADMISSION_WAIT.labels(provider=self.provider).observe(time.perf_counter() - started)
+
+
+class AdmissionControlledClient:
+    """LLMClient, пропускающий запросы через admission control провайдера."""
+
+    def __init__(self, client: LLMClient, admissions: dict[str, ProviderAdmission]) -> None:
+        self.client = client
+        self.admissions = admissions
+
+    @property
+    def is_configured(self) -> bool:
+        return self.client.is_configured
+
+    async def complete(self, request: LLMRequest) -> str:
+        admission = self.admissions.get(request.provider)
+        if admission is None:
+            return await self.client.complete(request)
+        async with admission.slot():
+            return await self.client.complete(request)
+
+
+def build_admissions(config: Optional[dict] = None) -> dict[str, ProviderAdmission]:
+    providers = (config or ADMISSION_CONFIG)['providers']
+    return {name: ProviderAdmission(name, **settings) for name, settings in providers.items()}
+
+
+def with_admission(client: LLMClient) -> LLMClient:
+    """Обернуть клиента admission control (если не отключён LLM_ADMISSION=0)."""
+    if not ADMISSION_CONFIG['enabled']:
+        return client
+    return AdmissionControlledClient(client, build_admissions())
@@ -0,0 +1,394 @@
+"""
+ChatService — ядро чата и заявок
+================================
+Логика ``/api/chat`` и ``/api/contact`` без привязки к транспорту; её
+монтируют обе точки входа (backend/server.py и frontend/api/index.py через
+routes.py) с помощью ``services.router.create_router``.
+
+Зависимости внедряются в конструктор, поэтому в тестах и бенчмарках
+(benchmarks/load_harness.py, benchmarks/chat_service.py) их легко подменить:
+
+* ``database`` — фабрика Motor-базы (``db.connection.get_database``);
+* ``llm`` — ``services.llm.LLMClient``;
+* ``notifier`` — ``services.notifier.Notifier``; по умолчанию
+  ``services.notification_queue``: пока лимит чата не исчерпан, уведомление
+  уходит сразу, иначе — в очередь с дайджестами и outbox;
+* ``context`` — SmartContext (история с Redis-кэшем контекстов);
+* ``intent_checker`` — HybridIntentChecker;
+* ``response_cache`` — кэш ответов на первые вопросы сессии
+  (``services.response_cache``);
+* ``contact_dedup`` — идемпотентность заявок (``services.idempotency``):
+  повтор той же заявки возвращает исходный ответ без записи и уведомления;
+* ``writer`` — пакетная запись chat_messages (``services.write_buffer``);
+  без него — ``insert_one`` на пути запроса;
+* ``sequencer`` — очередь ходов сессии (``services.session_lock``): ходы
+  одной сессии идут по очереди, каждый видит историю предыдущего.
+
+Стадии чата измеряются ``utils.metrics.track_stage`` (Prometheus + span
+текущей трассы).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional, Protocol
+
+from services.llm import LLMClient, LLMRequest, resolve_model
+from services.notifier import Notifier, format_chat_lead_message, format_contact_message
+from services.prompts import IRRELEVANT_RESPONSE, build_system_prompt
+from utils.metrics import track_stage
+
+logger = logging.getLogger("neuroexpert.chat")
+
+CONTACT_SUCCESS_MESSAGE = "Спасибо! Мы свяжемся с вами в течение 15 минут"
+
+
+class ChatServiceError(RuntimeError):
+    """Ошибка обработки запроса (HTTP 500)."""
+
+    status_code = 500
+
+
+class ServiceUnavailableError(ChatServiceError):
+    """Сервис не настроен или временно недоступен (HTTP 503)."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        # секунды для заголовка Retry-After (перегрузка, а не отсутствие настройки)
+        self.retry_after = retry_after
+
+
+@dataclass(slots=True)
+class ChatRequest:
+    session_id: str
+    message: str
+    model: Optional[str] = None
+    user_data: Optional[dict[str, Any]] = None
+
+
+@dataclass(slots=True)
+class ChatReply:
+    response: str
+    session_id: str
+    model: str
+    relevant: bool = True
+    cached: bool = False
+
+
+@dataclass(slots=True)
+class ContactRequest:
+    name: str
+    contact: str
+    service: str
+    message: Optional[str] = ""
+
+
+class ResponseCache(Protocol):
+    async def lookup(self, request: ChatRequest, history: list[dict[str, Any]]) -> Optional[str]: ...
+
+    async def store(self, request: ChatRequest, history: list[dict[str, Any]], response: str) -> None: ...
+
+
+class RecordWriter(Protocol):
+    async def write(self, record: dict[str, Any]) -> None: ...
+
+    async def settled(self, session_id: str) -> None: ...
+
+
+class TurnSequencer(Protocol):
+    async def run(
+        self,
+        session_id: str,
+        request: ChatRequest,
+        handler: Callable[[ChatRequest], Awaitable[ChatReply]],
+        merge: Callable[[list[ChatRequest]], ChatRequest],
+    ) -> ChatReply: ...
+
+
+def merge_chat_requests(requests: list[ChatRequest]) -> ChatRequest:
+    """Объединить сообщения, пришедшие подряд, в один ход."""
+    if len(requests) == 1:
+        return requests[0]
+    first = requests[0]
+    user_data = next((r.user_data for r in reversed(requests) if r.user_data), None)
+    return ChatRequest(
+        session_id=first.session_id,
+        message="\n".join(r.message for r in requests),
+        model=first.model,
+        user_data=user_data,
+    )
+
+
+class ChatService:
+    """Транспортно-независимая обработка чата и заявок."""
+
+    def __init__(
+        self,
+        *,
+        database: Callable[[], Any],
+        llm: LLMClient,
+        notifier: Optional[Notifier] = None,
+        context: Any = None,
+        intent_checker: Any = None,
+        config: Any = None,
+        response_cache: Optional[ResponseCache] = None,
+        sequencer: Optional[TurnSequencer] = None,
+        writer: Optional[RecordWriter] = None,
+        contact_dedup: Any = None,
+    ) -> None:
+        self.database = database
+        self.llm = llm
+        self.notifier = notifier
+        self.context = context
+        self.intent_checker = intent_checker
+        self.config = config
+        self.response_cache = response_cache
+        self.sequencer = sequencer
+        self.writer = writer
+        self.contact_dedup = contact_dedup
+
+    # ──────────────────────────────
+    # Чат
+    # ──────────────────────────────
+
+    async def chat(self, request: ChatRequest) -> ChatReply:
+        if not self.llm.is_configured:
+            raise ServiceUnavailableError("AI service not configured")
+
+        if self.sequencer is None:
+            return await self._chat_turn(request)
+        return await self.sequencer.run(request.session_id, request, self._chat_turn, merge_chat_requests)
+
+    async def _chat_turn(self, request: ChatRequest) -> ChatReply:
+        model_key, _, _ = resolve_model(request.model)
+
+        if not await self._is_relevant(request.message):
+            return ChatReply(IRRELEVANT_RESPONSE, request.session_id, model_key, relevant=False)
+
+        db = self.database()
+        if self.writer is not None:
+            # Предыдущий ход сессии мог ещё не дойти до MongoDB (режим buffered)
+            await self.writer.settled(request.session_id)
+        history = await self._load_history(request.session_id, db, request.message)
+
+        cached = await self._cache_lookup(request, history)
+        if cached is not None:
+            response = cached
+        else:
+            with track_stage("prompt_build"):
+                llm_request = LLMRequest(
+                    session_id=request.session_id,
+                    system_prompt=build_system_prompt(self.config),
+                    message=request.message,
+                    model=model_key,
+                    history=history,
+                )
+            with track_stage("llm_call"):
+                response = await self.llm.complete(llm_request)
+            await self._cache_store(request, history, response)
+
+        record = {
+            "id": str(uuid.uuid4()),
+            "session_id": request.session_id,
+            "user_message": request.message,
+            "ai_response": response,
+            "model": model_key,
+            "timestamp": datetime.utcnow(),
+            "user_data": request.user_data,
+        }
+        self._index_record(record)
+        with track_stage("db_insert"):
+            if self.writer is not None:
+                await self.writer.write(record)
+            else:
+                await db.chat_messages.insert_one(record)
+        await self._invalidate_context(request.session_id)
+
+        if self.notifier is not None and request.user_data and request.user_data.get("contact"):
+            with track_stage("notification"):
+                await self.notifier.send(format_chat_lead_message(model_key, request.user_data, request.message))
+
+        return ChatReply(response, request.session_id, model_key, cached=cached is not None)
+
+    async def _is_relevant(self, message: str) -> bool:
+        if self.intent_checker is None:
+            return True
+        try:
+            with track_stage("intent_check"):
+                intent = await self.intent_checker.classify_async(message)
+        except Exception as exc:  # noqa: BLE001
+            # Классификатор не должен блокировать чат
+            logger.warning("Intent checker issue: %s", exc)
+            return True
+        return intent.is_relevant
+
+    async def _load_history(self, session_id: str, db: Any, query: str) -> list[dict[str, Any]]:
+        if self.context is None:
+            return []
+        try:
+            with track_stage("context_build"):
+                return await self.context.get_context(session_id=session_id, db=db, query=query)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Smart context unavailable: %s", exc)
+            return []
+
+    def _index_record(self, record: dict[str, Any]) -> None:
+        # Эмбеддинги для retrieval: ответ LLM уже получен, запись важнее них
+        if self.context is None or not hasattr(self.context, "index_record"):
+            return
+        try:
+            self.context.index_record(record)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Smart context indexing failed: %s", exc)
+
+    async def _invalidate_context(self, session_id: str) -> None:
+        # Следующий ход сессии должен увидеть только что записанную реплику
+        if self.context is None or not hasattr(self.context, "invalidate_session"):
+            return
+        try:
+            await self.context.invalidate_session(session_id)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Smart context invalidation failed: %s", exc)
+
+    async def _cache_lookup(self, request: ChatRequest, history: list[dict[str, Any]]) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        try:
+            return await self.response_cache.lookup(request, history)
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Response cache lookup failed: %s", exc)
+            return None
+
+    async def _cache_store(self, request: ChatRequest, history: list[dict[str, Any]], response: str) -> None:
+        if self.response_cache is None:
+            return
+        try:
+            await self.response_cache.store(request, history, response)
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Response cache store failed: %s", exc)
+
+    # ──────────────────────────────
+    # Заявки
+    # ──────────────────────────────
+
+    async def submit_contact(self, form: ContactRequest, idempotency_key: Optional[str] = None) -> dict[str, Any]:
+        key = None
+        if self.contact_dedup is not None:
+            key = self.contact_dedup.key_for(form.name, form.contact, form.service, idempotency_key)
+            replay = await self.contact_dedup.replay(key)
+            if replay is not None:
+                logger.info("Contact form replay: %s - %s", form.name, form.service)
+                return replay
+
+        record = {
+            "name": form.name,
+            "contact": form.contact,
+            "service": form.service,
+            "message": form.message,
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.utcnow(),
+            "status": "new",
+        }
+        contact_forms = self.database().contact_forms
+        if key is not None:
+            existing = await self.contact_dedup.insert(contact_forms, record, key)
+            if existing is not None:
+                # повтор пришёл одновременно или в другой процесс
+                response = _contact_response(existing)
+                await self.contact_dedup.remember(key, response)
+                logger.info("Contact form replay: %s - %s", form.name, form.service)
+                return response
+        else:
+            await contact_forms.insert_one(record)
+
+        if self.notifier is not None:
+            await self.notifier.send(format_contact_message(form.name, form.contact, form.service, form.message))
+
+        logger.info("Contact form: %s - %s", form.name, form.service)
+        response = _contact_response(record)
+        if key is not None:
+            await self.contact_dedup.remember(key, response)
+        return response
+
+
+def _contact_response(record: dict[str, Any]) -> dict[str, Any]:
+    return {"success": True, "message": CONTACT_SUCCESS_MESSAGE, "id": record["id"]}
+
+
+# ──────────────────────────────
+# Сборка по умолчанию
+# ──────────────────────────────
+
+def _default_database() -> Any:
+    from db.connection import get_database
+
+    if not os.getenv("MONGO_URL") or not os.getenv("DB_NAME"):
+        raise ServiceUnavailableError("Database is not configured")
+    return get_database(os.getenv("DB_NAME"))
+
+
+def build_chat_service(**overrides: Any) -> ChatService:
+    """
+    ChatService с зависимостями из окружения.
+
+    Необязательные компоненты (конфигурация, классификатор, SmartContext)
+    при ошибке импорта отключаются, а не роняют обе ручки.
+    """
+    from services.admission import with_admission
+    from services.llm_gateway import get_gateway
+    from services.llm_router import LLMRouter
+    from services.notification_queue import build_notifier
+    from services.session_lock import build_session_sequencer
+    from services.write_buffer import build_write_buffer
+
+    deps: dict[str, Any] = {
+        "database": _default_database,
+        # дедлайн, failover и хеджирование → admission control провайдера →
+        # долгоживущие клиенты шлюза
+        "llm": LLMRouter(with_admission(get_gateway())),
+        "sequencer": build_session_sequencer(),
+    }
+    try:
+        from config.loader import config
+
+        deps["config"] = config
+    except ImportError as exc:
+        logger.warning("Config loader unavailable: %s", exc)
+    try:
+        from utils.intent_checker import intent_checker
+
+        deps["intent_checker"] = intent_checker
+    except ImportError as exc:
+        logger.warning("Intent checker unavailable: %s", exc)
+    try:
+        from memory.smart_context import smart_context
+
+        deps["context"] = smart_context
+    except ImportError as exc:
+        logger.warning("Smart context unavailable: %s", exc)
+
+    deps.update(overrides)
+    if "writer" not in overrides:
+        deps["writer"] = build_write_buffer(deps["database"])
+    sequencer = deps.get("sequencer")
+    if deps["writer"] is not None and getattr(sequencer, "settle", False) is None:
+        # Аренда сессии держится, пока запись хода не дошла до MongoDB
+        sequencer.settle = deps["writer"].settled
+    if "notifier" not in overrides:
+        deps["notifier"] = build_notifier(deps["database"])
+    if "contact_dedup" not in overrides:
+        from services.idempotency import build_contact_dedup
+
+        deps["contact_dedup"] = build_contact_dedup()
+    if "response_cache" not in overrides:
+        from services.response_cache import build_response_cache
+
+        # Версия кэша — промпт из той конфигурации, с которой работает сервис
+        deps["response_cache"] = build_response_cache(deps.get("config"))
+    return ChatService(**deps)
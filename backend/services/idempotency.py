@@ -0,0 +1,225 @@
+"""
+Идемпотентность заявок /api/contact
+===================================
+Двойной клик и повтор запроса клиентом создавали вторую запись
+``contact_forms`` и второе уведомление в Telegram: каждая отправка получала
+свой ``uuid4`` и вставлялась безусловно. ``ContactDeduplicator`` даёт каждой
+заявке ключ:
+
+* заголовок ``Idempotency-Key`` (хэш значения) — повтор с тем же ключом
+  в течение ``CONTACT_IDEMPOTENCY_KEY_TTL_SECONDS`` возвращает исходный
+  ответ; тот же ключ с другим содержимым — 422;
+* без заголовка — хэш нормализованных имени, контакта и услуги; такая же
+  заявка в течение ``CONTACT_DEDUP_WINDOW_SECONDS`` считается повтором.
+
+Ключ проверяется в два уровня:
+
+1. набор недавних ключей (в памяти процесса и, при заданном
+   ``CONTACT_DEDUP_REDIS_URL``/``REDIS_URL``, в Redis) хранит готовый ответ —
+   повтор не обращается ни к MongoDB, ни к Telegram;
+2. уникальный индекс ``contact_forms.idempotency_key`` ловит повторы,
+   которые пришли одновременно или в другой процесс без общего Redis.
+   Ключ заявки старше окна освобождается — такая же заявка через час
+   снова создаёт запись.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Optional
+
+from prometheus_client import Counter
+
+logger = logging.getLogger("neuroexpert.idempotency")
+
+IDEMPOTENCY_CONFIG = {
+    'enabled': os.getenv('CONTACT_DEDUP', '1').lower() in ('1', 'true', 'yes'),
+    'window': float(os.getenv('CONTACT_DEDUP_WINDOW_SECONDS', '600')),
+    'key_ttl': float(os.getenv('CONTACT_IDEMPOTENCY_KEY_TTL_SECONDS', '86400')),
+    'recent_size': int(os.getenv('CONTACT_DEDUP_RECENT_SIZE', '10000')),
+    'redis_url': os.getenv('CONTACT_DEDUP_REDIS_URL') or os.getenv('REDIS_URL'),
+    'namespace': 'contact:idempotency',
+    'field': 'idempotency_key',
+}
+
+CONTACT_REPLAYS = Counter(
+    "contact_replays_total",
+    "Duplicate contact form submissions answered without a new record",
+    labelnames=("source",),
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Пробелы, дефисы и скобки в телефоне не делают контакт другим
+_CONTACT_NOISE_RE = re.compile(r"[\s\-()]+")
+
+
+class IdempotencyConflictError(Exception):
+    """Ключ Idempotency-Key уже использован для другой заявки."""
+
+    status_code = 422
+
+
+@dataclass(slots=True)
+class ContactKey:
+    key: str
+    # Хэш содержимого: у повтора по заголовку он должен совпасть
+    fingerprint: str
+    ttl: float
+
+
+def contact_fingerprint(name: str, contact: str, service: str) -> str:
+    parts = (
+        _WHITESPACE_RE.sub(" ", name).strip().casefold(),
+        _CONTACT_NOISE_RE.sub("", contact).casefold(),
+        _WHITESPACE_RE.sub(" ", service).strip().casefold(),
+    )
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+class RecentKeys:
+    """Недавние ключи и их ответы: LRU в памяти + необязательный Redis."""
+
+    def __init__(
+        self,
+        maxsize: int = IDEMPOTENCY_CONFIG['recent_size'],
+        redis: Any = None,
+        namespace: str = IDEMPOTENCY_CONFIG['namespace'],
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.redis = redis
+        self.namespace = namespace
+        self.timer = timer
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self.timer():
+                return value
+            del self._entries[key]
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(f"{self.namespace}:{key}")
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Recent contact keys unavailable in Redis: %s", exc)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def put(self, key: str, value: dict[str, Any], ttl: float) -> None:
+        self._entries[key] = (self.timer() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(f"{self.namespace}:{key}", json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Recent contact keys unavailable in Redis: %s", exc)
+
+
+class ContactDeduplicator:
+    """Ключи заявок, набор недавних ответов и вставка через уникальный индекс."""
+
+    def __init__(
+        self,
+        recent: Optional[RecentKeys] = None,
+        window: float = IDEMPOTENCY_CONFIG['window'],
+        key_ttl: float = IDEMPOTENCY_CONFIG['key_ttl'],
+        field: str = IDEMPOTENCY_CONFIG['field'],
+    ) -> None:
+        self.recent = recent if recent is not None else RecentKeys()
+        self.window = window
+        self.key_ttl = key_ttl
+        self.field = field
+        self._indexed: set[str] = set()
+
+    def key_for(self, name: str, contact: str, service: str, idempotency_key: Optional[str] = None) -> ContactKey:
+        fingerprint = contact_fingerprint(name, contact, service)
+        header = (idempotency_key or "").strip()
+        if header:
+            digest = hashlib.sha256(header.encode("utf-8")).hexdigest()[:32]
+            return ContactKey(f"k:{digest}", fingerprint, self.key_ttl)
+        return ContactKey(f"c:{fingerprint}", fingerprint, self.window)
+
+    async def replay(self, key: ContactKey) -> Optional[dict[str, Any]]:
+        """Ответ на недавнюю заявку с этим ключом из набора недавних ключей."""
+        entry = await self.recent.get(key.key)
+        if entry is None:
+            return None
+        self._check_conflict(key, entry.get("fingerprint"))
+        CONTACT_REPLAYS.labels(source="recent").inc()
+        return entry["response"]
+
+    async def remember(self, key: ContactKey, response: dict[str, Any]) -> None:
+        await self.recent.put(key.key, {"fingerprint": key.fingerprint, "response": response}, key.ttl)
+
+    async def insert(self, collection: Any, record: dict[str, Any], key: ContactKey) -> Optional[dict[str, Any]]:
+        """
+        Вставить заявку с ключом. Если ключ уже занят заявкой моложе окна,
+        ничего не вставлять и вернуть её документ.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        await self._ensure_index(collection)
+        record[self.field] = key.key
+        record["fingerprint"] = key.fingerprint
+        for attempt in range(3):
+            try:
+                await collection.insert_one(record)
+                return None
+            except DuplicateKeyError:
+                if attempt == 2:
+                    raise
+            existing = await collection.find_one({self.field: key.key})
+            if existing is None:
+                # ключ освободили между вставкой и чтением
+                continue
+            if existing["timestamp"] > record["timestamp"] - timedelta(seconds=key.ttl):
+                self._check_conflict(key, existing.get("fingerprint"))
+                CONTACT_REPLAYS.labels(source="index").inc()
+                return existing
+            # Та же заявка за пределами окна — новая: освобождаем ключ старой
+            await collection.update_one(
+                {"_id": existing["_id"], self.field: key.key},
+                {"$set": {self.field: f"{key.key}:{existing.get('id', existing['_id'])}"}},
+            )
+        return None
+
+    def _check_conflict(self, key: ContactKey, fingerprint: Optional[str]) -> None:
+        if key.key.startswith("k:") and fingerprint and fingerprint != key.fingerprint:
+            CONTACT_REPLAYS.labels(source="conflict").inc()
+            raise IdempotencyConflictError("Idempotency-Key уже использован для другой заявки")
+
+    async def _ensure_index(self, collection: Any) -> None:
+        name = getattr(collection, "name", "contact_forms")
+        if name in self._indexed:
+            return
+        try:
+            # sparse: старые заявки без ключа индексу не мешают
+            await collection.create_index(self.field, unique=True, sparse=True, name=f"{self.field}_unique")
+            self._indexed.add(name)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Contact idempotency index creation failed: %s", exc)
+
+
+def build_contact_dedup(redis: Any = None) -> Optional[ContactDeduplicator]:
+    """Дедупликация заявок (CONTACT_DEDUP=1); набор ключей в Redis, если задан URL."""
+    if not IDEMPOTENCY_CONFIG['enabled']:
+        return None
+    if redis is None and IDEMPOTENCY_CONFIG['redis_url']:
+        from utils.intent_cache import build_redis_client
+
+        redis = build_redis_client(IDEMPOTENCY_CONFIG['redis_url'])
+    return ContactDeduplicator(RecentKeys(redis=redis))
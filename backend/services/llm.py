@@ -0,0 +1,86 @@
+"""
+LLM-клиент чата
+===============
+Единая карта моделей и интерфейс вызова LLM для ChatService.
+
+``LLMClient.complete`` принимает ``LLMRequest`` — всё состояние запроса
+(промпт, история, сообщение, модель); реализация может держать
+долгоживущие клиенты провайдеров. ``EmergentLLMClient`` — текущая
+реализация поверх emergentintegrations (импортируется лениво).
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Optional, Protocol
+
+logger = logging.getLogger("neuroexpert.llm")
+
+# Ключ модели из запроса → (провайдер, имя модели у провайдера)
+MODEL_MAP: dict[str, tuple[str, str]] = {
+    "claude-sonnet": ("anthropic", "claude-3-7-sonnet-20250219"),
+    "gpt-4o": ("openai", "gpt-4o"),
+}
+DEFAULT_MODEL = "claude-sonnet"
+
+
+def resolve_model(model: Optional[str]) -> tuple[str, str, str]:
+    """(ключ, провайдер, модель); неизвестные ключи → DEFAULT_MODEL."""
+    key = model if model in MODEL_MAP else DEFAULT_MODEL
+    provider, model_name = MODEL_MAP[key]
+    return key, provider, model_name
+
+
+@dataclass(slots=True)
+class LLMRequest:
+    session_id: str
+    system_prompt: str
+    message: str
+    model: str = DEFAULT_MODEL
+    history: list[dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def provider(self) -> str:
+        return resolve_model(self.model)[1]
+
+    @property
+    def model_name(self) -> str:
+        return resolve_model(self.model)[2]
+
+
+class LLMClient(Protocol):
+    @property
+    def is_configured(self) -> bool: ...
+
+    async def complete(self, request: LLMRequest) -> str: ...
+
+
+class EmergentLLMClient:
+    """LLM через emergentintegrations (``LlmChat`` на каждый запрос)."""
+
+    def __init__(self, api_key: Optional[str]) -> None:
+        self.api_key = api_key
+        self._classes: Optional[tuple[Any, Any]] = None
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _load(self) -> tuple[Any, Any]:
+        # emergentintegrations тянет SDK всех провайдеров — не на холодном старте
+        if self._classes is None:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+            self._classes = (LlmChat, UserMessage)
+        return self._classes
+
+    async def complete(self, request: LLMRequest) -> str:
+        llm_chat_cls, user_message_cls = self._load()
+        chat = llm_chat_cls(
+            api_key=self.api_key,
+            session_id=request.session_id,
+            system_message=request.system_prompt,
+            initial_messages=request.history,
+        ).with_model(request.provider, request.model_name)
+        return await chat.send_message(user_message_cls(text=request.message))
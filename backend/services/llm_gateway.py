@@ -0,0 +1,262 @@
+"""
+LLM-шлюз с долгоживущими клиентами провайдеров
+==============================================
+``EmergentLLMClient`` собирает ``LlmChat`` (а с ним SDK провайдера и его
+пул соединений) на каждый ход чата: TLS-рукопожатие и конструирование
+клиента оплачиваются каждым запросом. Шлюз держит по одному
+``httpx.AsyncClient`` с keep-alive пулом на провайдера на всё время жизни
+процесса; на запрос приходится только список сообщений.
+
+Провайдеры вызываются напрямую по HTTP (Anthropic Messages API, OpenAI
+Chat Completions), ключи — ANTHROPIC_API_KEY / OPENAI_API_KEY. Провайдер
+без ключа обслуживает ``fallback`` (по умолчанию EmergentLLMClient с
+EMERGENT_LLM_KEY), поэтому включение шлюза не требует новых секретов.
+
+Поведение по умолчанию: развёртывание только с EMERGENT_LLM_KEY выигрыша
+не получает — ``LlmChat`` привязан к сессии, промпту и истории и
+по-прежнему собирается на каждый запрос (переиспользовать его между
+ходами SDK не позволяет). Долгоживущие пулы появляются у провайдера, как
+только задан его прямой ключ; при старте без прямых ключей шлюз пишет об
+этом в лог.
+
+Жизненный цикл: ``get_gateway()`` — общий экземпляр процесса,
+``await gateway.start()`` в lifespan прогревает клиенты,
+``await close_gateway()`` закрывает пулы при остановке. HTTP-клиент
+пересоздаётся, если сменился event loop (Vercel, тесты) — как
+MongoDB-клиент в db.connection.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import os
+from typing import Any, Optional
+
+import httpx
+
+from services.llm import EmergentLLMClient, LLMClient, LLMRequest
+
+logger = logging.getLogger("neuroexpert.llm_gateway")
+
+LLM_GATEWAY_CONFIG = {
+    'anthropic_api_key': os.getenv('ANTHROPIC_API_KEY'),
+    'anthropic_base_url': os.getenv('ANTHROPIC_BASE_URL', 'https://api.anthropic.com'),
+    'anthropic_version': os.getenv('ANTHROPIC_VERSION', '2023-06-01'),
+    'openai_api_key': os.getenv('OPENAI_API_KEY'),
+    'openai_base_url': os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1'),
+    # Пул на провайдера: соединения переиспользуются между ходами чата
+    'max_connections': int(os.getenv('LLM_MAX_CONNECTIONS', '20')),
+    'max_keepalive_connections': int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '10')),
+    'keepalive_expiry': float(os.getenv('LLM_KEEPALIVE_EXPIRY_SECONDS', '120')),
+    'connect_timeout': float(os.getenv('LLM_CONNECT_TIMEOUT_SECONDS', '5')),
+    'timeout': float(os.getenv('LLM_TIMEOUT_SECONDS', '60')),
+    'max_tokens': int(os.getenv('LLM_MAX_TOKENS', '1024')),
+}
+
+
+class LLMProviderError(RuntimeError):
+    """Ошибка вызова провайдера; ``retryable`` — имеет смысл повтор/переключение."""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None, retryable: bool = False) -> None:
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retryable = retryable
+
+
+def _history(request: LLMRequest) -> tuple[list[str], list[dict[str, str]]]:
+    """(системные вставки, реплики user/assistant) из истории SmartContext."""
+    system: list[str] = []
+    turns: list[dict[str, str]] = []
+    for message in request.history:
+        role, content = message.get("role"), message.get("content")
+        if not content:
+            continue
+        if role == "system":
+            # Сводки старых сообщений SmartContext
+            system.append(content)
+        elif role in ("user", "assistant"):
+            turns.append({"role": role, "content": content})
+    turns.append({"role": "user", "content": request.message})
+    return system, turns
+
+
+# ──────────────────────────────
+# Провайдеры
+# ──────────────────────────────
+
+class ProviderClient(abc.ABC):
+    """Долгоживущий HTTP-клиент одного провайдера."""
+
+    name = "provider"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        config: Optional[dict[str, Any]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.config = {**LLM_GATEWAY_CONFIG, **(config or {})}
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.clients_created = 0
+
+    def _headers(self) -> dict[str, str]:
+        return {}
+
+    def http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._headers(),
+                timeout=httpx.Timeout(self.config['timeout'], connect=self.config['connect_timeout']),
+                limits=httpx.Limits(
+                    max_connections=self.config['max_connections'],
+                    max_keepalive_connections=self.config['max_keepalive_connections'],
+                    keepalive_expiry=self.config['keepalive_expiry'],
+                ),
+                transport=self._transport,
+            )
+            self._loop = loop
+            self.clients_created += 1
+        return self._client
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        if client is not None and not client.is_closed:
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # клиент создан в другом (уже закрытом) event loop
+                pass
+
+    async def _post(self, path: str, payload: dict[str, Any]) -> dict[str, Any]:
+        try:
+            response = await self.http().post(path, json=payload)
+        except httpx.TimeoutException as exc:
+            raise LLMProviderError(self.name, f"timeout: {exc}", retryable=True) from exc
+        except httpx.TransportError as exc:
+            raise LLMProviderError(self.name, f"transport error: {exc}", retryable=True) from exc
+        if response.status_code >= 400:
+            retryable = response.status_code in (408, 409, 429) or response.status_code >= 500
+            raise LLMProviderError(
+                self.name, f"HTTP {response.status_code}: {response.text[:200]}",
+                status=response.status_code, retryable=retryable,
+            )
+        return response.json()
+
+    @abc.abstractmethod
+    async def complete(self, request: LLMRequest) -> str:
+        """Ответ модели на запрос."""
+
+
+class AnthropicProvider(ProviderClient):
+    """Anthropic Messages API (``POST /v1/messages``)."""
+
+    name = "anthropic"
+
+    def _headers(self) -> dict[str, str]:
+        return {"x-api-key": self.api_key, "anthropic-version": self.config['anthropic_version']}
+
+    async def complete(self, request: LLMRequest) -> str:
+        system, turns = _history(request)
+        data = await self._post("/v1/messages", {
+            "model": request.model_name,
+            "max_tokens": self.config['max_tokens'],
+            "system": "\n\n".join([request.system_prompt, *system]),
+            "messages": turns,
+        })
+        return "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+
+
+class OpenAIProvider(ProviderClient):
+    """OpenAI Chat Completions (``POST /chat/completions``)."""
+
+    name = "openai"
+
+    def _headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def complete(self, request: LLMRequest) -> str:
+        system, turns = _history(request)
+        messages = [{"role": "system", "content": text} for text in (request.system_prompt, *system)]
+        data = await self._post("/chat/completions", {
+            "model": request.model_name,
+            "max_tokens": self.config['max_tokens'],
+            "messages": messages + turns,
+        })
+        return data["choices"][0]["message"]["content"] or ""
+
+
+# ──────────────────────────────
+# Шлюз
+# ──────────────────────────────
+
+class LLMGateway:
+    """LLMClient поверх долгоживущих клиентов провайдеров."""
+
+    def __init__(self, providers: dict[str, ProviderClient], fallback: Optional[LLMClient] = None) -> None:
+        self.providers = providers
+        self.fallback = fallback
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.providers) or bool(self.fallback and self.fallback.is_configured)
+
+    async def start(self) -> None:
+        """Создать HTTP-клиенты в текущем event loop (lifespan)."""
+        for provider in self.providers.values():
+            provider.http()
+
+    async def complete(self, request: LLMRequest) -> str:
+        provider = self.providers.get(request.provider)
+        if provider is not None:
+            return await provider.complete(request)
+        if self.fallback is not None and self.fallback.is_configured:
+            return await self.fallback.complete(request)
+        raise LLMProviderError(request.provider, "provider is not configured")
+
+    async def aclose(self) -> None:
+        for provider in self.providers.values():
+            await provider.aclose()
+
+
+def build_gateway(config: Optional[dict[str, Any]] = None) -> LLMGateway:
+    """Шлюз по окружению: прямые провайдеры по ключам, остальное — через Emergent."""
+    cfg = {**LLM_GATEWAY_CONFIG, **(config or {})}
+    providers: dict[str, ProviderClient] = {}
+    if cfg['anthropic_api_key']:
+        providers["anthropic"] = AnthropicProvider(cfg['anthropic_api_key'], cfg['anthropic_base_url'], cfg)
+    if cfg['openai_api_key']:
+        providers["openai"] = OpenAIProvider(cfg['openai_api_key'], cfg['openai_base_url'], cfg)
+    fallback = EmergentLLMClient(os.getenv('EMERGENT_LLM_KEY'))
+    if providers:
+        logger.info("LLM gateway providers: %s", ", ".join(providers))
+    else:
+        logger.info(
+            "LLM gateway: no ANTHROPIC_API_KEY/OPENAI_API_KEY, every request goes through "
+            "Emergent and builds its own LlmChat (no keep-alive pool)"
+        )
+    return LLMGateway(providers, fallback=fallback)
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = build_gateway()
+    return _gateway
+
+
+async def close_gateway() -> None:
+    if _gateway is not None:
+        await _gateway.aclose()
@@ -0,0 +1,220 @@
+"""
+Маршрутизация LLM-запросов: дедлайн, failover, хеджирование
+===========================================================
+Запрос чата идёт в одного провайдера (claude-sonnet → anthropic,
+gpt-4o → openai); медленный или упавший провайдер превращается в 500
+после полного таймаута. ``LLMRouter`` оборачивает любой LLMClient
+(обычно LLMGateway) политикой:
+
+* дедлайн на весь запрос (``LLM_DEADLINE_SECONDS``) — сумма попыток не
+  выходит за него;
+* failover — при ошибке или таймауте основной модели запрос уходит
+  альтернативной (``ALTERNATE_MODELS``) в пределах остатка дедлайна.
+  Основной попытке достаётся не больше ``LLM_ATTEMPT_TIMEOUT_SECONDS`` и
+  не весь дедлайн: ``LLM_MIN_ATTEMPT_SECONDS`` оставляется альтернативной;
+* хеджирование (``LLM_HEDGE=1``) — если основной провайдер не ответил
+  за порог (p95 его недавних ответов или ``LLM_HEDGE_AFTER_SECONDS``),
+  параллельно запускается альтернативный; побеждает первый успешный
+  ответ, проигравший отменяется.
+
+Ответ сейчас не потоковый, поэтому порог хеджирования считается по
+времени полного ответа, а не первого токена.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+from services.admission import AdmissionRejected
+from services.llm import LLMClient, LLMRequest
+from services.llm_gateway import LLMProviderError
+from utils.tracing import span
+
+logger = logging.getLogger("neuroexpert.llm_router")
+
+LLM_ROUTER_CONFIG = {
+    'deadline': float(os.getenv('LLM_DEADLINE_SECONDS', '25')),
+    'failover': os.getenv('LLM_FAILOVER', '1').lower() in ('1', 'true', 'yes'),
+    'hedge': os.getenv('LLM_HEDGE', '0').lower() in ('1', 'true', 'yes'),
+    # Фиксированный порог хеджирования; без него — p95 недавних ответов модели
+    'hedge_after': float(os.getenv('LLM_HEDGE_AFTER_SECONDS')) if os.getenv('LLM_HEDGE_AFTER_SECONDS') else None,
+    'hedge_default': float(os.getenv('LLM_HEDGE_DEFAULT_SECONDS', '4')),
+    'hedge_min_samples': int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')),
+    # Меньше этого остатка дедлайна failover не запускается — не успеет;
+    # столько же основная попытка оставляет альтернативной
+    'min_attempt': float(os.getenv('LLM_MIN_ATTEMPT_SECONDS', '1')),
+    # Потолок одной попытки при доступном failover
+    'attempt_timeout': float(os.getenv('LLM_ATTEMPT_TIMEOUT_SECONDS', '15')),
+}
+
+# Модель → модель другого провайдера
+ALTERNATE_MODELS: dict[str, str] = {
+    "claude-sonnet": "gpt-4o",
+    "gpt-4o": "claude-sonnet",
+}
+
+LLM_ROUTER_EVENTS = Counter(
+    "llm_router_events_total",
+    "LLM routing decisions: failover, hedge, hedge_win, attempt_timeout, deadline",
+    labelnames=("event", "model"),
+)
+LLM_ATTEMPT_DURATION = Histogram(
+    "llm_attempt_duration_seconds",
+    "Duration of successful LLM attempts per model",
+    labelnames=("model",),
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+
+
+class LLMDeadlineExceeded(LLMProviderError):
+    """Ни одна попытка не уложилась в дедлайн запроса."""
+
+    def __init__(self, model: str, deadline: float) -> None:
+        super().__init__(model, f"deadline of {deadline:.1f}s exceeded", retryable=True)
+
+
+class LLMAttemptTimeout(LLMProviderError):
+    """Попытка исчерпала свой бюджет; остаток дедлайна — альтернативной модели."""
+
+    def __init__(self, model: str, budget: float) -> None:
+        super().__init__(model, f"attempt timeout of {budget:.1f}s exceeded", retryable=True)
+
+
+class LatencyWindow:
+    """Скользящее окно длительностей успешных ответов модели."""
+
+    def __init__(self, size: int = 200) -> None:
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class LLMRouter:
+    """LLMClient с дедлайном, failover и хеджированием поверх другого LLMClient."""
+
+    def __init__(self, client: LLMClient, config: Optional[dict] = None) -> None:
+        self.client = client
+        self.config = {**LLM_ROUTER_CONFIG, **(config or {})}
+        self.latency: dict[str, LatencyWindow] = {}
+
+    @property
+    def is_configured(self) -> bool:
+        return self.client.is_configured
+
+    def hedge_after(self, model: str) -> float:
+        if self.config['hedge_after'] is not None:
+            return self.config['hedge_after']
+        window = self.latency.get(model)
+        if window is None or len(window.samples) < self.config['hedge_min_samples']:
+            return self.config['hedge_default']
+        return window.p95()
+
+    async def complete(self, request: LLMRequest) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config['deadline']
+        alternate = ALTERNATE_MODELS.get(request.model) if self.config['failover'] or self.config['hedge'] else None
+
+        if self.config['hedge'] and alternate:
+            return await self._hedged(request, alternate, deadline)
+
+        budget = None
+        if alternate:
+            # Весь дедлайн основной попытке — и на failover по таймауту не останется
+            reserve = min(self.config['min_attempt'], self.config['deadline'] / 2)
+            budget = min(self.config['attempt_timeout'], deadline - loop.time() - reserve)
+        try:
+            return await self._attempt(request, deadline, budget)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            remaining = deadline - loop.time()
+            if not alternate or remaining <= 0:
+                raise
+            if remaining < self.config['min_attempt'] and not isinstance(exc, LLMAttemptTimeout):
+                raise
+            logger.warning("LLM %s failed (%s), failing over to %s", request.model, exc, alternate)
+            LLM_ROUTER_EVENTS.labels(event="failover", model=request.model).inc()
+            try:
+                return await self._attempt(dataclasses.replace(request, model=alternate), deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as alternate_exc:  # noqa: BLE001
+                raise _preferred_error(exc, alternate_exc) from alternate_exc
+
+    async def _attempt(self, request: LLMRequest, deadline: float, budget: Optional[float] = None) -> str:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(request.model, self.config['deadline'])
+        capped = budget is not None and budget < remaining
+        timeout = max(budget, 0.0) if capped else remaining
+        started = time.perf_counter()
+        with span(f"llm.{request.model}"):
+            try:
+                result = await asyncio.wait_for(self.client.complete(request), timeout)
+            except asyncio.TimeoutError:
+                if capped:
+                    LLM_ROUTER_EVENTS.labels(event="attempt_timeout", model=request.model).inc()
+                    raise LLMAttemptTimeout(request.model, timeout) from None
+                LLM_ROUTER_EVENTS.labels(event="deadline", model=request.model).inc()
+                raise LLMDeadlineExceeded(request.model, self.config['deadline']) from None
+        elapsed = time.perf_counter() - started
+        self.latency.setdefault(request.model, LatencyWindow()).add(elapsed)
+        LLM_ATTEMPT_DURATION.labels(model=request.model).observe(elapsed)
+        return result
+
+    async def _hedged(self, request: LLMRequest, alternate: str, deadline: float) -> str:
+        loop = asyncio.get_running_loop()
+        primary = asyncio.create_task(self._attempt(request, deadline))
+        tasks = {primary}
+        done, _ = await asyncio.wait(tasks, timeout=min(self.hedge_after(request.model), deadline - loop.time()))
+
+        if not (done and not primary.exception()):
+            # Основной медлит или уже упал — запускаем альтернативную модель
+            event = "hedge" if not done else "failover"
+            LLM_ROUTER_EVENTS.labels(event=event, model=request.model).inc()
+            tasks.add(asyncio.create_task(self._attempt(dataclasses.replace(request, model=alternate), deadline)))
+
+        errors: list[BaseException] = []
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            LLM_ROUTER_EVENTS.labels(event="hedge_win", model=alternate).inc()
+                        return task.result()
+                    errors.append(task.exception())
+        finally:
+            for task in pending:
+                task.cancel()
+        # Обе попытки упали: отдаём ошибку основной модели
+        primary_error = primary.exception() if primary.done() and not primary.cancelled() else None
+        raise _preferred_error(primary_error or errors[0], *errors)
+
+
+def _preferred_error(first: BaseException, *others: BaseException) -> BaseException:
+    """
+    Ошибка для клиента, когда упали все попытки: отказ admission control
+    (503 с Retry-After) важнее прочих — иначе перегрузка одного провайдера
+    и, например, ненастроенный второй дают 500.
+    """
+    for error in (first, *others):
+        if isinstance(error, AdmissionRejected):
+            return error
+    return first
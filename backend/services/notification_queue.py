@@ -0,0 +1,455 @@
+"""
+Очередь уведомлений Telegram
+============================
+Раньше каждая заявка и каждый лид из чата были отдельным ``sendMessage``
+на пути запроса. Telegram ограничивает частоту сообщений в один чат
+(порядка 20 в минуту для групп) и отвечает 429 с ``retry_after`` — в пик
+рекламной кампании уведомления терялись в строке лога.
+``BatchingNotifier`` отделяет уведомление от запроса:
+
+* у каждого чата свой token bucket (``TELEGRAM_RATE_PER_MINUTE``,
+  ``TELEGRAM_BURST``). Пока очередь чата пуста и токен есть, ``send``
+  отправляет уведомление сразу, на пути запроса — как раньше. Это
+  обычный случай, и он важен для Vercel: после ответа функция
+  замораживается, и фоновая задача может не выполниться никогда;
+* в очередь попадают только уведомления сверх лимита и неудачные
+  отправки. Очередь ждёт окно склейки (``TELEGRAM_COALESCE_MS``) и
+  отправляет накопившееся одним дайджестом в пределах 4096 символов;
+* 429 блокирует чат на ``retry_after`` секунд и не считается попыткой;
+  сетевые ошибки и 5xx повторяются с экспоненциальной паузой до
+  ``TELEGRAM_MAX_ATTEMPTS``. 400 и 403 (бот заблокирован или удалён из
+  чата) повтором не исправить — такие уведомления сразу уходят в
+  ``failed``.
+
+Outbox (``TELEGRAM_OUTBOX=1``, коллекция ``notification_outbox``) делает
+очередь устойчивой к перезапуску процесса и к заморозке serverless-функции:
+уведомление записывается в MongoDB при постановке в очередь и удаляется
+после доставки. Документ, который никто не доставил за
+``TELEGRAM_OUTBOX_LEASE_SECONDS``, забирает фоновый опрос любого
+процесса (``TELEGRAM_OUTBOX_POLL_SECONDS``); захват —
+``find_one_and_update``, поэтому два процесса не отправят одно и то же.
+Исчерпавшие попытки документы остаются со ``status="failed"`` для разбора.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from prometheus_client import Counter, Gauge
+
+from services.admission import TokenBucket
+from services.notifier import (
+    TELEGRAM_MAX_MESSAGE_CHARS,
+    Notifier,
+    TelegramNotifier,
+    format_digest,
+    pack_digest,
+    truncate_message,
+)
+
+logger = logging.getLogger("neuroexpert.notification_queue")
+
+NOTIFICATION_QUEUE_CONFIG = {
+    'mode': os.getenv('TELEGRAM_NOTIFY_MODE', 'batched').lower(),
+    'rate_per_minute': float(os.getenv('TELEGRAM_RATE_PER_MINUTE', '20')),
+    'burst': float(os.getenv('TELEGRAM_BURST', '3')),
+    'coalesce_window': float(os.getenv('TELEGRAM_COALESCE_MS', '2000')) / 1000,
+    'max_attempts': int(os.getenv('TELEGRAM_MAX_ATTEMPTS', '8')),
+    'retry_backoff': float(os.getenv('TELEGRAM_RETRY_SECONDS', '5')),
+    'max_retry_backoff': 600.0,
+    'outbox': os.getenv('TELEGRAM_OUTBOX', '1').lower() in ('1', 'true', 'yes'),
+    'outbox_poll': float(os.getenv('TELEGRAM_OUTBOX_POLL_SECONDS', '30')),
+    'outbox_lease': float(os.getenv('TELEGRAM_OUTBOX_LEASE_SECONDS', '120')),
+    # Сколько ждать доставки очереди при остановке; остаток доставит outbox
+    'stop_timeout': 5.0,
+    'collection': 'notification_outbox',
+}
+
+MODES = ("batched", "direct")
+
+NOTIFICATIONS_SENT = Counter(
+    "telegram_notifications_total",
+    "Telegram notifications by outcome",
+    labelnames=("outcome",),
+)
+NOTIFICATION_MESSAGES = Counter(
+    "telegram_messages_total",
+    "sendMessage calls made by the notification queue",
+    labelnames=("status",),
+)
+NOTIFICATIONS_PENDING = Gauge(
+    "telegram_notifications_pending",
+    "Notifications queued in this process",
+    multiprocess_mode="livesum",
+)
+
+
+@dataclass(slots=True)
+class _Notification:
+    text: str
+    chat_id: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    queued_at: float = 0.0
+    attempts: int = 0
+    # Записано в outbox: после доставки документ надо удалить
+    stored: bool = False
+
+
+@dataclass(slots=True)
+class _Lane:
+    """Очередь и rate limit одного чата."""
+
+    bucket: TokenBucket
+    queue: deque = field(default_factory=deque)
+    blocked_until: float = 0.0
+    # Сколько следующих уведомлений слать по одному (дайджест получил 400)
+    solo: int = 0
+    task: Optional[asyncio.Task] = None
+
+
+class BatchingNotifier:
+    """``Notifier`` с очередью по чатам, дайджестами и outbox в MongoDB."""
+
+    def __init__(
+        self,
+        sender: TelegramNotifier,
+        database: Optional[Callable[[], Any]] = None,
+        rate_per_minute: float = NOTIFICATION_QUEUE_CONFIG['rate_per_minute'],
+        burst: float = NOTIFICATION_QUEUE_CONFIG['burst'],
+        coalesce_window: float = NOTIFICATION_QUEUE_CONFIG['coalesce_window'],
+        max_chars: int = TELEGRAM_MAX_MESSAGE_CHARS,
+        max_attempts: int = NOTIFICATION_QUEUE_CONFIG['max_attempts'],
+        retry_backoff: float = NOTIFICATION_QUEUE_CONFIG['retry_backoff'],
+        max_retry_backoff: float = NOTIFICATION_QUEUE_CONFIG['max_retry_backoff'],
+        outbox_poll: float = NOTIFICATION_QUEUE_CONFIG['outbox_poll'],
+        outbox_lease: float = NOTIFICATION_QUEUE_CONFIG['outbox_lease'],
+        stop_timeout: float = NOTIFICATION_QUEUE_CONFIG['stop_timeout'],
+        collection: str = NOTIFICATION_QUEUE_CONFIG['collection'],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.sender = sender
+        self.database = database
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.coalesce_window = coalesce_window
+        self.max_chars = max_chars
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.outbox_poll = outbox_poll
+        self.outbox_lease = outbox_lease
+        self.stop_timeout = stop_timeout
+        self.collection = collection
+        self.clock = clock
+        self._lanes: dict[str, _Lane] = {}
+        # id уведомлений в очередях этого процесса — опрос outbox их пропускает
+        self._queued: set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._closing = False
+        self.digests = 0
+
+    @property
+    def is_configured(self) -> bool:
+        return self.sender.is_configured
+
+    # ──────────────────────────────
+    # Приём
+    # ──────────────────────────────
+
+    async def send(self, text: str) -> None:
+        if not self.sender.is_configured:
+            logger.debug("Skipping Telegram notification: not configured")
+            return
+        item = _Notification(truncate_message(text, self.max_chars), str(self.sender.chat_id))
+        self._ensure_started()
+        lane = self._lane(item.chat_id)
+        if not lane.queue and lane.blocked_until <= self.clock() and lane.bucket.take() == 0:
+            await self._send_now(lane, item)
+            return
+        item.stored = await self._outbox_insert(item)
+        self._enqueue(item)
+
+    async def _send_now(self, lane: _Lane, item: _Notification) -> None:
+        """Отправить сразу; в outbox и очередь — только если не вышло."""
+        item.queued_at = self.clock()
+        self._queued.add(item.id)
+        NOTIFICATIONS_PENDING.inc()
+        await self._deliver(lane, [item])
+        if item.id in self._queued:
+            # 429 или временный сбой: _deliver вернул уведомление в очередь
+            item.stored = await self._outbox_insert(item)
+            self._kick(lane, item.chat_id)
+
+    def _enqueue(self, item: _Notification) -> None:
+        item.queued_at = self.clock()
+        lane = self._lane(item.chat_id)
+        lane.queue.append(item)
+        self._queued.add(item.id)
+        NOTIFICATIONS_PENDING.inc()
+        self._kick(lane, item.chat_id)
+
+    def _kick(self, lane: _Lane, chat_id: str) -> None:
+        if lane.queue and (lane.task is None or lane.task.done()):
+            lane.task = self._loop.create_task(self._drain(lane), name=f"telegram-lane-{chat_id}")
+
+    def _lane(self, chat_id: str) -> _Lane:
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = _Lane(TokenBucket(self.rate, self.burst, self.clock))
+        return lane
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (serverless-рантайм пересоздал его): задачи
+            # старого не работают, очереди дренируются заново
+            self._loop = loop
+            self._poller = None
+            for lane in self._lanes.values():
+                lane.task = loop.create_task(self._drain(lane)) if lane.queue else None
+        if self.database is not None and (self._poller is None or self._poller.done()):
+            self._poller = loop.create_task(self._poll_outbox(), name="telegram-outbox-poller")
+
+    # ──────────────────────────────
+    # Отправка
+    # ──────────────────────────────
+
+    async def _drain(self, lane: _Lane) -> None:
+        while lane.queue:
+            now = self.clock()
+            wait = lane.blocked_until - now
+            if not self._closing:
+                # окно склейки от самого старого уведомления
+                wait = max(wait, lane.queue[0].queued_at + self.coalesce_window - now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            wait = lane.bucket.take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if lane.solo:
+                count, lane.solo = 1, lane.solo - 1
+            else:
+                count = pack_digest([item.text for item in lane.queue], self.max_chars)
+            batch = [lane.queue.popleft() for _ in range(count)]
+            await self._deliver(lane, batch)
+
+    async def _deliver(self, lane: _Lane, batch: list[_Notification]) -> None:
+        result = await self.sender.deliver(format_digest([item.text for item in batch]), batch[0].chat_id)
+        NOTIFICATION_MESSAGES.labels(status=str(result.status)).inc()
+        if result.ok:
+            self.digests += 1
+            self._forget(batch, "sent")
+            await self._outbox_delete(batch)
+            return
+
+        if result.status == 429 and result.retry_after > 0:
+            # Не попытка: Telegram просит подождать — ждём и шлём тем же дайджестом
+            logger.warning("Telegram rate limit for chat %s, retry after %ss", batch[0].chat_id, result.retry_after)
+            lane.blocked_until = self.clock() + result.retry_after
+            lane.queue.extendleft(reversed(batch))
+            await self._outbox_extend(batch, result.retry_after)
+            return
+
+        if result.status == 400 and len(batch) > 1:
+            # Один текст испортил дайджест — не хороним из-за него остальные
+            lane.solo = len(batch)
+            lane.queue.extendleft(reversed(batch))
+            return
+
+        retry: list[_Notification] = []
+        dead: list[_Notification] = []
+        for item in batch:
+            item.attempts += 1
+            (dead if result.permanent or item.attempts >= self.max_attempts else retry).append(item)
+        if dead:
+            logger.error(
+                "Telegram notification failed permanently (%s items): status=%s response=%s",
+                len(dead), result.status, result.description,
+            )
+            self._forget(dead, "failed")
+            await self._outbox_fail(dead, result.description)
+        if retry:
+            backoff = min(self.retry_backoff * 2 ** (retry[0].attempts - 1), self.max_retry_backoff)
+            logger.warning(
+                "Telegram notification failed: status=%s response=%s, retry in %.0fs",
+                result.status, result.description, backoff,
+            )
+            lane.blocked_until = self.clock() + backoff
+            lane.queue.extendleft(reversed(retry))
+            await self._outbox_extend(retry, backoff)
+
+    def _forget(self, batch: list[_Notification], outcome: str) -> None:
+        for item in batch:
+            self._queued.discard(item.id)
+        NOTIFICATIONS_PENDING.dec(len(batch))
+        NOTIFICATIONS_SENT.labels(outcome=outcome).inc(len(batch))
+
+    def start(self) -> None:
+        """Запустить опрос outbox: уведомления, оставшиеся от прошлых процессов."""
+        self._ensure_started()
+
+    async def stop(self) -> None:
+        """Доставить очередь без окна склейки; недоставленное остаётся в outbox."""
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        tasks = [lane.task for lane in self._lanes.values() if lane.task is not None and not lane.task.done()]
+        if tasks:
+            self._closing = True
+            try:
+                await asyncio.wait(tasks, timeout=self.stop_timeout)
+            finally:
+                self._closing = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        leftover = [item for lane in self._lanes.values() for item in lane.queue]
+        for lane in self._lanes.values():
+            lane.queue.clear()
+            lane.task = None
+        if leftover:
+            logger.warning("%s Telegram notifications left undelivered at shutdown", len(leftover))
+            self._forget(leftover, "deferred")
+            # следующий процесс подхватит их сразу, не дожидаясь аренды
+            await self._outbox_extend(leftover, -self.outbox_lease)
+
+    # ──────────────────────────────
+    # Outbox
+    # ──────────────────────────────
+
+    def _outbox(self) -> Any:
+        return self.database()[self.collection]
+
+    async def _outbox_insert(self, item: _Notification) -> bool:
+        if self.database is None:
+            return False
+        now = datetime.utcnow()
+        try:
+            await self._outbox().insert_one({
+                "_id": item.id,
+                "chat_id": item.chat_id,
+                "text": item.text,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now,
+                # аренда: пока этот процесс держит уведомление в очереди,
+                # опрос других процессов его не забирает
+                "next_attempt_at": now + timedelta(seconds=self.outbox_lease),
+            })
+            return True
+        except Exception as exc:  # noqa: BLE001
+            # Уведомление всё равно уйдёт из памяти этого процесса
+            logger.warning("Notification outbox unavailable: %s", exc)
+            return False
+
+    async def _outbox_delete(self, batch: list[_Notification]) -> None:
+        ids = [item.id for item in batch if item.stored]
+        if not ids:
+            return
+        try:
+            await self._outbox().delete_many({"_id": {"$in": ids}})
+        except Exception as exc:  # noqa: BLE001
+            # Документы вернутся после аренды и уйдут повторно — лучше, чем потерять
+            logger.warning("Notification outbox cleanup failed: %s", exc)
+
+    async def _outbox_extend(self, batch: list[_Notification], delay: float) -> None:
+        stored = [item for item in batch if item.stored]
+        if not stored:
+            return
+        next_attempt = datetime.utcnow() + timedelta(seconds=delay + self.outbox_lease)
+        try:
+            for item in stored:
+                await self._outbox().update_one(
+                    {"_id": item.id},
+                    {"$set": {"attempts": item.attempts, "next_attempt_at": next_attempt}},
+                )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Notification outbox update failed: %s", exc)
+
+    async def _outbox_fail(self, batch: list[_Notification], error: str) -> None:
+        ids = [item.id for item in batch if item.stored]
+        if not ids:
+            return
+        try:
+            await self._outbox().update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {"status": "failed", "error": error, "failed_at": datetime.utcnow()}},
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Notification outbox update failed: %s", exc)
+
+    async def claim_outbox(self, limit: int = 100) -> int:
+        """Забрать просроченные документы outbox в очереди этого процесса."""
+        from pymongo import ReturnDocument
+
+        self._ensure_started()
+        claimed = 0
+        while claimed < limit:
+            now = datetime.utcnow()
+            document = await self._outbox().find_one_and_update(
+                {
+                    "status": "pending",
+                    "next_attempt_at": {"$lte": now},
+                    "_id": {"$nin": list(self._queued)},
+                },
+                {"$set": {"next_attempt_at": now + timedelta(seconds=self.outbox_lease)}},
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if document is None:
+                break
+            item = _Notification(
+                document["text"], str(document["chat_id"]), id=document["_id"],
+                attempts=document.get("attempts", 0), stored=True,
+            )
+            self._enqueue(item)
+            claimed += 1
+        if claimed:
+            logger.info("Claimed %s notifications from outbox", claimed)
+        return claimed
+
+    async def _poll_outbox(self) -> None:
+        await self.ensure_indexes()
+        while True:
+            try:
+                await self.claim_outbox()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Notification outbox poll failed: %s", exc)
+            await asyncio.sleep(self.outbox_poll)
+
+    async def ensure_indexes(self) -> None:
+        if self.database is None:
+            return
+        try:
+            await self._outbox().create_index(
+                [("status", 1), ("next_attempt_at", 1)],
+                name="status_next_attempt_idx",
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Notification outbox index creation failed: %s", exc)
+
+
+def build_notifier(database: Optional[Callable[[], Any]] = None) -> Notifier:
+    """Notifier из окружения: ``BatchingNotifier`` или прямой ``TelegramNotifier``."""
+    sender = TelegramNotifier.from_env()
+    mode = NOTIFICATION_QUEUE_CONFIG['mode']
+    if mode not in MODES:
+        logger.warning("Unknown TELEGRAM_NOTIFY_MODE=%s, using batched", mode)
+    if mode == "direct" or not sender.is_configured:
+        return sender
+    outbox = database if NOTIFICATION_QUEUE_CONFIG['outbox'] else None
+    return BatchingNotifier(sender, outbox)
@@ -0,0 +1,198 @@
+"""
+Уведомления о заявках и лидах
+=============================
+Один отправитель Telegram для обеих точек входа (server.py и Vercel).
+Ошибки отправки не пробрасываются: уведомление не должно ронять
+сохранённую заявку. ``TelegramNotifier.deliver`` возвращает результат
+запроса (в том числе ``retry_after`` из ответа 429) — на нём построены
+пачки, rate limit и outbox в ``services.notification_queue``.
+"""
+
+from __future__ import annotations
+
+import html
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Optional, Protocol, Sequence
+
+
+logger = logging.getLogger("neuroexpert.notifier")
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+# Предел sendMessage; Telegram считает в UTF-16 code units
+TELEGRAM_MAX_MESSAGE_CHARS = 4096
+
+
+class Notifier(Protocol):
+    async def send(self, text: str) -> None: ...
+
+
+@dataclass(slots=True)
+class DeliveryResult:
+    """Ответ Telegram на один sendMessage."""
+
+    ok: bool
+    status: int = 0
+    # 429 Too Many Requests: сколько секунд нельзя писать в чат
+    retry_after: float = 0.0
+    description: str = ""
+
+    @property
+    def permanent(self) -> bool:
+        """
+        400 (разметка, длина, чат) и 403 (бот заблокирован или исключён из
+        чата) — повтор того же текста не поможет.
+        """
+        return self.status in (400, 403)
+
+
+class TelegramNotifier:
+    """``sendMessage`` в чат менеджеров (parse_mode=HTML)."""
+
+    def __init__(
+        self,
+        token: Optional[str],
+        chat_id: Optional[str],
+        timeout: float = 10.0,
+        api_url: str = TELEGRAM_API_URL,
+    ) -> None:
+        self.token = token
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self.api_url = api_url.rstrip("/")
+
+    @classmethod
+    def from_env(cls) -> "TelegramNotifier":
+        return cls(
+            os.getenv("TELEGRAM_BOT_TOKEN"),
+            os.getenv("TELEGRAM_CHAT_ID"),
+            api_url=os.getenv("TELEGRAM_API_URL", TELEGRAM_API_URL),
+        )
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    async def send(self, text: str) -> None:
+        if not self.is_configured:
+            logger.debug("Skipping Telegram notification: not configured")
+            return
+        result = await self.deliver(text)
+        if not result.ok:
+            logger.error("Telegram notification failed: status=%s response=%s", result.status, result.description)
+
+    async def deliver(self, text: str, chat_id: Optional[str] = None) -> DeliveryResult:
+        """Один sendMessage; сетевые ошибки — ``ok=False`` со статусом 0."""
+        import aiohttp
+
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    url,
+                    json={"chat_id": chat_id or self.chat_id, "text": text, "parse_mode": "HTML"},
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                ) as response:
+                    if response.status == 200:
+                        return DeliveryResult(True, 200)
+                    body = await response.text()
+                    return DeliveryResult(False, response.status, _retry_after(body), body[:500])
+        except Exception as exc:  # noqa: BLE001
+            return DeliveryResult(False, 0, 0.0, f"{type(exc).__name__}: {exc}")
+
+
+def _retry_after(body: str) -> float:
+    """``parameters.retry_after`` из JSON-ответа Telegram."""
+    import json
+
+    try:
+        payload = json.loads(body)
+        return float((payload.get("parameters") or {}).get("retry_after") or 0)
+    except (ValueError, TypeError, AttributeError):
+        return 0.0
+
+
+# ──────────────────────────────
+# Тексты уведомлений
+# ──────────────────────────────
+
+def _e(value: Any) -> str:
+    """Пользовательский ввод в HTML-сообщении Telegram."""
+    return html.escape(str(value), quote=False)
+
+
+def format_contact_message(name: str, contact: str, service: str, message: Optional[str]) -> str:
+    return (
+        "<b>🎯 Новая заявка NeuroExpert!</b>\n\n"
+        f"<b>Имя:</b> {_e(name)}\n"
+        f"<b>Контакт:</b> {_e(contact)}\n"
+        f"<b>Услуга:</b> {_e(service)}\n"
+        f"<b>Сообщение:</b> {_e(message or 'Не указано')}\n"
+    )
+
+
+def format_chat_lead_message(model: str, user_data: dict[str, Any], message: str) -> str:
+    return (
+        "<b>💬 Лид из AI-чата!</b>\n\n"
+        f"<b>Модель:</b> {_e(model)}\n"
+        f"<b>Имя:</b> {_e(user_data.get('name', 'Не указано'))}\n"
+        f"<b>Контакт:</b> {_e(user_data.get('contact'))}\n"
+        f"<b>Сообщение:</b> {_e(message)}\n"
+    )
+
+
+# ──────────────────────────────
+# Дайджест
+# ──────────────────────────────
+
+_DIGEST_SEPARATOR = "\n➖➖➖\n\n"
+_PARTIAL_ENTITY_RE = re.compile(r"&[#\w]*$")
+
+
+def message_length(text: str) -> int:
+    """Длина в единицах, которыми Telegram меряет предел (UTF-16)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def truncate_message(text: str, limit: int = TELEGRAM_MAX_MESSAGE_CHARS) -> str:
+    """
+    Укоротить сообщение до ``limit``: целыми строками (теги в наших шаблонах
+    не переходят через перенос), последняя строка — без тегов и без
+    обрезанной HTML-сущности.
+    """
+    if message_length(text) <= limit:
+        return text
+    budget = limit - 1
+    kept: list[str] = []
+    used = 0
+    for line in text.split("\n"):
+        size = message_length(line) + 1
+        if used + size > budget:
+            tail = html.escape(html.unescape(re.sub(r"<[^>]*>", "", line)), quote=False)
+            tail = tail[:max(budget - used, 0)]
+            while tail and used + message_length(tail) > budget:
+                # символы вне BMP занимают две единицы UTF-16
+                tail = tail[:-1]
+            tail = _PARTIAL_ENTITY_RE.sub("", tail)
+            kept.append(tail)
+            break
+        kept.append(line)
+        used += size
+    return "\n".join(kept).rstrip() + "…"
+
+
+def format_digest(texts: Sequence[str]) -> str:
+    """Несколько уведомлений одним сообщением."""
+    if len(texts) == 1:
+        return texts[0]
+    return f"<b>📦 Уведомлений: {len(texts)}</b>\n\n" + _DIGEST_SEPARATOR.join(text.rstrip("\n") for text in texts)
+
+
+def pack_digest(texts: Sequence[str], limit: int = TELEGRAM_MAX_MESSAGE_CHARS) -> int:
+    """Сколько первых текстов помещается в один дайджест (минимум один)."""
+    count = 1
+    while count < len(texts) and message_length(format_digest(texts[:count + 1])) <= limit:
+        count += 1
+    return count
@@ -0,0 +1,321 @@
+"""
+Кэш ответов на первые вопросы сессии
+====================================
+Большая часть трафика ``/api/chat`` — первые вопросы вида «сколько стоит
+сайт» или «что входит в аудит»: истории нет, системный промпт тот же, а
+каждый вопрос стоит полного вызова LLM. ``ChatResponseCache`` реализует
+хук ``ResponseCache`` ChatService:
+
+* работает только для сессий с пустым (или почти пустым —
+  ``RESPONSE_CACHE_MAX_HISTORY``) контекстом SmartContext;
+* ключ — нормализованное сообщение (``utils.intent_cache.normalize_key``),
+  модель и версия конфигурации (хэш системного промпта, собранного из
+  services.json);
+* near-duplicate (``RESPONSE_CACHE_NEAR_DUPLICATES=1``, по умолчанию
+  выключен) — MinHash по символьным 3-граммам с LSH-бакетами: «сколько
+  стоит сайт?» и «а сколько стоит сайт» находят один ответ. Числа в
+  вопросах должны совпадать точно: «сайт за 50 тысяч» и «за 500 тысяч»
+  близки по 3-граммам (0.88), но это разные вопросы;
+* сообщения с контактами (телефон, e-mail, @ник) или именем («меня
+  зовут …»), как и запросы с ``user_data``, не кэшируются и не ищутся —
+  это разговор с конкретным человеком;
+* TTL (``RESPONSE_CACHE_TTL``) и явный сброс при перезагрузке services.json
+  (``ConfigLoader.add_invalidation_listener``);
+* доля попаданий — ``stats()`` и Prometheus
+  ``chat_response_cache_lookups_total``.
+
+Кэш живёт в процессе: у каждого воркера свой набор популярных ответов.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import cachetools
+from prometheus_client import Counter
+
+from services.chat_service import ChatRequest
+from services.llm import resolve_model
+from services.prompts import build_system_prompt
+from utils.intent_cache import normalize_key
+
+logger = logging.getLogger("neuroexpert.response_cache")
+
+RESPONSE_CACHE_CONFIG = {
+    'enabled': os.getenv('RESPONSE_CACHE', '1').lower() in ('1', 'true', 'yes'),
+    'maxsize': int(os.getenv('RESPONSE_CACHE_MAXSIZE', '512')),
+    'ttl': float(os.getenv('RESPONSE_CACHE_TTL', '3600')),
+    # Сколько сообщений истории допускается (0 — только первый вопрос сессии)
+    'max_history': int(os.getenv('RESPONSE_CACHE_MAX_HISTORY', '0')),
+    'near_duplicates': os.getenv('RESPONSE_CACHE_NEAR_DUPLICATES', '0').lower() in ('1', 'true', 'yes'),
+    # Оценка Jaccard по MinHash, начиная с которой вопрос считается тем же
+    'similarity': float(os.getenv('RESPONSE_CACHE_SIMILARITY', '0.8')),
+    'bands': 8,
+    'rows': 4,
+}
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "chat_response_cache_lookups_total",
+    "Chat response cache lookups: hit, near_hit, miss, skipped (has history or personal data)",
+    labelnames=("outcome",),
+)
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+# Контакты и представления: такой ответ адресован конкретному человеку
+_PERSONAL_RE = re.compile(
+    r"[\w.+-]+@[\w-]+\.\w+"  # e-mail
+    r"|(?<![\w@])@\w{4,}"  # ник в Telegram
+    r"|\+?\d[\d\s()\-]{8,}\d"  # телефон
+    r"|\b(?:меня\s+зовут|зовут\s+меня|мое\s+имя|my\s+name\s+is|i\s+am\s+[A-Z])",
+    re.IGNORECASE,
+)
+
+
+def _numbers(message: str) -> tuple[str, ...]:
+    """Числа вопроса: у near-duplicate они должны совпасть точно."""
+    return tuple(_NUMBER_RE.findall(unicodedata.normalize("NFKC", message)))
+
+
+def _personal(request: ChatRequest) -> bool:
+    if request.user_data:
+        return True
+    return _PERSONAL_RE.search(unicodedata.normalize("NFKC", request.message).replace("ё", "е")) is not None
+
+
+# a·h + b < 2**62 для h, a, b < 2**31 — без переполнения uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+# ──────────────────────────────
+# MinHash
+# ──────────────────────────────
+
+def _shingles(text: str, size: int = 3) -> set[str]:
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+def _stable_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class MinHasher:
+    """MinHash-подпись множества символьных n-грамм (numpy импортируется лениво)."""
+
+    def __init__(self, num_perm: int, seed: int = 1) -> None:
+        self.num_perm = num_perm
+        self.seed = seed
+        self._params: Any = None
+
+    def _permutations(self) -> tuple[Any, Any]:
+        if self._params is None:
+            import numpy as np
+
+            a = [_stable_hash(f"a:{self.seed}:{i}") % (_MERSENNE_PRIME - 1) + 1 for i in range(self.num_perm)]
+            b = [_stable_hash(f"b:{self.seed}:{i}") % _MERSENNE_PRIME for i in range(self.num_perm)]
+            self._params = (np.array(a, dtype=np.uint64)[:, None], np.array(b, dtype=np.uint64)[:, None])
+        return self._params
+
+    def signature(self, text: str) -> tuple[int, ...]:
+        import numpy as np
+
+        a, b = self._permutations()
+        hashes = np.array([_stable_hash(shingle) % _MERSENNE_PRIME for shingle in _shingles(text)], dtype=np.uint64)
+        return tuple(((a * hashes + b) % _MERSENNE_PRIME).min(axis=1).tolist())
+
+    @staticmethod
+    def similarity(left: tuple[int, ...], right: tuple[int, ...]) -> float:
+        """Оценка коэффициента Jaccard по доле совпавших минимумов."""
+        return sum(x == y for x, y in zip(left, right)) / len(left)
+
+
+@dataclass(slots=True, frozen=True)
+class _Entry:
+    response: str
+    signature: Optional[tuple[int, ...]]
+    numbers: tuple[str, ...] = ()
+
+
+# ──────────────────────────────
+# Кэш
+# ──────────────────────────────
+
+class ChatResponseCache:
+    """Кэш ответов LLM на первые вопросы сессии (``ResponseCache`` ChatService)."""
+
+    def __init__(
+        self,
+        config: Any = None,
+        maxsize: int = RESPONSE_CACHE_CONFIG['maxsize'],
+        ttl: float = RESPONSE_CACHE_CONFIG['ttl'],
+        max_history: int = RESPONSE_CACHE_CONFIG['max_history'],
+        near_duplicates: bool = RESPONSE_CACHE_CONFIG['near_duplicates'],
+        similarity: float = RESPONSE_CACHE_CONFIG['similarity'],
+        bands: int = RESPONSE_CACHE_CONFIG['bands'],
+        rows: int = RESPONSE_CACHE_CONFIG['rows'],
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.config = config
+        self.max_history = max_history
+        self.similarity = similarity
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows) if near_duplicates else None
+        self._entries: cachetools.TTLCache = cachetools.TTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        # LSH: (область, номер бакета, полоса подписи) → ключи записей
+        self._buckets: dict[tuple[str, int, tuple[int, ...]], set[str]] = {}
+        self._prompt: Optional[str] = None
+        self._version = ""
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    # ──────────────────────────────
+    # Хук ResponseCache
+    # ──────────────────────────────
+
+    async def lookup(self, request: ChatRequest, history: list[dict[str, Any]]) -> Optional[str]:
+        if not self._eligible(history) or _personal(request):
+            self._count("skipped")
+            return None
+
+        scope = self._scope(request)
+        text = normalize_key(request.message)
+        entry = self._entries.get(f"{scope}|{text}")
+        if entry is not None:
+            self._count("hit")
+            return entry.response
+
+        if self.hasher is not None and (
+            response := self._near_duplicate(scope, text, _numbers(request.message))
+        ) is not None:
+            self._count("near_hit")
+            return response
+
+        self._count("miss")
+        return None
+
+    async def store(self, request: ChatRequest, history: list[dict[str, Any]], response: str) -> None:
+        if not response or not self._eligible(history) or _personal(request):
+            return
+        scope = self._scope(request)
+        text = normalize_key(request.message)
+        key = f"{scope}|{text}"
+        signature = self.hasher.signature(text) if self.hasher is not None and not text.startswith("h:") else None
+        self._entries[key] = _Entry(response, signature, _numbers(request.message))
+        if signature is not None:
+            for bucket in self._bucket_keys(scope, signature):
+                self._buckets.setdefault(bucket, set()).add(key)
+            if len(self._buckets) > 4 * self.bands * self._entries.maxsize:
+                self._rebuild_buckets()
+
+    def clear(self) -> None:
+        """Сбросить все ответы (services.json перезагружен)."""
+        self._entries.clear()
+        self._buckets.clear()
+        self._prompt = None
+        logger.info("Chat response cache cleared")
+
+    # ──────────────────────────────
+    # Метрики
+    # ──────────────────────────────
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_ratio": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+    def _count(self, outcome: str) -> None:
+        if outcome == "hit":
+            self.hits += 1
+        elif outcome == "near_hit":
+            self.near_hits += 1
+        elif outcome == "miss":
+            self.misses += 1
+        else:
+            self.skipped += 1
+        RESPONSE_CACHE_LOOKUPS.labels(outcome=outcome).inc()
+
+    # ──────────────────────────────
+    # Ключи
+    # ──────────────────────────────
+
+    def _eligible(self, history: list[dict[str, Any]]) -> bool:
+        return len(history) <= self.max_history
+
+    def config_version(self) -> str:
+        """Хэш системного промпта: меняется вместе с services.json."""
+        prompt = build_system_prompt(self.config)
+        if prompt is not self._prompt:
+            self._prompt = prompt
+            self._version = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+        return self._version
+
+    def _scope(self, request: ChatRequest) -> str:
+        model_key, _, _ = resolve_model(request.model)
+        return f"{self.config_version()}:{model_key}"
+
+    def _bucket_keys(self, scope: str, signature: tuple[int, ...]) -> list[tuple[str, int, tuple[int, ...]]]:
+        return [
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _near_duplicate(self, scope: str, text: str, numbers: tuple[str, ...]) -> Optional[str]:
+        if text.startswith("h:"):
+            return None
+        signature = self.hasher.signature(text)
+        best: Optional[_Entry] = None
+        best_score = self.similarity
+        for bucket in self._bucket_keys(scope, signature):
+            keys = self._buckets.get(bucket)
+            if not keys:
+                continue
+            for key in list(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    # запись истекла или вытеснена
+                    keys.discard(key)
+                    continue
+                if entry.numbers != numbers:
+                    continue
+                score = MinHasher.similarity(signature, entry.signature)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if not keys:
+                del self._buckets[bucket]
+        return best.response if best is not None else None
+
+    def _rebuild_buckets(self) -> None:
+        self._buckets.clear()
+        for key, entry in list(self._entries.items()):
+            if entry.signature is not None:
+                scope = key.split("|", 1)[0]
+                for bucket in self._bucket_keys(scope, entry.signature):
+                    self._buckets.setdefault(bucket, set()).add(key)
+
+
+def build_response_cache(config: Any = None) -> Optional[ChatResponseCache]:
+    """Кэш ответов (или None при RESPONSE_CACHE=0), сбрасываемый при перезагрузке services.json."""
+    if not RESPONSE_CACHE_CONFIG['enabled']:
+        return None
+    cache = ChatResponseCache(config)
+    if config is not None and hasattr(config, "add_invalidation_listener"):
+        config.add_invalidation_listener(cache.clear)
+    return cache
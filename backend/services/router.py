@@ -0,0 +1,94 @@
+"""
+HTTP-слой ChatService
+=====================
+Общий APIRouter для backend/server.py и frontend/api/routes.py: модели
+запросов и отображение ошибок ChatService в HTTP-статусы.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+
+from services.chat_service import ChatRequest, ChatService, ContactRequest, ServiceUnavailableError
+from services.idempotency import IdempotencyConflictError
+from services.llm import DEFAULT_MODEL
+
+logger = logging.getLogger("neuroexpert.routes")
+
+
+def _unavailable(exc: ServiceUnavailableError) -> HTTPException:
+    headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))} if exc.retry_after else None
+    return HTTPException(status_code=exc.status_code, detail=str(exc), headers=headers)
+
+
+class ContactForm(BaseModel):
+    name: str
+    contact: str
+    service: str
+    message: Optional[str] = ""
+
+
+class ChatMessage(BaseModel):
+    session_id: str
+    message: str
+    model: Optional[str] = DEFAULT_MODEL  # claude-sonnet, gpt-4o
+    user_data: Optional[Dict[str, Any]] = None
+
+
+class ChatResponse(BaseModel):
+    response: str
+    session_id: str
+
+
+def create_router(get_service: Callable[[], ChatService], prefix: str = "/api") -> APIRouter:
+    """
+    Роутер ``/``, ``/contact`` и ``/chat`` поверх ChatService.
+
+    ``get_service`` вызывается на каждый запрос — точка входа сама решает,
+    когда собирать сервис (лениво на Vercel, при импорте в server.py).
+    """
+    router = APIRouter(prefix=prefix)
+
+    @router.get("/")
+    async def root() -> Dict[str, str]:
+        return {"message": "NeuroExpert API", "status": "healthy"}
+
+    @router.post("/contact")
+    async def submit_contact_form(
+        form_data: ContactForm,
+        idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
+    ) -> Dict[str, Any]:
+        try:
+            return await get_service().submit_contact(ContactRequest(**form_data.model_dump()), idempotency_key)
+        except ServiceUnavailableError as exc:
+            raise _unavailable(exc)
+        except IdempotencyConflictError as exc:
+            raise HTTPException(status_code=exc.status_code, detail=str(exc))
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Contact form error: %s", exc)
+            raise HTTPException(status_code=500, detail="Ошибка отправки заявки")
+
+    @router.post("/chat", response_model=ChatResponse)
+    async def chat_with_ai(chat_request: ChatMessage) -> ChatResponse:
+        try:
+            reply = await get_service().chat(
+                ChatRequest(
+                    session_id=chat_request.session_id,
+                    message=chat_request.message,
+                    model=chat_request.model,
+                    user_data=chat_request.user_data,
+                )
+            )
+        except ServiceUnavailableError as exc:
+            raise _unavailable(exc)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("AI chat error: %s", exc)
+            raise HTTPException(status_code=500, detail="Ошибка обработки сообщения")
+        return ChatResponse(response=reply.response, session_id=reply.session_id)
+
+    return router
@@ -0,0 +1,312 @@
+"""
+Упорядочивание ходов одной сессии чата
+======================================
+Два быстрых сообщения одной сессии без упорядочивания читают один и тот
+же снимок истории, оба идут в LLM и оба пишутся в БД — каждый ответ не
+знает о соседнем ходе. ``SessionSequencer`` выстраивает ходы сессии в
+очередь:
+
+* ``KeyedLock`` — asyncio.Lock на session_id внутри процесса (записи
+  удаляются, когда ход никто не держит и не ждёт);
+* ``RedisLease`` — аренда ``SET NX PX`` с токеном владельца для
+  нескольких воркеров; освобождение — сравнение токена в Lua-скрипте,
+  TTL страхует от упавшего воркера. Пока ход идёт, аренда продлевается;
+  при недоступном Redis ход идёт под локальной блокировкой (как до
+  аренды, когда Redis был только кэшем). С буферизованной записью
+  (``CHAT_WRITE_MODE=buffered``) аренда освобождается, когда запись хода
+  дошла до MongoDB — следующий ход на другом воркере видит её в истории;
+* коалесцинг (``SESSION_COALESCE=1``) — сообщения, пришедшие, пока ход
+  сессии ждёт очереди, объединяются в один вызов LLM; все вызывающие
+  получают один ответ. Работает в пределах процесса.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from prometheus_client import Counter, Histogram
+
+from services.chat_service import ServiceUnavailableError
+
+logger = logging.getLogger("neuroexpert.session_lock")
+
+SESSION_LOCK_CONFIG = {
+    'redis_url': os.getenv('SESSION_LOCK_REDIS_URL') or os.getenv('REDIS_URL'),
+    # TTL аренды больше дедлайна LLM (LLM_DEADLINE_SECONDS) с запасом на запись в БД;
+    # пока ход идёт, аренда продлевается каждую треть TTL
+    'lease_ttl': float(os.getenv('SESSION_LEASE_TTL_SECONDS', '40')),
+    'wait_timeout': float(os.getenv('SESSION_LOCK_TIMEOUT_SECONDS', '45')),
+    'retry_interval': float(os.getenv('SESSION_LEASE_RETRY_MS', '50')) / 1000,
+    # Таймауты клиента аренды — секунды, а не миллисекунды кэша намерений:
+    # ошибка Redis переводит ход на локальную блокировку без связи с воркерами
+    'redis_timeout': float(os.getenv('SESSION_LOCK_REDIS_TIMEOUT_SECONDS', '2')),
+    'redis_connect_timeout': float(os.getenv('SESSION_LOCK_REDIS_CONNECT_TIMEOUT_SECONDS', '5')),
+    'coalesce': os.getenv('SESSION_COALESCE', '0').lower() in ('1', 'true', 'yes'),
+    'coalesce_window': float(os.getenv('SESSION_COALESCE_WINDOW_MS', '0')) / 1000,
+    'namespace': 'chat:session-lease',
+}
+
+SESSION_LOCK_WAIT = Histogram(
+    "chat_session_lock_wait_seconds",
+    "Time a chat turn waited for its session's previous turn",
+    buckets=(0.001, 0.01, 0.05, 0.25, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+SESSION_COALESCED = Counter(
+    "chat_session_coalesced_messages_total",
+    "User messages merged into another turn's LLM call",
+)
+SESSION_LEASE_ERRORS = Counter(
+    "chat_session_lease_errors_total",
+    "Redis errors while taking or renewing a session lease",
+    labelnames=("operation",),
+)
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SessionBusyError(ServiceUnavailableError):
+    """Предыдущий ход сессии не освободил очередь за ``wait_timeout`` (HTTP 503)."""
+
+    def __init__(self, session_id: str) -> None:
+        super().__init__("Previous message is still being processed, please retry", retry_after=1)
+        self.session_id = session_id
+
+
+class KeyedLock:
+    """asyncio.Lock на ключ; неиспользуемые записи удаляются."""
+
+    def __init__(self) -> None:
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    async def acquire(self, key: str) -> None:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._drop(key)
+            raise
+
+    def release(self, key: str) -> None:
+        self._locks[key][0].release()
+        self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        lock, users = self._locks[key]
+        if users <= 1:
+            del self._locks[key]
+        else:
+            self._locks[key] = (lock, users - 1)
+
+
+class RedisLease:
+    """Межпроцессная аренда сессии в Redis."""
+
+    def __init__(
+        self,
+        redis: Any,
+        ttl: float = SESSION_LOCK_CONFIG['lease_ttl'],
+        retry_interval: float = SESSION_LOCK_CONFIG['retry_interval'],
+        namespace: str = SESSION_LOCK_CONFIG['namespace'],
+    ) -> None:
+        self.redis = redis
+        self.ttl_ms = int(ttl * 1000)
+        self.retry_interval = retry_interval
+        self.namespace = namespace
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.namespace}:{session_id}"
+
+    async def acquire(self, session_id: str) -> Optional[str]:
+        """
+        Ждать аренду (без таймаута — его задаёт вызывающий); вернуть токен
+        владельца. None — Redis недоступен, ход идёт без аренды.
+        """
+        token = uuid.uuid4().hex
+        key = self._key(session_id)
+        try:
+            while not await self.redis.set(key, token, nx=True, px=self.ttl_ms):
+                await asyncio.sleep(self.retry_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            SESSION_LEASE_ERRORS.labels(operation="acquire").inc()
+            logger.warning("Session lease unavailable for %s, using the local lock only: %s", session_id, exc)
+            return None
+        return token
+
+    async def keep(self, session_id: str, token: str) -> None:
+        """Продлевать аренду, пока задачу не отменят (ход дольше TTL)."""
+        key = self._key(session_id)
+        while True:
+            await asyncio.sleep(self.ttl_ms / 3000)
+            try:
+                if not await self.redis.eval(_RENEW_SCRIPT, 1, key, token, self.ttl_ms):
+                    logger.warning("Session lease for %s expired before renewal", session_id)
+                    return
+            except Exception as exc:  # noqa: BLE001
+                SESSION_LEASE_ERRORS.labels(operation="renew").inc()
+                logger.warning("Session lease renewal failed for %s: %s", session_id, exc)
+
+    async def release(self, session_id: str, token: str) -> None:
+        try:
+            await self.redis.eval(_RELEASE_SCRIPT, 1, self._key(session_id), token)
+        except Exception as exc:  # noqa: BLE001
+            # Аренда истечёт по TTL
+            logger.warning("Session lease release failed for %s: %s", session_id, exc)
+
+
+@dataclass(slots=True)
+class _Batch:
+    requests: list[Any]
+    future: asyncio.Future
+    closed: bool = False
+    followers: int = field(default=0)
+
+
+class SessionSequencer:
+    """Очередь ходов сессии: локальная блокировка + (опционально) аренда в Redis."""
+
+    def __init__(
+        self,
+        lease: Optional[RedisLease] = None,
+        wait_timeout: float = SESSION_LOCK_CONFIG['wait_timeout'],
+        coalesce: bool = SESSION_LOCK_CONFIG['coalesce'],
+        coalesce_window: float = SESSION_LOCK_CONFIG['coalesce_window'],
+        settle: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> None:
+        self.local = KeyedLock()
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        # Ожидание записи хода в MongoDB (RecordWriter.settled) перед
+        # освобождением аренды; локальной очереди оно не нужно — следующий
+        # ход в процессе сам ждёт settled
+        self.settle = settle
+        self._pending: dict[str, _Batch] = {}
+        self._releases: set[asyncio.Task] = set()
+
+    @asynccontextmanager
+    async def turn(self, session_id: str) -> AsyncIterator[None]:
+        """
+        Эксклюзивный ход сессии: сначала в процессе, затем между воркерами.
+        Общее ожидание ограничено ``wait_timeout`` (SessionBusyError).
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        token = None
+        try:
+            async with asyncio.timeout(self.wait_timeout):
+                await self.local.acquire(session_id)
+                try:
+                    if self.lease is not None:
+                        token = await self.lease.acquire(session_id)
+                except BaseException:
+                    self.local.release(session_id)
+                    raise
+        except TimeoutError:
+            raise SessionBusyError(session_id) from None
+        SESSION_LOCK_WAIT.observe(loop.time() - started)
+        renewal = asyncio.create_task(self.lease.keep(session_id, token)) if token is not None else None
+        try:
+            yield
+        finally:
+            if renewal is None:
+                self.local.release(session_id)
+            elif self.settle is None:
+                renewal.cancel()
+                await self.lease.release(session_id, token)
+                self.local.release(session_id)
+            else:
+                # Ответ не ждёт буфера записи: аренду отпускает фоновая задача
+                self.local.release(session_id)
+                task = asyncio.create_task(self._release_settled(session_id, token, renewal))
+                self._releases.add(task)
+                task.add_done_callback(self._releases.discard)
+
+    async def _release_settled(self, session_id: str, token: str, renewal: asyncio.Task) -> None:
+        try:
+            await self.settle(session_id)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Chat records of session %s not settled: %s", session_id, exc)
+        finally:
+            renewal.cancel()
+            await self.lease.release(session_id, token)
+
+    async def run(
+        self,
+        session_id: str,
+        request: Any,
+        handler: Callable[[Any], Awaitable[Any]],
+        merge: Callable[[list[Any]], Any],
+    ) -> Any:
+        """Выполнить ход в очереди сессии; при коалесцинге — общий для пачки."""
+        if not self.coalesce:
+            async with self.turn(session_id):
+                return await handler(request)
+
+        batch = self._pending.get(session_id)
+        if batch is not None and not batch.closed:
+            batch.requests.append(request)
+            batch.followers += 1
+            SESSION_COALESCED.inc()
+            return await asyncio.shield(batch.future)
+
+        batch = _Batch([request], asyncio.get_running_loop().create_future())
+        self._pending[session_id] = batch
+        try:
+            async with self.turn(session_id):
+                if self.coalesce_window:
+                    await asyncio.sleep(self.coalesce_window)
+                self._close(session_id, batch)
+                result = await handler(merge(batch.requests))
+        except BaseException as exc:
+            self._close(session_id, batch)
+            if batch.followers and not batch.future.done():
+                batch.future.set_exception(exc)
+            raise
+        batch.future.set_result(result)
+        return result
+
+    def _close(self, session_id: str, batch: _Batch) -> None:
+        batch.closed = True
+        if self._pending.get(session_id) is batch:
+            del self._pending[session_id]
+
+
+def build_session_sequencer(redis: Any = None) -> SessionSequencer:
+    """Очередь ходов; аренда в Redis, если задан SESSION_LOCK_REDIS_URL/REDIS_URL."""
+    if redis is None and SESSION_LOCK_CONFIG['redis_url']:
+        from utils.redis_client import build_redis
+
+        redis = build_redis(
+            SESSION_LOCK_CONFIG['redis_url'],
+            socket_timeout=SESSION_LOCK_CONFIG['redis_timeout'],
+            connect_timeout=SESSION_LOCK_CONFIG['redis_connect_timeout'],
+            setting="SESSION_LOCK_REDIS_URL",
+        )
+    return SessionSequencer(lease=RedisLease(redis) if redis is not None else None)
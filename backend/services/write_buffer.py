@@ -0,0 +1,391 @@
+"""
+Пакетная запись chat_messages
+=============================
+Каждый ход чата делал отдельный ``insert_one`` на пути запроса: в пик —
+тысячи мелких round trip в минуту. ``ChatWriteBuffer`` копит записи и
+сбрасывает их одним ``insert_many(ordered=False)``; число обращений к
+MongoDB растёт с размером пачки, а не с числом запросов.
+
+Режимы (``CHAT_WRITE_MODE``):
+
+* ``ack`` (по умолчанию) — group commit: запрос ждёт подтверждения своей
+  пачки. Пока одна пачка пишется, следующие записи копятся в очереди,
+  поэтому при низкой нагрузке задержки нет, а при высокой пачки растут;
+* ``buffered`` — ответ не ждёт записи; пачка уходит по размеру
+  (``CHAT_WRITE_BATCH``) или по времени (``CHAT_WRITE_FLUSH_MS``). Следующий
+  ход той же сессии дожидается своих записей (``settled``), поэтому
+  история не теряет предыдущую реплику. Упавшая пачка повторяется;
+* ``direct`` — без буфера, ``insert_one`` как раньше.
+
+Переполнение очереди (``CHAT_WRITE_MAX_PENDING``) и пачки, которые не
+удалось записать, уходят в spill-файл (JSONL в формате
+``bson.json_util``, по умолчанию во временном каталоге). Если недоступен и
+он, записи теряются с ошибкой в логе, но ожидающие их запросы
+отпускаются; ``settled`` ждёт не дольше ``CHAT_WRITE_SETTLE_TIMEOUT_MS``. При старте и после успешных сбросов файл
+дописывается в коллекцию. При остановке приложения (lifespan) буфер
+сбрасывается целиком.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("neuroexpert.write_buffer")
+
+WRITE_BUFFER_CONFIG = {
+    'mode': os.getenv('CHAT_WRITE_MODE', 'ack').lower(),
+    'max_batch': int(os.getenv('CHAT_WRITE_BATCH', '200')),
+    'flush_interval': float(os.getenv('CHAT_WRITE_FLUSH_MS', '200')) / 1000,
+    'max_pending': int(os.getenv('CHAT_WRITE_MAX_PENDING', '10000')),
+    # Рабочий каталог serverless-функции (Vercel) доступен только на чтение
+    'spill_path': os.getenv('CHAT_WRITE_SPILL_FILE')
+    or os.path.join(tempfile.gettempdir(), 'chat_messages.spill.jsonl'),
+    'max_attempts': int(os.getenv('CHAT_WRITE_MAX_ATTEMPTS', '3')),
+    'retry_backoff': float(os.getenv('CHAT_WRITE_RETRY_SECONDS', '1')),
+    # Дольше следующий ход не ждёт записей предыдущего (settled)
+    'settle_timeout': float(os.getenv('CHAT_WRITE_SETTLE_TIMEOUT_MS', '2000')) / 1000,
+    # Не чаще раза в столько секунд пытаться дописать spill-файл
+    'replay_interval': 30.0,
+    'collection': 'chat_messages',
+}
+
+MODES = ("ack", "buffered", "direct")
+_DUPLICATE_KEY = 11000
+
+CHAT_WRITE_BATCH_SIZE = Histogram(
+    "chat_write_batch_size",
+    "Records per chat_messages insert_many",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500),
+)
+CHAT_WRITE_PENDING = Gauge(
+    "chat_write_pending",
+    "chat_messages records waiting to be written",
+    multiprocess_mode="livesum",
+)
+CHAT_WRITE_SPILLED = Counter(
+    "chat_write_spilled_total",
+    "chat_messages records written to the spill file instead of MongoDB",
+    labelnames=("reason",),
+)
+
+
+@dataclass(slots=True)
+class _Pending:
+    record: dict[str, Any]
+    future: asyncio.Future
+    attempts: int = 0
+
+
+class ChatWriteBuffer:
+    """Очередь записей chat_messages со сбросом пачками."""
+
+    def __init__(
+        self,
+        database: Callable[[], Any],
+        mode: str = WRITE_BUFFER_CONFIG['mode'],
+        max_batch: int = WRITE_BUFFER_CONFIG['max_batch'],
+        flush_interval: float = WRITE_BUFFER_CONFIG['flush_interval'],
+        max_pending: int = WRITE_BUFFER_CONFIG['max_pending'],
+        spill_path: str | Path = WRITE_BUFFER_CONFIG['spill_path'],
+        max_attempts: int = WRITE_BUFFER_CONFIG['max_attempts'],
+        retry_backoff: float = WRITE_BUFFER_CONFIG['retry_backoff'],
+        replay_interval: float = WRITE_BUFFER_CONFIG['replay_interval'],
+        settle_timeout: float = WRITE_BUFFER_CONFIG['settle_timeout'],
+        collection: str = WRITE_BUFFER_CONFIG['collection'],
+    ) -> None:
+        if mode not in ("ack", "buffered"):
+            raise ValueError(f"Unsupported buffer mode: {mode!r}")
+        self.database = database
+        self.mode = mode
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_path = Path(spill_path)
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.replay_interval = replay_interval
+        self.settle_timeout = settle_timeout
+        self.collection = collection
+        self._queue: deque[_Pending] = deque()
+        self._by_session: dict[str, set[asyncio.Future]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_replay = -replay_interval
+        self.batches = 0
+        self.written = 0
+        self.spilled = 0
+
+    # ──────────────────────────────
+    # Горячий путь
+    # ──────────────────────────────
+
+    async def write(self, record: dict[str, Any]) -> None:
+        """Поставить запись в очередь; в режиме ack — дождаться её пачки."""
+        self._ensure_started()
+        if len(self._queue) >= self.max_pending:
+            # MongoDB не успевает или недоступна — не растим память бесконечно
+            await self._spill([record], "overflow")
+            return
+
+        future = self._loop.create_future()
+        self._queue.append(_Pending(record, future))
+        CHAT_WRITE_PENDING.inc()
+        session_id = record.get("session_id")
+        if session_id:
+            futures = self._by_session.setdefault(session_id, set())
+            futures.add(future)
+            future.add_done_callback(lambda done, sid=session_id: self._forget(sid, done))
+        self._wakeup.set()
+        if len(self._queue) >= self.max_batch:
+            self._full.set()
+
+        if self.mode == "ack":
+            await future
+
+    async def settled(self, session_id: str) -> None:
+        """Дождаться, пока записи сессии окажутся в MongoDB (или в spill-файле)."""
+        futures = self._by_session.get(session_id)
+        if not futures:
+            return
+        _, pending = await asyncio.wait(set(futures), timeout=self.settle_timeout)
+        if pending:
+            # Лучше ход без последней реплики, чем зависший запрос
+            logger.warning("Chat records of session %s not settled in %.1fs", session_id, self.settle_timeout)
+
+    def _forget(self, session_id: str, future: asyncio.Future) -> None:
+        futures = self._by_session.get(session_id)
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del self._by_session[session_id]
+
+    # ──────────────────────────────
+    # Жизненный цикл
+    # ──────────────────────────────
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # Новый event loop (serverless-рантайм пересоздал его) — новые примитивы;
+            # записи из старого loop никто не ждёт, но они ещё не записаны
+            if self._loop is not loop:
+                for item in self._queue:
+                    item.future = loop.create_future()
+                self._by_session.clear()
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = loop.create_task(self._run(), name="chat-write-buffer")
+            if self._queue:
+                self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и сбросить всё накопленное (lifespan shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._queue:
+            batch = self._take_batch()
+            try:
+                await self._insert([item.record for item in batch])
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Final flush of %s chat records failed: %s", len(batch), exc)
+                await self._spill([item.record for item in batch], "shutdown")
+            self._settle(batch)
+        if self.written and self._has_spill():
+            # MongoDB доступна — последняя попытка дописать отложенное
+            await self._replay_spill(force=True)
+
+    async def _run(self) -> None:
+        await self._safe_replay()
+        while True:
+            await self._wakeup.wait()
+            if self.mode == "buffered" and len(self._queue) < self.max_batch:
+                # Копим пачку до размера или до истечения интервала
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            self._full.clear()
+            while self._queue:
+                await self._flush(self._take_batch())
+            if self._has_spill():
+                await self._safe_replay()
+
+    async def _safe_replay(self) -> None:
+        try:
+            await self._replay_spill()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            # Нечитаемый spill-файл не должен останавливать сброс очереди
+            logger.error("Spill replay failed: %s", exc)
+
+    def _take_batch(self) -> list[_Pending]:
+        batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+        CHAT_WRITE_PENDING.dec(len(batch))
+        return batch
+
+    # ──────────────────────────────
+    # Сброс
+    # ──────────────────────────────
+
+    async def _flush(self, batch: list[_Pending]) -> None:
+        try:
+            await self._insert([item.record for item in batch])
+        except asyncio.CancelledError:
+            self._queue.extendleft(reversed(batch))
+            CHAT_WRITE_PENDING.inc(len(batch))
+            raise
+        except Exception as exc:  # noqa: BLE001
+            await self._flush_failed(batch, exc)
+            return
+        self._settle(batch)
+
+    async def _flush_failed(self, batch: list[_Pending], exc: Exception) -> None:
+        if self.mode == "ack":
+            # Запрос ждёт подтверждения — отдаём ошибку, как раньше insert_one
+            logger.warning("Chat records batch of %s failed: %s", len(batch), exc)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(exc)
+            return
+
+        retry = [item for item in batch if item.attempts + 1 < self.max_attempts]
+        exhausted = [item for item in batch if item.attempts + 1 >= self.max_attempts]
+        logger.warning(
+            "Chat records batch of %s failed (retrying %s): %s", len(batch), len(retry), exc
+        )
+        for item in retry:
+            item.attempts += 1
+        if exhausted:
+            await self._spill([item.record for item in exhausted], "write_failed")
+            self._settle(exhausted)
+        if retry:
+            self._queue.extendleft(reversed(retry))
+            CHAT_WRITE_PENDING.inc(len(retry))
+            await asyncio.sleep(self.retry_backoff)
+
+    def _settle(self, batch: list[_Pending]) -> None:
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(None)
+
+    async def _insert(self, records: list[dict[str, Any]]) -> None:
+        from pymongo.errors import BulkWriteError
+
+        try:
+            await self.database()[self.collection].insert_many(records, ordered=False)
+        except BulkWriteError as exc:
+            # Повтор после частичного успеха: уже записанные _id — не ошибка
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != _DUPLICATE_KEY for error in errors):
+                raise
+        self.batches += 1
+        self.written += len(records)
+        CHAT_WRITE_BATCH_SIZE.observe(len(records))
+
+    # ──────────────────────────────
+    # Spill-файл
+    # ──────────────────────────────
+
+    async def _spill(self, records: list[dict[str, Any]], reason: str) -> bool:
+        """Дописать записи в spill-файл; False — файл недоступен, записи потеряны."""
+        from bson import json_util
+
+        payload = "".join(json_util.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        try:
+            await asyncio.to_thread(self._append_spill, payload)
+        except Exception as exc:  # noqa: BLE001
+            # Ожидающих записи всё равно отпускаем — зависший ход хуже потери
+            logger.error("Lost %s chat records: spill file %s unavailable: %s", len(records), self.spill_path, exc)
+            CHAT_WRITE_SPILLED.labels(reason="lost").inc(len(records))
+            return False
+        # Сразу после сбоя дописывать бессмысленно — ждём replay_interval
+        self._last_replay = time.monotonic()
+        self.spilled += len(records)
+        CHAT_WRITE_SPILLED.labels(reason=reason).inc(len(records))
+        logger.warning("Spilled %s chat records to %s (%s)", len(records), self.spill_path, reason)
+        return True
+
+    def _append_spill(self, payload: str) -> None:
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as fh:
+            fh.write(payload)
+
+    @property
+    def _replay_path(self) -> Path:
+        return self.spill_path.with_suffix(self.spill_path.suffix + ".replay")
+
+    def _has_spill(self) -> bool:
+        return self.spill_path.exists() or self._replay_path.exists()
+
+    def _claim_spill(self) -> str:
+        # Spill-файл переносится в .replay и удаляется только после записи:
+        # прерванное дописывание подхватывается следующим (дубли _id не страшны)
+        if self.spill_path.exists():
+            with open(self._replay_path, "a", encoding="utf-8") as fh:
+                fh.write(self.spill_path.read_text(encoding="utf-8"))
+            self.spill_path.unlink()
+        return self._replay_path.read_text(encoding="utf-8")
+
+    async def _replay_spill(self, force: bool = False) -> int:
+        """Дописать spill-файл в коллекцию; непрошедшие записи возвращаются в файл."""
+        now = time.monotonic()
+        if not self._has_spill() or (not force and now - self._last_replay < self.replay_interval):
+            return 0
+        self._last_replay = now
+        from bson import json_util
+
+        payload = await asyncio.to_thread(self._claim_spill)
+        records = [json_util.loads(line) for line in payload.splitlines() if line.strip()]
+        replayed = 0
+        for start in range(0, len(records), self.max_batch):
+            chunk = records[start:start + self.max_batch]
+            try:
+                await self._insert(chunk)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Spill replay stopped: %s", exc)
+                if not await self._spill(records[start:], "replay_failed"):
+                    # .replay остаётся — следующая попытка начнёт с него
+                    return replayed
+                break
+            replayed += len(chunk)
+        await asyncio.to_thread(self._replay_path.unlink)
+        if replayed:
+            logger.info("Replayed %s spilled chat records", replayed)
+        return replayed
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "pending": len(self._queue),
+            "batches": self.batches,
+            "written": self.written,
+            "spilled": self.spilled,
+        }
+
+
+def build_write_buffer(database: Callable[[], Any]) -> Optional[ChatWriteBuffer]:
+    """Буфер по CHAT_WRITE_MODE; None для ``direct`` (insert_one на пути запроса)."""
+    mode = WRITE_BUFFER_CONFIG['mode']
+    if mode not in MODES:
+        logger.warning("Unknown CHAT_WRITE_MODE=%s, using direct inserts", mode)
+        return None
+    if mode == "direct":
+        return None
+    return ChatWriteBuffer(database, mode=mode)
@@ -0,0 +1,172 @@
+"""
+Circuit breaker и адаптивный таймаут для внешних вызовов
+========================================================
+Используется AIIntentClassifier: пока YandexGPT недоступен, запросы не
+тратят сетевое время и сразу уходят на локальные уровни классификации.
+
+* CircuitBreaker — состояния closed/open/half-open, доля ошибок считается
+  по скользящему окну времени;
+* AdaptiveTimeout — таймаут следует за наблюдаемым p95 задержки
+  (с множителем и границами), а не за константой.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable
+
+logger = logging.getLogger("neuroexpert.circuit_breaker")
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Вызов отклонён: цепь разомкнута."""
+
+
+@dataclass(slots=True)
+class CircuitBreaker:
+    """
+    Circuit breaker со скользящим окном доли ошибок.
+
+    * CLOSED: вызовы разрешены; если за `window_seconds` набралось не меньше
+      `min_requests` исходов и доля ошибок ≥ `error_rate_threshold` — OPEN.
+    * OPEN: вызовы отклоняются без сети; через `open_seconds` — HALF_OPEN.
+    * HALF_OPEN: пропускается не больше `half_open_max_calls` пробных
+      вызовов; успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    name: str
+    window_seconds: float = 30.0
+    min_requests: int = 10
+    error_rate_threshold: float = 0.5
+    open_seconds: float = 15.0
+    half_open_max_calls: int = 1
+    clock: Callable[[], float] = time.monotonic
+
+    _state: CircuitState = field(default=CircuitState.CLOSED, init=False)
+    _opened_at: float = field(default=0.0, init=False)
+    _half_open_in_flight: int = field(default=0, init=False)
+    _events: deque = field(default_factory=deque, init=False, repr=False)
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state is CircuitState.OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов сейчас (резервирует пробу в HALF_OPEN)."""
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+            self._half_open_in_flight += 1
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._state is CircuitState.HALF_OPEN:
+            self._transition(CircuitState.CLOSED)
+            return
+        self._record(True)
+
+    def record_failure(self) -> None:
+        if self._state is CircuitState.HALF_OPEN:
+            self._transition(CircuitState.OPEN)
+            return
+        self._record(False)
+        if self._state is CircuitState.CLOSED and self._should_trip():
+            self._transition(CircuitState.OPEN)
+
+    def release(self) -> None:
+        """Освободить пробу HALF_OPEN без учёта исхода (например, при отмене)."""
+        if self._state is CircuitState.HALF_OPEN and self._half_open_in_flight:
+            self._half_open_in_flight -= 1
+
+    def error_rate(self) -> float:
+        self._evict()
+        if not self._events:
+            return 0.0
+        failures = sum(1 for _, ok in self._events if not ok)
+        return failures / len(self._events)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "window_requests": len(self._events),
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+    def _record(self, ok: bool) -> None:
+        self._events.append((self.clock(), ok))
+        self._evict()
+
+    def _evict(self) -> None:
+        horizon = self.clock() - self.window_seconds
+        while self._events and self._events[0][0] < horizon:
+            self._events.popleft()
+
+    def _should_trip(self) -> bool:
+        return len(self._events) >= self.min_requests and self.error_rate() >= self.error_rate_threshold
+
+    def _transition(self, new_state: CircuitState) -> None:
+        previous, self._state = self._state, new_state
+        self._half_open_in_flight = 0
+        if new_state is CircuitState.OPEN:
+            self._opened_at = self.clock()
+            logger.warning(
+                "Circuit %s: %s → open на %.0fs (ошибок %.0f%%)",
+                self.name, previous.value, self.open_seconds, self.error_rate() * 100,
+            )
+        else:
+            if new_state is CircuitState.CLOSED:
+                self._events.clear()
+            logger.info("Circuit %s: %s → %s", self.name, previous.value, new_state.value)
+
+
+@dataclass(slots=True)
+class AdaptiveTimeout:
+    """
+    Таймаут = percentile(задержек) × multiplier, в пределах [minimum, maximum].
+    Пока данных меньше `min_samples`, используется `initial`.
+    """
+
+    initial: float = 0.3
+    minimum: float = 0.1
+    maximum: float = 1.0
+    percentile: float = 0.95
+    multiplier: float = 1.5
+    window: int = 200
+    min_samples: int = 20
+
+    _samples: deque = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._samples = deque(maxlen=self.window)
+
+    def observe(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def quantile(self) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        rank = max(0, math.ceil(self.percentile * len(ordered)) - 1)
+        return ordered[rank]
+
+    @property
+    def current(self) -> float:
+        if len(self._samples) < self.min_samples:
+            return self.initial
+        return min(self.maximum, max(self.minimum, self.quantile() * self.multiplier))
@@ -0,0 +1,250 @@
+"""
+Фоновый мониторинг зависимостей
+===============================
+``/api/health`` отдаёт последний снимок из памяти за O(1), не делая
+сетевых вызовов на каждый опрос балансировщика:
+
+* ``HealthMonitor`` раз в ``interval`` секунд параллельно опрашивает
+  зависимости (MongoDB, Redis, LLM-шлюз, Telegram), каждую — с таймаутом;
+* для каждой хранится последний статус, ошибка и окно латентностей
+  (p50/p95/p99);
+* снимок пересобирается после каждого раунда, запрос его только читает;
+* в serverless фоновая задача не запускается: устаревший снимок
+  обновляется в фоне по первому обращению (первый запрос ждёт раунд);
+* ``deep=True`` принудительно выполняет синхронный раунд; одновременные
+  раунды объединяются в один (общая задача), поэтому поток глубоких
+  запросов не умножает пинги MongoDB и ``getMe`` Telegram. Ручка отдаёт
+  deep-режим только с ``HEALTH_TOKEN``;
+* анонимным вызывающим уходит только класс ошибки (``timeout``,
+  ``ConnectionError``), полный текст — в логи и вызывающим с токеном.
+
+Критичные зависимости (MongoDB) переводят статус в ``unhealthy``,
+остальные — в ``degraded``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+
+logger = logging.getLogger("neuroexpert.health")
+
+HEALTH_CONFIG = {
+    'interval': float(os.getenv('HEALTH_INTERVAL_SECONDS', '15')),
+    'timeout': float(os.getenv('HEALTH_PROBE_TIMEOUT', '2')),
+    'background': os.getenv('HEALTH_BACKGROUND', '0' if os.getenv('VERCEL') else '1').lower() in ('1', 'true', 'yes'),
+    'llm_url': os.getenv('LLM_HEALTH_URL', ''),
+    # Bearer-токен deep-режима и подробных ошибок (по умолчанию METRICS_TOKEN)
+    'token': os.getenv('HEALTH_TOKEN') or os.getenv('METRICS_TOKEN'),
+}
+
+STATUS_OK = "ok"
+STATUS_FAIL = "fail"
+STATUS_UNKNOWN = "unknown"
+
+
+@dataclass(slots=True)
+class HealthProbe:
+    name: str
+    check: Callable[[], Awaitable[Any]]
+    critical: bool = False
+
+
+@dataclass(slots=True)
+class ProbeState:
+    status: str = STATUS_UNKNOWN
+    error: Optional[str] = None
+    # Без подробностей (адресов, текста исключения) — для анонимных вызывающих
+    error_kind: Optional[str] = None
+    checked_at: Optional[str] = None
+    consecutive_failures: int = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=100))
+
+    def summary(self, detail: bool = True) -> dict[str, Any]:
+        ordered = sorted(self.latencies)
+        result: dict[str, Any] = {
+            "status": self.status,
+            "checked_at": self.checked_at,
+            "latency_ms": round(self.latencies[-1] * 1000, 2) if self.latencies else None,
+        }
+        if ordered:
+            for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+                result[name] = round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+        if self.error:
+            result["error"] = self.error if detail else self.error_kind
+            result["consecutive_failures"] = self.consecutive_failures
+        return result
+
+
+class HealthMonitor:
+    """Периодический опрос зависимостей с кэшированным снимком."""
+
+    def __init__(
+        self,
+        probes: list[HealthProbe],
+        interval: float = HEALTH_CONFIG['interval'],
+        timeout: float = HEALTH_CONFIG['timeout'],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.clock = clock
+        self.states: dict[str, ProbeState] = {probe.name: ProbeState() for probe in probes}
+        self.last_round: Optional[float] = None
+        self._snapshot: dict[str, Any] = self._build_snapshot()
+        self._task: Optional[asyncio.Task] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self._round: Optional[asyncio.Task] = None
+
+    # ──────────────────────────────
+    # Опрос
+    # ──────────────────────────────
+
+    async def _run_probe(self, probe: HealthProbe) -> None:
+        state = self.states[probe.name]
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe.check(), self.timeout)
+        except asyncio.TimeoutError:
+            state.status, state.error = STATUS_FAIL, f"timeout after {self.timeout:.1f}s"
+            state.error_kind = "timeout"
+        except Exception as exc:  # noqa: BLE001
+            state.status, state.error = STATUS_FAIL, f"{type(exc).__name__}: {exc}"
+            state.error_kind = type(exc).__name__
+        else:
+            state.status, state.error, state.error_kind = STATUS_OK, None, None
+        state.latencies.append(time.perf_counter() - started)
+        state.checked_at = datetime.now(timezone.utc).isoformat()
+        if state.status == STATUS_FAIL:
+            state.consecutive_failures += 1
+            if state.consecutive_failures == 1:
+                logger.warning("Health probe %s failed: %s", probe.name, state.error)
+        elif state.consecutive_failures:
+            logger.info("Health probe %s recovered", probe.name)
+            state.consecutive_failures = 0
+
+    async def probe_all(self, detail: bool = False) -> dict[str, Any]:
+        """
+        Один раунд опроса всех зависимостей; возвращает новый снимок.
+        Вызов во время идущего раунда дожидается его, а не начинает свой.
+        """
+        loop = asyncio.get_running_loop()
+        if self._round is None or self._round.done() or self._round.get_loop() is not loop:
+            self._round = loop.create_task(self._probe_round(), name="health-round")
+        # shield: отмена одного ожидающего не прерывает общий раунд
+        await asyncio.shield(self._round)
+        return self._build_snapshot(detail=True) if detail else self._snapshot
+
+    async def _probe_round(self) -> None:
+        await asyncio.gather(*(self._run_probe(probe) for probe in self.probes))
+        self.last_round = self.clock()
+        self._snapshot = self._build_snapshot()
+
+    def _build_snapshot(self, detail: bool = False) -> dict[str, Any]:
+        status = "healthy" if self.last_round is not None else "starting"
+        for probe in self.probes:
+            if self.states[probe.name].status == STATUS_FAIL:
+                if probe.critical:
+                    status = "unhealthy"
+                    break
+                status = "degraded"
+        return {
+            "status": status,
+            "checks": {name: state.summary(detail) for name, state in self.states.items()},
+        }
+
+    # ──────────────────────────────
+    # Чтение снимка
+    # ──────────────────────────────
+
+    @property
+    def is_stale(self) -> bool:
+        return self.last_round is None or self.clock() - self.last_round > self.interval
+
+    def snapshot(self, detail: bool = False) -> dict[str, Any]:
+        """Последний снимок (без сетевых вызовов); detail — с полным текстом ошибок."""
+        return self._build_snapshot(detail=True) if detail else self._snapshot
+
+    async def current(self, deep: bool = False, detail: bool = False) -> dict[str, Any]:
+        """
+        Снимок для ``/api/health``.
+
+        deep — синхронный раунд (общий для одновременных запросов); без
+        фоновой задачи устаревший снимок обновляется в фоне, а самый первый
+        запрос дожидается раунда. detail — полный текст ошибок.
+        """
+        if deep or self.last_round is None:
+            return await self.probe_all(detail)
+        if self.is_stale and self._task is None and (self._refresh is None or self._refresh.done()):
+            self._refresh = asyncio.create_task(self.probe_all(), name="health-refresh")
+        return self.snapshot(detail)
+
+    # ──────────────────────────────
+    # Жизненный цикл
+    # ──────────────────────────────
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="health-monitor")
+
+    async def stop(self) -> None:
+        for task in (self._task, self._refresh, self._round):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._refresh = None
+        self._round = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Health monitor round failed: %s", exc)
+            await asyncio.sleep(self.interval)
+
+
+# ──────────────────────────────
+# Проверки
+# ──────────────────────────────
+
+def mongo_probe(get_client: Callable[[], Any]) -> Callable[[], Awaitable[Any]]:
+    async def check() -> Any:
+        return await get_client().admin.command("ping")
+    return check
+
+
+def redis_probe(client: Any) -> Callable[[], Awaitable[Any]]:
+    async def check() -> Any:
+        return await client.ping()
+    return check
+
+
+def http_probe(url: str, expect_ok: bool = False) -> Callable[[], Awaitable[Any]]:
+    """
+    GET-проба внешнего HTTP-сервиса.
+
+    expect_ok=False: доступность (любой ответ < 500, например 401 от шлюза
+    без ключа); expect_ok=True: требуется 2xx.
+    """
+    async def check() -> Any:
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                if response.status >= 500 or (expect_ok and response.status >= 300):
+                    raise RuntimeError(f"HTTP {response.status}")
+                return response.status
+    return check
@@ -0,0 +1,255 @@
+"""
+Кэш классификации намерений
+===========================
+Двухуровневый кэш для HybridIntentChecker:
+
+* L1 — in-process ``cachetools.TLRUCache`` с TTL, зависящим от источника
+  результата (ответы AI/локальной модели живут долго, fallback по
+  правилам — коротко, чтобы временный сбой YandexGPT не закреплялся);
+* L2 — опциональный Redis, общий для всех воркеров. Асинхронный клиент
+  привязан к event loop: при смене loop (``asyncio.run`` в синхронном
+  ``is_relevant``, serverless-рантайм) он пересоздаётся, как клиент
+  MongoDB в ``db.connection``.
+
+Ключ нормализуется: регистр, ё/е, пунктуация и пробелы не влияют,
+длинные тексты заменяются хэшем. Символы (``+``, ``$``, ``₽``) остаются
+в ключе: «C++» и «C» — разные вопросы. Счётчики попаданий доступны через
+``stats()`` и Prometheus.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, Optional, Type, TypeVar
+
+from prometheus_client import Counter
+from pydantic import BaseModel
+
+logger = logging.getLogger("neuroexpert.intent_cache")
+
+PROM_INTENT_CACHE_LOOKUPS = Counter(
+    "intent_cache_lookups_total",
+    "Intent cache lookups by tier and outcome",
+    labelnames=("tier", "outcome"),
+)
+
+# Источники результата и их «класс» TTL
+FALLBACK_SOURCES = frozenset({"rules"})
+
+INTENT_CACHE_CONFIG = {
+    'maxsize': int(os.getenv('INTENT_CACHE_MAXSIZE', '1000')),
+    'ai_ttl': float(os.getenv('INTENT_CACHE_TTL', '3600')),
+    'fallback_ttl': float(os.getenv('INTENT_CACHE_FALLBACK_TTL', '60')),
+    'redis_url': os.getenv('INTENT_CACHE_REDIS_URL') or os.getenv('REDIS_URL'),
+    'namespace': 'intent:v1',
+    # Тексты длиннее порога хранятся под sha1-ключом
+    'hash_threshold': 256,
+}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+ResultT = TypeVar("ResultT", bound=BaseModel)
+
+
+def normalize_key(message: str, hash_threshold: int = INTENT_CACHE_CONFIG['hash_threshold']) -> str:
+    """
+    Нормализованный ключ сообщения.
+
+    "Привет!", " привет " и "ПРИВЕТ..." дают один ключ. Убирается только
+    пунктуация (категория P): символы вроде "+" или "₽" меняют смысл.
+    """
+    text = unicodedata.normalize("NFKC", message).casefold().replace("ё", "е")
+    text = "".join(
+        " " if unicodedata.category(char)[0] == "P" else char
+        for char in text
+    )
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    if len(text) > hash_threshold:
+        return "h:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return text
+
+
+@dataclass(slots=True, frozen=True)
+class _CacheEntry(Generic[ResultT]):
+    result: ResultT
+    source: str
+
+
+class IntentCache(Generic[ResultT]):
+    """Нормализующий TTL-кэш с опциональным Redis L2."""
+
+    def __init__(
+        self,
+        result_type: Type[ResultT],
+        maxsize: int = INTENT_CACHE_CONFIG['maxsize'],
+        ai_ttl: float = INTENT_CACHE_CONFIG['ai_ttl'],
+        fallback_ttl: float = INTENT_CACHE_CONFIG['fallback_ttl'],
+        redis_client: Any = None,
+        namespace: str = INTENT_CACHE_CONFIG['namespace'],
+        timer: Callable[[], float] = time.monotonic,
+        redis_factory: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.result_type = result_type
+        self.ai_ttl = ai_ttl
+        self.fallback_ttl = fallback_ttl
+        # Готовый клиент используется как есть; фабрика — клиент на каждый event loop
+        self._redis = redis_client
+        self._redis_factory = redis_factory
+        self._redis_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.namespace = namespace
+        import cachetools
+
+        self._l1: cachetools.TLRUCache = cachetools.TLRUCache(
+            maxsize=maxsize,
+            ttu=lambda _key, entry, now: now + self.ttl_for(entry.source),
+            timer=timer,
+        )
+        self.hits_l1 = 0
+        self.hits_l2 = 0
+        self.misses = 0
+
+    async def _current_redis(self) -> Any:
+        """Redis-клиент текущего event loop (при фабрике — пересоздаётся при смене loop)."""
+        if self._redis_factory is None:
+            return self._redis
+        loop = asyncio.get_running_loop()
+        if self._redis_loop is not loop:
+            if self._redis is not None:
+                logger.debug("Event loop changed, recreating intent cache Redis client")
+                await self.aclose()
+            self._redis = self._redis_factory()
+            self._redis_loop = loop
+        return self._redis
+
+    async def aclose(self) -> None:
+        """Закрыть клиент, созданный фабрикой; готовый клиент закрывает его владелец."""
+        if self._redis_factory is None:
+            return
+        client, self._redis, self._redis_loop = self._redis, None, None
+        if client is None:
+            return
+        try:
+            await client.aclose()
+        except Exception as exc:  # noqa: BLE001
+            # клиент создан в другом (уже закрытом) event loop
+            logger.debug("Не удалось закрыть Redis-клиент кэша намерений: %s", exc)
+
+    def ttl_for(self, source: str) -> float:
+        return self.fallback_ttl if source in FALLBACK_SOURCES else self.ai_ttl
+
+    # ──────────────────────────────
+    # Синхронный доступ (только L1)
+    # ──────────────────────────────
+
+    def get(self, message: str) -> Optional[ResultT]:
+        entry = self._l1.get(normalize_key(message))
+        if entry is not None:
+            self._hit("l1")
+            return entry.result
+        self._miss("l1")
+        return None
+
+    def set(self, message: str, result: ResultT, source: str = "ai") -> None:
+        self._l1[normalize_key(message)] = _CacheEntry(result, source)
+
+    # ──────────────────────────────
+    # Асинхронный доступ (L1 + L2)
+    # ──────────────────────────────
+
+    async def aget(self, message: str) -> Optional[ResultT]:
+        key = normalize_key(message)
+        entry = self._l1.get(key)
+        if entry is not None:
+            self._hit("l1")
+            return entry.result
+
+        redis = await self._current_redis()
+        if redis is not None:
+            entry = await self._load_l2(redis, key)
+            if entry is not None:
+                self._l1[key] = entry
+                self._hit("l2")
+                return entry.result
+
+        self._miss("l2" if redis is not None else "l1")
+        return None
+
+    async def aset(self, message: str, result: ResultT, source: str = "ai") -> None:
+        key = normalize_key(message)
+        entry = _CacheEntry(result, source)
+        self._l1[key] = entry
+        redis = await self._current_redis()
+        if redis is None:
+            return
+        try:
+            payload = json.dumps(
+                {"result": result.model_dump(), "source": source},
+                ensure_ascii=False,
+            )
+            await redis.set(self._redis_key(key), payload, ex=max(1, int(self.ttl_for(source))))
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Не удалось записать намерение в Redis: %s", exc)
+
+    def clear(self) -> None:
+        self._l1.clear()
+
+    # ──────────────────────────────
+    # Метрики
+    # ──────────────────────────────
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits_l1 + self.hits_l2 + self.misses
+        return {
+            "size": len(self._l1),
+            "hits_l1": self.hits_l1,
+            "hits_l2": self.hits_l2,
+            "misses": self.misses,
+            "hit_ratio": (self.hits_l1 + self.hits_l2) / lookups if lookups else 0.0,
+        }
+
+    def _hit(self, tier: str) -> None:
+        if tier == "l1":
+            self.hits_l1 += 1
+        else:
+            self.hits_l2 += 1
+        PROM_INTENT_CACHE_LOOKUPS.labels(tier=tier, outcome="hit").inc()
+
+    def _miss(self, tier: str) -> None:
+        self.misses += 1
+        PROM_INTENT_CACHE_LOOKUPS.labels(tier=tier, outcome="miss").inc()
+
+    # ──────────────────────────────
+    # Redis helpers
+    # ──────────────────────────────
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def _load_l2(self, redis: Any, key: str) -> Optional[_CacheEntry[ResultT]]:
+        try:
+            raw = await redis.get(self._redis_key(key))
+            if raw is None:
+                return None
+            data = json.loads(raw)
+            return _CacheEntry(self.result_type.model_validate(data["result"]), data.get("source", "ai"))
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Не удалось прочитать намерение из Redis: %s", exc)
+            return None
+
+
+def build_redis_client(url: Optional[str] = INTENT_CACHE_CONFIG['redis_url']) -> Any:
+    """
+    Redis-клиент для L2 или None, если URL не задан либо redis не установлен.
+    Короткие таймауты: медленный Redis не должен тормозить классификацию.
+    """
+    from utils.redis_client import build_redis
+
+    return build_redis(url, socket_timeout=0.05, connect_timeout=0.2, setting="INTENT_CACHE_REDIS_URL")
@@ -5,13 +5,17 @@ import time
 import json
 import asyncio
 import logging
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from pydantic import BaseModel, Field
-import cachetools
 
 # Для сетевых запросов (YandexGPT API)
 import aiohttp
 
+from utils.circuit_breaker import AdaptiveTimeout, CircuitBreaker, CircuitOpenError, CircuitState
+from utils.intent_cache import IntentCache, build_redis_client
+from utils.intent_logs import ClassificationLogBuffer
+from utils.tracing import span
+
 logger = logging.getLogger(__name__)
 
 # ================== Старый класс (Rule-based) ================== #
@@ -94,15 +98,69 @@ INTENT_TYPES = {
     # при необходимости можно дополнить
 }
 
+# Намерения, при которых сообщение считается нерелевантным
+IRRELEVANT_INTENTS = {'OFF_TOPIC', 'SPAM'}
+
 # ================== Конфигурация YandexGPT ================== #
 YAGPT_CONFIG = {
     'api_key': os.getenv('YANDEX_API_KEY'),
     'folder_id': os.getenv('YANDEX_FOLDER_ID'),
     'model': 'yandexgpt/latest',
     'temperature': 0.2,
-    'max_tokens': 300
+    'max_tokens': 300,
+    # Микро-батчинг: сообщения, пришедшие в пределах окна, уходят одним запросом
+    'batch_mode': os.getenv('INTENT_BATCH_MODE', 'false').lower() in ('1', 'true', 'yes'),
+    'batch_window_ms': float(os.getenv('INTENT_BATCH_WINDOW_MS', '5')),
+    'batch_max_size': int(os.getenv('INTENT_BATCH_MAX_SIZE', '16')),
+    # Токенов ответа на одно сообщение в батче
+    'batch_tokens_per_message': 80,
+    # Circuit breaker: доля ошибок в скользящем окне, после которой цепь размыкается
+    'breaker_window_seconds': float(os.getenv('INTENT_BREAKER_WINDOW_SECONDS', '30')),
+    'breaker_min_requests': int(os.getenv('INTENT_BREAKER_MIN_REQUESTS', '10')),
+    'breaker_error_rate': float(os.getenv('INTENT_BREAKER_ERROR_RATE', '0.5')),
+    'breaker_open_seconds': float(os.getenv('INTENT_BREAKER_OPEN_SECONDS', '15')),
+    # Адаптивный таймаут: p95 наблюдаемой задержки × 1.5 в пределах [min, max]
+    'timeout_initial': 0.3,
+    'timeout_min': float(os.getenv('INTENT_TIMEOUT_MIN', '0.1')),
+    'timeout_max': float(os.getenv('INTENT_TIMEOUT_MAX', '0.6'))
+}
+
+# ================== Конфигурация локальной модели ================== #
+LOCAL_MODEL_CONFIG = {
+    'model_path': os.getenv(
+        'INTENT_MODEL_PATH',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'intent_model')
+    ),
+    # Ниже порога сообщение уходит в YandexGPT
+    'min_confidence': float(os.getenv('LOCAL_INTENT_MIN_CONFIDENCE', '0.85')),
 }
 
+
+def load_local_model(path: Optional[str] = None):
+    """
+    Загрузить локальную модель, если она обучена и numpy установлен.
+    Возвращает None, если уровень недоступен.
+
+    numpy импортируется только при наличии обученной модели — без неё
+    холодный старт не платит за импорт.
+    """
+    path = path or LOCAL_MODEL_CONFIG['model_path']
+    if not os.path.isdir(path):
+        logger.info(f"Локальная модель намерений не найдена: {path}")
+        return None
+    try:
+        from utils.intent_model import LocalIntentModel
+    except ImportError as e:
+        logger.info(f"Локальный классификатор недоступен: {e}")
+        return None
+    try:
+        model = LocalIntentModel.load(path)
+        logger.info(f"Локальная модель намерений загружена: {path} ({len(model.labels)} меток)")
+        return model
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить локальную модель {path}: {e}")
+        return None
+
 # ================== Промпт для классификации ================== #
 PROMPT_TEMPLATE = """
 Проанализируй сообщение пользователя для IT-компании (AI, разработка, автоматизация).
@@ -124,6 +182,30 @@ JSON ответ:
 }}
 """
 
+BATCH_PROMPT_TEMPLATE = """
+Проанализируй сообщения пользователей для IT-компании (AI, разработка, автоматизация).
+Сообщения независимы друг от друга.
+
+СООБЩЕНИЯ (JSON-массив): {messages}
+
+Для каждого сообщения определи:
+1. Основное намерение из: {intent_list}
+2. Уверенность (0-100%)
+3. Сущности: услуга, технология, бюджет, сроки
+4. Релевантность (true/false)
+
+Ответ — JSON-массив из {count} элементов в том же порядке, что и сообщения:
+[
+  {{
+    "index": 0,
+    "intent": "название",
+    "confidence": 95,
+    "entities": {{"service": "", "budget": "", "timeframe": ""}},
+    "is_relevant": true
+  }}
+]
+"""
+
 # ================== Результат классификации ================== #
 
 class IntentResult(BaseModel):
@@ -144,6 +226,23 @@ class AIIntentClassifier:
 
     def __init__(self, config: Dict[str, Any] = None) -> None:
         self.config = config or YAGPT_CONFIG
+        self.breaker = CircuitBreaker(
+            name="yandexgpt",
+            window_seconds=self.config.get('breaker_window_seconds', 30.0),
+            min_requests=self.config.get('breaker_min_requests', 10),
+            error_rate_threshold=self.config.get('breaker_error_rate', 0.5),
+            open_seconds=self.config.get('breaker_open_seconds', 15.0)
+        )
+        self.timeout = AdaptiveTimeout(
+            initial=self.config.get('timeout_initial', 0.3),
+            minimum=self.config.get('timeout_min', 0.1),
+            maximum=self.config.get('timeout_max', 0.6)
+        )
+
+    @property
+    def is_configured(self) -> bool:
+        """Заданы ли ключ и каталог YandexGPT."""
+        return bool(self.config.get('api_key') and self.config.get('folder_id'))
 
     async def classify(
         self,
@@ -157,6 +256,10 @@ class AIIntentClassifier:
         - entities: Dict[str, Any]
         - is_relevant: bool
         """
+        if not self.is_configured:
+            raise RuntimeError("YandexGPT не настроен")
+        self._ensure_circuit_closed()
+
         prompt = self._build_prompt(message)
         response_data = await self._call_api_with_retry(prompt)
 
@@ -171,46 +274,75 @@ class AIIntentClassifier:
             intent_list=intent_list
         )
 
-    async def _call_api_with_retry(self, prompt: str, attempts: int = 2) -> str:
+    async def _call_api_with_retry(
+        self,
+        prompt: str,
+        attempts: int = 2,
+        max_tokens: Optional[int] = None
+    ) -> str:
         """
         Вызов YandexGPT с повтором при неудаче (до 2 попыток).
-        Ограничиваем общее время, чтобы уложиться ≤ 300 мс (зависит от сети).
+        Общий бюджет времени адаптивный: p95 наблюдаемой задержки с запасом.
+        Исход вызова учитывается circuit breaker'ом; при разомкнутой цепи
+        сразу бросается CircuitOpenError без сетевого запроса.
         """
-        # Суммарный таймаут на все попытки, например 0.3 секунды
-        # (можно тонко настраивать)
-        start_time = time.perf_counter()
+        if not self.breaker.allow():
+            raise CircuitOpenError("YandexGPT временно отключён (circuit open)")
 
-        for attempt in range(1, attempts + 1):
-            try:
-                timeout_left = 0.3 - (time.perf_counter() - start_time)
-                if timeout_left <= 0:
-                    raise asyncio.TimeoutError("Превышен 300мс таймаут")
-
-                async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout_left)) as session:
-                    data = {
-                        "folder_id": self.config['folder_id'],
-                        "prompt": prompt,
-                        "model": self.config['model'],
-                        "temperature": self.config['temperature'],
-                        "max_tokens": self.config['max_tokens']
-                    }
-                    headers = {
-                        "Authorization": f"Api-Key {self.config['api_key']}",
-                        "Content-Type": "application/json"
-                    }
-                    url = "https://yandex-cloud-ml.yandex.net/ai/text/generate"  # Примерный эндпоинт
-                    async with session.post(url, json=data, headers=headers) as resp:
-                        if resp.status == 200:
-                            raw_text = await resp.text()
-                            return raw_text
-                        else:
-                            logger.warning(f"[Attempt {attempt}] YandexGPT Error: {resp.status}")
-            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
-                logger.warning(f"[Attempt {attempt}] Ошибка при вызове YandexGPT: {e}")
+        # Суммарный таймаут на все попытки
+        budget = self.timeout.current
+        start_time = time.perf_counter()
 
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    timeout_left = budget - (time.perf_counter() - start_time)
+                    if timeout_left <= 0:
+                        raise asyncio.TimeoutError(f"Превышен таймаут {budget * 1000:.0f}мс")
+
+                    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout_left)) as session:
+                        data = {
+                            "folder_id": self.config['folder_id'],
+                            "prompt": prompt,
+                            "model": self.config['model'],
+                            "temperature": self.config['temperature'],
+                            "max_tokens": max_tokens or self.config['max_tokens']
+                        }
+                        headers = {
+                            "Authorization": f"Api-Key {self.config['api_key']}",
+                            "Content-Type": "application/json"
+                        }
+                        url = "https://yandex-cloud-ml.yandex.net/ai/text/generate"  # Примерный эндпоинт
+                        async with session.post(url, json=data, headers=headers) as resp:
+                            if resp.status == 200:
+                                raw_text = await resp.text()
+                                self.timeout.observe(time.perf_counter() - start_time)
+                                self.breaker.record_success()
+                                return raw_text
+                            else:
+                                logger.debug(f"[Attempt {attempt}] YandexGPT Error: {resp.status}")
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    logger.debug(f"[Attempt {attempt}] Ошибка при вызове YandexGPT: {e}")
+
+        except asyncio.CancelledError:
+            # Отмена запроса клиента — не ошибка сервиса, но пробу нужно освободить
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        # Таймаут тоже учитываем в статистике задержек, иначе p95 не вырастет
+        self.timeout.observe(time.perf_counter() - start_time)
+        self.breaker.record_failure()
         # Если все попытки неудачны — бросаем исключение
         raise RuntimeError("Не удалось получить ответ от YandexGPT")
 
+    def _ensure_circuit_closed(self) -> None:
+        """Быстрая проверка без резервирования пробного вызова."""
+        if self.breaker.state is CircuitState.OPEN:
+            raise CircuitOpenError("YandexGPT временно отключён (circuit open)")
+
     def _parse_response(self, raw_response: str, message: str) -> IntentResult:
         """
         Парсит ответ в формате JSON. В случае ошибки возвращает OFF_TOPIC.
@@ -218,22 +350,9 @@ class AIIntentClassifier:
         try:
             # Предполагаем, что в raw_response пришёл JSON
             data = json.loads(raw_response)
-
-            # Приводим confidence к 0..1
-            confidence_raw = data.get("confidence", 0)
-            if confidence_raw > 1:
-                confidence_raw = confidence_raw / 100.0  # если к примеру, пришли проценты
-
-            result = IntentResult(
-                primary_intent=data.get("intent", "OFF_TOPIC"),
-                confidence=float(confidence_raw),
-                entities=data.get("entities", {}),
-                is_relevant=bool(data.get("is_relevant", False))
-            )
-            return result
+            return self._result_from_dict(data)
         except json.JSONDecodeError:
-            logger.error(f"Ошибка парсинга JSON, ответ:
-{raw_response}")
+            logger.error(f"Ошибка парсинга JSON, ответ:\n{raw_response}")
             # Fallback
             return IntentResult(
                 primary_intent="OFF_TOPIC",
@@ -242,24 +361,181 @@ class AIIntentClassifier:
                 is_relevant=False
             )
 
+    @staticmethod
+    def _result_from_dict(data: Dict[str, Any]) -> IntentResult:
+        # Приводим confidence к 0..1
+        confidence_raw = data.get("confidence", 0)
+        if confidence_raw > 1:
+            confidence_raw = confidence_raw / 100.0  # если к примеру, пришли проценты
+
+        return IntentResult(
+            primary_intent=data.get("intent", "OFF_TOPIC"),
+            confidence=float(confidence_raw),
+            entities=data.get("entities", {}),
+            is_relevant=bool(data.get("is_relevant", False))
+        )
+
+
+# ================== Батчинг запросов к YandexGPT ================== #
+
+class BatchingIntentClassifier(AIIntentClassifier):
+    """
+    Классификатор с микро-батчингом.
+
+    Сообщения, пришедшие в течение `batch_window_ms` (или пока не набралось
+    `batch_max_size`), отправляются одним промптом; ответ-массив разбирается
+    обратно в IntentResult, и каждый вызывающий получает свой результат
+    через future. Под нагрузкой это сокращает число HTTP-запросов и
+    бережёт rate limit провайдера.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None) -> None:
+        super().__init__(config)
+        self.window = self.config.get('batch_window_ms', 5.0) / 1000.0
+        self.max_batch = max(1, int(self.config.get('batch_max_size', 16)))
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._pending_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def classify(
+        self,
+        message: str,
+        context: Optional[Dict] = None
+    ) -> IntentResult:
+        if not self.is_configured:
+            raise RuntimeError("YandexGPT не настроен")
+        self._ensure_circuit_closed()
+
+        loop = asyncio.get_running_loop()
+        # Батч привязан к своему event loop (is_relevant запускает временный loop)
+        if self._pending_loop is not None and self._pending_loop is not loop:
+            return await super().classify(message, context)
+
+        future = loop.create_future()
+        self._pending.append((message, future))
+        self._pending_loop = loop
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        self._pending_loop = None
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Одинаковые сообщения внутри окна классифицируем один раз
+        messages = list(dict.fromkeys(message for message, _ in batch))
+
+        try:
+            if len(messages) == 1:
+                results = {messages[0]: await super().classify(messages[0])}
+            else:
+                prompt = self._build_batch_prompt(messages)
+                raw_response = await self._call_api_with_retry(
+                    prompt,
+                    max_tokens=self.config['batch_tokens_per_message'] * len(messages)
+                )
+                results = self._parse_batch_response(raw_response, messages)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for message, future in batch:
+            if future.done():
+                continue
+            result = results.get(message)
+            if result is None:
+                future.set_exception(RuntimeError("YandexGPT не вернул результат для сообщения"))
+            else:
+                future.set_result(result)
+
+    def _build_batch_prompt(self, messages: List[str]) -> str:
+        intent_list = ", ".join(list(INTENT_TYPES.keys()))
+        return BATCH_PROMPT_TEMPLATE.format(
+            messages=json.dumps(messages, ensure_ascii=False),
+            intent_list=intent_list,
+            count=len(messages)
+        )
+
+    def _parse_batch_response(self, raw_response: str, messages: List[str]) -> Dict[str, IntentResult]:
+        """
+        Разбирает JSON-массив ответов. Элементы сопоставляются по полю
+        index, а при его отсутствии — по позиции. Сообщения без валидного
+        элемента в ответ не попадают (для них сработает fallback).
+        """
+        try:
+            data = json.loads(raw_response)
+        except json.JSONDecodeError:
+            logger.error(f"Ошибка парсинга JSON батча, ответ:\n{raw_response}")
+            return {}
+
+        if isinstance(data, dict):
+            data = data.get("results", [])
+        if not isinstance(data, list):
+            return {}
+
+        results: Dict[str, IntentResult] = {}
+        for position, item in enumerate(data):
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index", position)
+            if not isinstance(index, int) or not 0 <= index < len(messages):
+                continue
+            try:
+                results[messages[index]] = self._result_from_dict(item)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Некорректный элемент ответа батча #{index}: {e}")
+        return results
+
 
 # ================== Гибридная система (AI + Rule-based) ================== #
 
 class HybridIntentChecker:
     """
-    Гибрид AI + Rule-based. Предоставляет метод is_relevant (старый, синхронный)
+    Гибрид Local + AI + Rule-based. Предоставляет метод is_relevant (старый, синхронный)
     и новый метод classify_async (асинхронный).
+
+    Порядок уровней: кэш → локальная модель (если уверена) → YandexGPT → правила.
     """
 
-    def __init__(self):
-        # Новый AI-классификатор
-        self.ai = AIIntentClassifier()
+    def __init__(
+        self,
+        local_model=None,
+        local_min_confidence: Optional[float] = None,
+        cache: Optional[IntentCache] = None
+    ):
+        # Локальная модель (NumPy, в процессе) — быстрый первый уровень
+        self.local = local_model if local_model is not None else load_local_model()
+        self.local_min_confidence = (
+            local_min_confidence
+            if local_min_confidence is not None
+            else LOCAL_MODEL_CONFIG['min_confidence']
+        )
+        # Новый AI-классификатор (с микро-батчингом, если включён)
+        self.ai = BatchingIntentClassifier() if YAGPT_CONFIG['batch_mode'] else AIIntentClassifier()
         # Старый класс правил
         self.rules = IntentChecker()
-        # Кэш для быстрых повторных обращений
-        self.cache = cachetools.LRUCache(maxsize=1000)
-        # Для хранения логов
-        self.classification_logs = []
+        # Кэш для быстрых повторных обращений (нормализованный ключ, TTL, Redis L2)
+        self.cache = cache if cache is not None else IntentCache(IntentResult, redis_factory=build_redis_client)
+        # Ограниченный буфер логов, сбрасывается пачками фоновой задачей
+        self.classification_logs = ClassificationLogBuffer()
 
     def is_relevant(self, message: str) -> bool:
         """
@@ -267,63 +543,126 @@ class HybridIntentChecker:
         Остаётся без изменений для обратной совместимости.
         При возникновении ошибок или таймаута - fallback на rule-based.
         """
-        # Проверяем кэш (ключ - просто само сообщение)
-        if message in self.cache:
-            cached_result: IntentResult = self.cache[message]
+        # Проверяем кэш (только L1: Redis доступен лишь асинхронно)
+        cached_result = self.cache.get(message)
+        if cached_result is not None:
             return cached_result.is_relevant
 
+        # Локальная модель не требует event loop
+        local_result = self._classify_local(message)
+        if local_result is not None:
+            self._log_classification(message, local_result, source="local")
+            self.cache.set(message, local_result, source="local")
+            return local_result.is_relevant
+
         # Запускаем event loop временно (async <-> sync)
         try:
-            result = asyncio.run(self.classify_async(message))
-            # Сохраняем в кэш
-            self.cache[message] = result
+            result = asyncio.run(self._classify_once(message))
             return result.is_relevant
         except Exception as e:
             logger.warning(f"AI классификатор недоступен, fallback на rules: {e}")
             return self.rules.is_relevant(message)
 
+    async def _classify_once(self, message: str) -> IntentResult:
+        # Redis-клиент этого event loop закрывается в нём же: loop живёт один вызов
+        try:
+            return await self.classify_async(message)
+        finally:
+            await self.cache.aclose()
+
     async def classify_async(
         self,
         message: str,
         context: Optional[Dict] = None
     ) -> IntentResult:
         """
-        Новая асинхронная классификация: сначала AI, при ошибке fallback к rules.
+        Новая асинхронная классификация: сначала локальная модель,
+        при низкой уверенности AI, при ошибке fallback к rules.
         """
         # Проверяем кэш
-        if message in self.cache:
-            cached_result: IntentResult = self.cache[message]
+        cached_result = await self.cache.aget(message)
+        if cached_result is not None:
             return cached_result
 
+        # Уверенный ответ локальной модели не требует сетевого вызова
+        with span("intent.local"):
+            local_result = self._classify_local(message)
+        if local_result is not None:
+            self._log_classification(message, local_result, source="local")
+            await self.cache.aset(message, local_result, source="local")
+            return local_result
+
+        # Без ключей YandexGPT сразу используем правила
+        if not self.ai.is_configured:
+            return await self._fallback(message)
+
         # Пробуем AI
         try:
-            ai_result = await self.ai.classify(message, context)
+            with span("intent.ai"):
+                ai_result = await self.ai.classify(message, context)
 
             # Логируем результат
             self._log_classification(message, ai_result)
 
             # Сохраняем в кэш
-            self.cache[message] = ai_result
+            await self.cache.aset(message, ai_result, source="ai")
             return ai_result
 
+        except CircuitOpenError:
+            # Цепь разомкнута: без сети и без логов на каждое сообщение
+            return await self._fallback(message)
         except Exception as e:
-            logger.error(f"Ошибка AI-классификации: {e}", exc_info=True)
-            # Fallback: rule-based
-            rule_is_rel = self.rules.is_relevant(message)
-            fallback_result = IntentResult(
-                primary_intent="OFF_TOPIC" if not rule_is_rel else "INFO_COMPANY",
-                confidence=0.5,
-                entities={},
-                is_relevant=rule_is_rel
-            )
-            self._log_classification(message, fallback_result, fallback=True)
-            self.cache[message] = fallback_result
-            return fallback_result
+            # Сбои сервиса видны по переходам circuit breaker'а, здесь — только debug
+            logger.debug(f"Ошибка AI-классификации: {e}", exc_info=True)
+            return await self._fallback(message)
+
+    async def _fallback(self, message: str) -> IntentResult:
+        """
+        Fallback: rule-based классификация.
+        Кэшируется с коротким TTL, чтобы сбой YandexGPT не закреплялся.
+        """
+        rule_is_rel = self.rules.is_relevant(message)
+        fallback_result = IntentResult(
+            primary_intent="OFF_TOPIC" if not rule_is_rel else "INFO_COMPANY",
+            confidence=0.5,
+            entities={},
+            is_relevant=rule_is_rel
+        )
+        self._log_classification(message, fallback_result, fallback=True, source="rules")
+        await self.cache.aset(message, fallback_result, source="rules")
+        return fallback_result
 
-    def _log_classification(self, message: str, result: IntentResult, fallback: bool = False) -> None:
+    def _classify_local(self, message: str) -> Optional[IntentResult]:
         """
-        Регистрация классификации (можно сохранять в БД, писать в файл и т.д.)
-        Сейчас - просто в memory-лог.
+        Классификация локальной моделью. Возвращает None, если модели нет
+        или её уверенность ниже порога (тогда решает YandexGPT).
+        """
+        if self.local is None:
+            return None
+        try:
+            intent, confidence = self.local.predict(message)
+        except Exception as e:
+            logger.debug(f"Локальная модель не смогла классифицировать сообщение: {e}")
+            return None
+        if confidence < self.local_min_confidence:
+            return None
+        return IntentResult(
+            primary_intent=intent,
+            confidence=confidence,
+            entities={},
+            is_relevant=intent not in IRRELEVANT_INTENTS
+        )
+
+    def _log_classification(
+        self,
+        message: str,
+        result: IntentResult,
+        fallback: bool = False,
+        source: str = "ai"
+    ) -> None:
+        """
+        Регистрация классификации в кольцевом буфере.
+        В MongoDB/файл записи уходят пачками (см. utils.intent_logs).
         """
         record = {
             "timestamp": time.time(),
@@ -331,10 +670,14 @@ class HybridIntentChecker:
             "primary_intent": result.primary_intent,
             "confidence": result.confidence,
             "is_relevant": result.is_relevant,
-            "fallback_used": fallback
+            "fallback_used": fallback,
+            "source": source
         }
-        self.classification_logs.append(record)
-        logger.info(f"[Classification] {record}")
+        self.classification_logs.add(record)
+        logger.debug(
+            "[Classification] %s → %s (%.2f, %s)", message[:80], result.primary_intent, result.confidence, source,
+            extra={"intent": result.primary_intent, "source": source}
+        )
 
 # Глобальный экземпляр гибридной системы (рекомендованный для использования)
 intent_checker = HybridIntentChecker()
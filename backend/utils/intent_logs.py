@@ -0,0 +1,206 @@
+"""
+Телеметрия классификации намерений
+==================================
+Ограниченный кольцевой буфер записей HybridIntentChecker с фоновым
+сбросом пачками:
+
+* память фиксирована (``deque(maxlen=...)``, старые записи вытесняются);
+* запись на горячем пути — O(1) без логирования и I/O;
+* фоновая задача раз в ``flush_interval`` секунд сбрасывает накопленное
+  одним ``insert_many`` в коллекцию ``intent_logs`` или дописывает в
+  локальный JSONL-файл (его же читает ``python -m utils.intent_model train``);
+* сэмплирование по источнику результата (ai / local / rules).
+
+Настройка через окружение:
+    INTENT_LOG_SINK=mongo|file|none
+    INTENT_LOG_FILE=/var/log/neuroexpert/intent_logs.jsonl
+    INTENT_LOG_SAMPLE_RATES="ai=1,local=0.1,rules=0.5"
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Protocol
+
+from utils.log_pipeline import parse_sample_rates
+
+logger = logging.getLogger("neuroexpert.intent_logs")
+
+INTENT_LOG_CONFIG = {
+    'maxlen': int(os.getenv('INTENT_LOG_MAXLEN', '5000')),
+    'flush_interval': float(os.getenv('INTENT_LOG_FLUSH_SECONDS', '5')),
+    'flush_batch': int(os.getenv('INTENT_LOG_FLUSH_BATCH', '1000')),
+    'sink': os.getenv('INTENT_LOG_SINK', 'mongo').lower(),
+    'file': os.getenv('INTENT_LOG_FILE', 'intent_logs.jsonl'),
+    'collection': 'intent_logs',
+    'sample_rates': os.getenv('INTENT_LOG_SAMPLE_RATES', ''),
+}
+
+# Код ошибки MongoDB для нарушения уникального индекса
+_DUPLICATE_KEY = 11000
+
+
+class LogSink(Protocol):
+    async def write(self, records: list[dict[str, Any]]) -> None: ...
+
+
+class MongoLogSink:
+    """Сброс пачкой в коллекцию MongoDB."""
+
+    def __init__(self, database: Callable[[], Any], collection: str = INTENT_LOG_CONFIG['collection']) -> None:
+        # Фабрика базы, а не база: клиент пересоздаётся при смене event loop
+        self.database = database
+        self.collection = collection
+
+    async def write(self, records: list[dict[str, Any]]) -> None:
+        from pymongo.errors import BulkWriteError
+
+        try:
+            await self.database()[self.collection].insert_many(records, ordered=False)
+        except BulkWriteError as exc:
+            # insert_many проставляет _id в записи: при повторе пачки после
+            # частичного успеха уже записанные _id — не ошибка
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != _DUPLICATE_KEY for error in errors):
+                raise
+
+
+class FileLogSink:
+    """Дозапись в локальный JSONL-файл (I/O выполняется в пуле потоков)."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+
+    async def write(self, records: list[dict[str, Any]]) -> None:
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        await asyncio.to_thread(self._append, payload)
+
+    def _append(self, payload: str) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(payload)
+
+
+class ClassificationLogBuffer:
+    """Кольцевой буфер записей классификации с фоновым сбросом."""
+
+    def __init__(
+        self,
+        maxlen: int = INTENT_LOG_CONFIG['maxlen'],
+        sample_rates: Optional[dict[str, float]] = None,
+        default_sample_rate: float = 1.0,
+        flush_interval: float = INTENT_LOG_CONFIG['flush_interval'],
+        flush_batch: int = INTENT_LOG_CONFIG['flush_batch'],
+    ) -> None:
+        self._records: deque[dict[str, Any]] = deque(maxlen=maxlen)
+        self.sample_rates = (
+            sample_rates if sample_rates is not None
+            else parse_sample_rates(INTENT_LOG_CONFIG['sample_rates'])
+        )
+        self.default_sample_rate = default_sample_rate
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.sink: Optional[LogSink] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.sampled_out = 0
+        self.flushed = 0
+
+    # ──────────────────────────────
+    # Горячий путь
+    # ──────────────────────────────
+
+    def add(self, record: dict[str, Any]) -> bool:
+        """Добавить запись (с учётом сэмплирования). True, если запись принята."""
+        rate = self.sample_rates.get(record.get("source", ""), self.default_sample_rate)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+        if len(self._records) == self._records.maxlen:
+            self.dropped += 1
+        self._records.append(record)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self._records)
+
+    def __getitem__(self, index: int) -> dict[str, Any]:
+        return self._records[index]
+
+    # ──────────────────────────────
+    # Сброс
+    # ──────────────────────────────
+
+    async def flush(self) -> int:
+        """Сбросить накопленные записи в sink. Возвращает число записанных."""
+        if self.sink is None:
+            return 0
+        written = 0
+        while self._records:
+            batch = [
+                self._records.popleft()
+                for _ in range(min(self.flush_batch, len(self._records)))
+            ]
+            try:
+                await self.sink.write(batch)
+            except Exception as exc:  # noqa: BLE001
+                # Возвращаем пачку в начало буфера (сколько влезет) и ждём следующего цикла
+                free = self._records.maxlen - len(self._records)
+                self._records.extendleft(reversed(batch[-free:] if free else []))
+                self.dropped += len(batch) - min(free, len(batch))
+                logger.warning("Не удалось сбросить %s записей классификации: %s", len(batch), exc)
+                break
+            written += len(batch)
+        self.flushed += written
+        return written
+
+    def start(self, sink: Optional[LogSink]) -> None:
+        """Запустить фоновый сброс в текущем event loop."""
+        self.sink = sink
+        if sink is None or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run(), name="intent-log-flusher")
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и сбросить остаток."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "buffered": len(self._records),
+            "capacity": self._records.maxlen,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+
+def build_sink(database: Optional[Callable[[], Any]] = None) -> Optional[LogSink]:
+    """Sink по INTENT_LOG_SINK: mongo (если есть фабрика БД), file или none."""
+    kind = INTENT_LOG_CONFIG['sink']
+    if kind == "file":
+        return FileLogSink(INTENT_LOG_CONFIG['file'])
+    if kind == "mongo" and database is not None:
+        return MongoLogSink(database)
+    return None
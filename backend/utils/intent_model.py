@@ -0,0 +1,379 @@
+"""
+Локальный классификатор намерений
+=================================
+TF-IDF по символьным n-граммам + линейная softmax-модель на NumPy.
+
+Работает целиком на CPU внутри процесса и отвечает за десятки микросекунд,
+поэтому стоит перед YandexGPT в HybridIntentChecker: уверенные ответы
+возвращаются сразу, неуверенные уходят в удалённый классификатор.
+
+Формат модели — директория из двух файлов:
+
+* ``meta.json``   — версия формата, метки, bias, параметры n-грамм;
+* ``weights.npy`` — матрица float32 ``[n_features, 1 + n_labels]``:
+  столбец 0 — IDF признака, остальные — веса по меткам. Матрица открывается
+  через ``np.load(mmap_mode="r")``: несколько воркеров делят одни страницы
+  page cache, а при предсказании за один gather читаются и IDF, и веса.
+
+Обучение (данные — JSONL с записями классификаций из HybridIntentChecker:
+файл INTENT_LOG_FILE или ``mongoexport --collection intent_logs``):
+
+    cd backend
+    python -m utils.intent_model train --logs intent_logs.jsonl --out models/intent_model
+    python -m utils.intent_model predict --model models/intent_model "сколько стоит сайт"
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("neuroexpert.intent_model")
+
+MODEL_FORMAT_VERSION = 1
+META_FILE = "meta.json"
+WEIGHTS_FILE = "weights.npy"
+
+DEFAULT_N_FEATURES = 1 << 16
+DEFAULT_NGRAM_RANGE = (2, 4)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+# ──────────────────────────────
+# Признаки
+# ──────────────────────────────
+
+def _normalize_text(text: str) -> str:
+    return f" {_WHITESPACE_RE.sub(' ', text.lower()).strip()} "
+
+
+def extract_features(
+    text: str,
+    ngram_range: tuple[int, int] = DEFAULT_NGRAM_RANGE,
+    n_features: int = DEFAULT_N_FEATURES,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Хэшированные символьные n-граммы сообщения.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        Уникальные индексы признаков (int64) и сублинейный TF (float32).
+    """
+    normalized = _normalize_text(text)
+    hashes: list[int] = []
+    low, high = ngram_range
+    for n in range(low, high + 1):
+        for start in range(len(normalized) - n + 1):
+            hashes.append(zlib.crc32(normalized[start:start + n].encode("utf-8")))
+
+    if not hashes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    indices, counts = np.unique(
+        np.asarray(hashes, dtype=np.int64) % n_features,
+        return_counts=True,
+    )
+    tf = (1.0 + np.log(counts)).astype(np.float32)
+    return indices, tf
+
+
+# ──────────────────────────────
+# Модель
+# ──────────────────────────────
+
+@dataclass(slots=True)
+class LocalIntentModel:
+    """Линейная модель поверх хэшированного TF-IDF."""
+
+    labels: list[str]
+    weights: np.ndarray
+    bias: np.ndarray
+    ngram_range: tuple[int, int] = DEFAULT_NGRAM_RANGE
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def n_features(self) -> int:
+        return int(self.weights.shape[0])
+
+    def _vectorize(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        indices, tf = extract_features(text, self.ngram_range, self.n_features)
+        if not indices.size:
+            return indices, np.empty((0, self.weights.shape[1]), dtype=np.float32)
+        rows = np.asarray(self.weights[indices])
+        values = tf * rows[:, 0]
+        norm = float(np.linalg.norm(values))
+        if norm > 0:
+            values /= norm
+        return values, rows[:, 1:]
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        """Распределение вероятностей по ``labels``."""
+        values, rows = self._vectorize(text)
+        logits = self.bias.astype(np.float32, copy=True)
+        if values.size:
+            logits += values @ rows
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Наиболее вероятное намерение и его вероятность."""
+        proba = self.predict_proba(text)
+        best = int(np.argmax(proba))
+        return self.labels[best], float(proba[best])
+
+    # ──────────────────────────────
+    # Сериализация
+    # ──────────────────────────────
+
+    def save(self, path: str | Path) -> Path:
+        target = Path(path)
+        target.mkdir(parents=True, exist_ok=True)
+        np.save(target / WEIGHTS_FILE, np.ascontiguousarray(self.weights, dtype=np.float32))
+        meta = {
+            "format_version": MODEL_FORMAT_VERSION,
+            "labels": self.labels,
+            "bias": [float(value) for value in self.bias],
+            "ngram_range": list(self.ngram_range),
+            "n_features": self.n_features,
+            **self.metadata,
+        }
+        (target / META_FILE).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        return target
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> "LocalIntentModel":
+        source = Path(path)
+        meta = json.loads((source / META_FILE).read_text(encoding="utf-8"))
+        if meta.get("format_version") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия модели: {meta.get('format_version')}")
+
+        weights = np.load(source / WEIGHTS_FILE, mmap_mode="r" if mmap else None)
+        labels = list(meta["labels"])
+        if weights.shape != (meta["n_features"], len(labels) + 1):
+            raise ValueError(f"Размер весов {weights.shape} не совпадает с meta.json")
+
+        extra = {
+            key: value
+            for key, value in meta.items()
+            if key not in {"format_version", "labels", "bias", "ngram_range", "n_features"}
+        }
+        return cls(
+            labels=labels,
+            weights=weights,
+            bias=np.asarray(meta["bias"], dtype=np.float32),
+            ngram_range=tuple(meta["ngram_range"]),
+            metadata=extra,
+        )
+
+
+# ──────────────────────────────
+# Обучение
+# ──────────────────────────────
+
+def train(
+    samples: Sequence[tuple[str, str]],
+    labels: Sequence[str],
+    n_features: int = DEFAULT_N_FEATURES,
+    ngram_range: tuple[int, int] = DEFAULT_NGRAM_RANGE,
+    epochs: int = 40,
+    learning_rate: float = 2.0,
+    l2: float = 1e-5,
+    batch_size: int = 256,
+    seed: int = 13,
+) -> LocalIntentModel:
+    """
+    Обучить softmax-регрессию мини-батчевым градиентным спуском.
+
+    Разреженность соблюдается вручную (без scipy): строки батча
+    склеиваются в плоские массивы индексов/значений, логиты считаются
+    через ``np.add.reduceat``, градиент раскладывается через ``np.add.at``.
+    """
+    label_index = {label: idx for idx, label in enumerate(labels)}
+    featurized: list[tuple[np.ndarray, np.ndarray, int]] = []
+    for text, label in samples:
+        if label not in label_index:
+            continue
+        indices, tf = extract_features(text, ngram_range, n_features)
+        if indices.size:
+            featurized.append((indices, tf, label_index[label]))
+
+    if not featurized:
+        raise ValueError("Нет пригодных примеров для обучения")
+
+    n_samples = len(featurized)
+    n_labels = len(labels)
+
+    df = np.zeros(n_features, dtype=np.float64)
+    for indices, _, _ in featurized:
+        df[indices] += 1.0
+    idf = (np.log((1.0 + n_samples) / (1.0 + df)) + 1.0).astype(np.float32)
+
+    rows_idx: list[np.ndarray] = []
+    rows_val: list[np.ndarray] = []
+    targets = np.empty(n_samples, dtype=np.int64)
+    for row, (indices, tf, target) in enumerate(featurized):
+        values = tf * idf[indices]
+        values /= np.linalg.norm(values)
+        rows_idx.append(indices)
+        rows_val.append(values)
+        targets[row] = target
+
+    weights = np.zeros((n_features, n_labels), dtype=np.float32)
+    bias = np.zeros(n_labels, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+
+    for epoch in range(epochs):
+        order = rng.permutation(n_samples)
+        for start in range(0, n_samples, batch_size):
+            batch = order[start:start + batch_size]
+            flat_idx = np.concatenate([rows_idx[i] for i in batch])
+            flat_val = np.concatenate([rows_val[i] for i in batch])
+            lengths = np.fromiter((rows_idx[i].size for i in batch), dtype=np.int64, count=batch.size)
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+            logits = np.add.reduceat(weights[flat_idx] * flat_val[:, None], offsets, axis=0) + bias
+            logits -= logits.max(axis=1, keepdims=True)
+            proba = np.exp(logits)
+            proba /= proba.sum(axis=1, keepdims=True)
+            proba[np.arange(batch.size), targets[batch]] -= 1.0
+            proba /= batch.size
+
+            grad = np.zeros_like(weights)
+            np.add.at(grad, flat_idx, flat_val[:, None] * np.repeat(proba, lengths, axis=0))
+            touched = np.unique(flat_idx)
+            grad[touched] += l2 * weights[touched]
+
+            weights -= learning_rate * grad
+            bias -= learning_rate * proba.sum(axis=0)
+
+        logger.debug("Эпоха %s/%s завершена", epoch + 1, epochs)
+
+    return LocalIntentModel(
+        labels=list(labels),
+        weights=np.hstack([idf[:, None], weights]),
+        bias=bias,
+        ngram_range=ngram_range,
+        metadata={"trained_at": time.time(), "n_samples": n_samples},
+    )
+
+
+def iter_training_samples(
+    records: Iterable[dict],
+    labels: Sequence[str],
+    min_confidence: float = 0.6,
+) -> Iterator[tuple[str, str]]:
+    """
+    Отобрать примеры из логов классификации.
+
+    Берутся только ответы удалённого классификатора: fallback-записи и
+    собственные ответы локальной модели исключаются, чтобы не учиться
+    на эвристиках и не закреплять свои же ошибки. Для повторяющихся
+    сообщений побеждает последняя запись.
+    """
+    allowed = set(labels)
+    latest: dict[str, str] = {}
+    for record in records:
+        if record.get("fallback_used") or record.get("source") == "local":
+            continue
+        message = (record.get("message") or "").strip()
+        intent = record.get("primary_intent")
+        if not message or intent not in allowed:
+            continue
+        if float(record.get("confidence", 0.0)) < min_confidence:
+            continue
+        latest[message] = intent
+    yield from latest.items()
+
+
+def load_jsonl(path: str | Path) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Пропущена битая строка %s:%s", path, line_no)
+
+
+# ──────────────────────────────
+# CLI
+# ──────────────────────────────
+
+def _cmd_train(args: argparse.Namespace) -> int:
+    from utils.intent_checker import INTENT_TYPES
+
+    labels = list(INTENT_TYPES.keys())
+    records: list[dict] = []
+    for path in args.logs:
+        records.extend(load_jsonl(path))
+    samples = list(iter_training_samples(records, labels, min_confidence=args.min_confidence))
+    print(f"Записей: {len(records)}, примеров для обучения: {len(samples)}")
+
+    started = time.perf_counter()
+    model = train(
+        samples,
+        labels,
+        n_features=1 << args.hash_bits,
+        epochs=args.epochs,
+        learning_rate=args.learning_rate,
+    )
+    target = model.save(args.out)
+
+    correct = sum(1 for text, label in samples if model.predict(text)[0] == label)
+    print(
+        f"Модель сохранена в {target} за {time.perf_counter() - started:.1f}s, "
+        f"точность на обучении: {correct / len(samples):.3f}"
+    )
+    return 0
+
+
+def _cmd_predict(args: argparse.Namespace) -> int:
+    model = LocalIntentModel.load(args.model)
+    for text in args.messages:
+        started = time.perf_counter()
+        label, confidence = model.predict(text)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(f"{label}\t{confidence:.3f}\t{elapsed_us:.0f}us\t{text}")
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Локальный классификатор намерений NeuroExpert")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = sub.add_parser("train", help="Обучить модель по JSONL-логам классификации")
+    train_parser.add_argument("--logs", nargs="+", required=True, help="Файлы JSONL с записями классификации")
+    train_parser.add_argument("--out", required=True, help="Директория для модели")
+    train_parser.add_argument("--min-confidence", type=float, default=0.6)
+    train_parser.add_argument("--hash-bits", type=int, default=16)
+    train_parser.add_argument("--epochs", type=int, default=40)
+    train_parser.add_argument("--learning-rate", type=float, default=2.0)
+    train_parser.set_defaults(func=_cmd_train)
+
+    predict_parser = sub.add_parser("predict", help="Классифицировать сообщения")
+    predict_parser.add_argument("--model", required=True)
+    predict_parser.add_argument("messages", nargs="+")
+    predict_parser.set_defaults(func=_cmd_predict)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
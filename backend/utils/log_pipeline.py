@@ -0,0 +1,187 @@
+"""
+Неблокирующий конвейер логирования
+==================================
+Общая настройка логов для backend/server.py и frontend/api/index.py.
+
+* В event loop запись только проходит фильтр сэмплирования и кладётся
+  в очередь (``QueueHandler`` без предварительного форматирования).
+* ``QueueListener`` в фоновом потоке форматирует записи через orjson и
+  пишет в stderr.
+* В JSON попадают все поля из ``extra`` (request_id, duration_ms, ...),
+  а не только заранее перечисленные.
+* Высокочастотные INFO-записи помечаются ``extra={"sample_key": ...}`` и
+  сэмплируются по ``LOG_SAMPLE_RATES="http.access=0.1"``. WARNING и выше
+  не сэмплируются никогда.
+* Заменяется только обработчик, установленный этим модулем (по имени
+  ``neuroexpert.log_pipeline``): обработчики uvicorn, Sentry и pytest
+  остаются на месте.
+
+Использование:
+    from utils.log_pipeline import configure_logging
+    configure_logging()
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import orjson
+
+LOG_CONFIG = {
+    'level': os.getenv('LOG_LEVEL', 'INFO').upper(),
+    'format': os.getenv('LOG_FORMAT', 'json').lower(),
+    'sample_rates': os.getenv('LOG_SAMPLE_RATES', ''),
+}
+
+# Ключи сэмплирования для высокочастотных записей
+SAMPLE_HTTP_ACCESS = "http.access"
+
+# Имя, по которому находится обработчик конвейера на корневом логгере
+HANDLER_NAME = "neuroexpert.log_pipeline"
+
+# Атрибуты LogRecord, которые не являются пользовательским extra
+_RESERVED_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__.keys()
+) | {"message", "asctime", "taskName", "sample_key"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """Разобрать строку вида ``"ai=1,local=0.1"`` в словарь долей."""
+    rates: dict[str, float] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        key, _, value = item.partition("=")
+        try:
+            rates[key.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            logging.getLogger(__name__).warning("Некорректная доля сэмплирования: %r", item)
+    return rates
+
+
+class JSONFormatter(logging.Formatter):
+    """Structured JSON logging (orjson) со всеми полями extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_data: dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+
+        if record.exc_info:
+            log_data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data["exception"] = record.exc_text
+
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                log_data[key] = value
+
+        return orjson.dumps(log_data, default=str).decode("utf-8")
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей с заданным ``sample_key``; WARNING+ — всегда."""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+        rate = self.rates.get(key, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный ``prepare`` вызывает ``format()`` (подстановка args и
+    рендеринг traceback) прямо в event loop. Здесь запись лишь копируется;
+    всё форматирование выполняет поток QueueListener. Аргументы сообщения
+    не должны мутироваться после вызова логгера (обычное требование для
+    отложенного логирования).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    sample_rates: Optional[dict[str, float]] = None,
+    fmt: Optional[str] = None,
+) -> logging.handlers.QueueListener:
+    """
+    Настроить корневой логгер на неблокирующую запись (идемпотентно).
+
+    Returns
+    -------
+    logging.handlers.QueueListener
+        Запущенный listener (останавливается через ``atexit``).
+    """
+    global _listener, _queue_handler
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, (level or LOG_CONFIG['level']).upper(), logging.INFO))
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stderr)
+    if (fmt or LOG_CONFIG['format']) == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = DeferredQueueHandler(log_queue)
+    _queue_handler.set_name(HANDLER_NAME)
+    _queue_handler.addFilter(SamplingFilter(
+        sample_rates if sample_rates is not None else parse_sample_rates(LOG_CONFIG['sample_rates'])
+    ))
+
+    # Чужие обработчики не трогаем; свой — от прошлой копии модуля (тот же
+    # файл, импортированный под другим именем) — заменяем
+    for existing in list(root.handlers):
+        if existing.get_name() == HANDLER_NAME:
+            root.removeHandler(existing)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Дописать очередь и остановить фоновый поток."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
@@ -0,0 +1,178 @@
+"""
+Prometheus-метрики NeuroExpert API
+==================================
+* RED-метрики по маршрутам: частота, ошибки (по статусу), гистограмма
+  латентности — собираются чистым ASGI middleware ``MetricsMiddleware``;
+* гистограмма стадий ``/api/chat`` (intent_check, context_build,
+  prompt_build, llm_call, db_insert, notification) через контекстный
+  менеджер ``track_stage``; он же открывает span текущей трассы
+  (utils.tracing), так что стадии попадают в access-лог и Server-Timing;
+* экспозиция для ``/api/metrics`` (при заданном ``METRICS_TOKEN`` — только с
+  ``Authorization: Bearer``, зависимость ``require_metrics_token`` общая для
+  Vercel-функции и backend/server.py) с поддержкой multiprocess-режима:
+  если задан ``PROMETHEUS_MULTIPROC_DIR`` (gunicorn/uvicorn с несколькими
+  воркерами), значения агрегируются по всем процессам через
+  ``MultiProcessCollector``.
+
+Метрики SmartContext (``smart_context_*``) и кэша намерений
+регистрируются в том же реестре и отдаются тем же эндпоинтом.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, MutableMapping
+
+from fastapi import HTTPException, Request, status
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from utils.tracing import span
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Маршрут для запросов, не совпавших ни с одним route (не раздуваем кардинальность сырыми путями)
+UNMATCHED_ROUTE = "<unmatched>"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ──────────────────────────────
+# HTTP (RED)
+# ──────────────────────────────
+HTTP_REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "HTTP requests by route template, method and status",
+    labelnames=("method", "route", "status"),
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    labelnames=("method", "route"),
+    buckets=LATENCY_BUCKETS,
+)
+
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being processed",
+    labelnames=("method",),
+    multiprocess_mode="livesum",
+)
+
+# ──────────────────────────────
+# Стадии /api/chat
+# ──────────────────────────────
+CHAT_STAGE_DURATION = Histogram(
+    "chat_stage_duration_seconds",
+    "Latency of /api/chat pipeline stages",
+    labelnames=("stage",),
+    buckets=LATENCY_BUCKETS,
+)
+
+CHAT_STAGE_ERRORS = Counter(
+    "chat_stage_errors_total",
+    "Exceptions raised inside /api/chat pipeline stages",
+    labelnames=("stage",),
+)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Измерить стадию обработки чата (работает и внутри async-функций)."""
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    except BaseException:
+        CHAT_STAGE_ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        CHAT_STAGE_DURATION.labels(stage=stage).observe(time.perf_counter() - started)
+
+
+def observe_request(method: str, route: str, status: int, duration: float) -> None:
+    HTTP_REQUESTS_TOTAL.labels(method=method, route=route, status=str(status)).inc()
+    HTTP_REQUEST_DURATION.labels(method=method, route=route).observe(duration)
+
+
+class MetricsMiddleware:
+    """
+    Чистый ASGI middleware для RED-метрик.
+
+    Метка ``route`` — шаблон маршрута (``/api/chat``), который FastAPI
+    кладёт в ``scope["route"]`` при сопоставлении, а не сырой путь.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method=method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = scope.get("route")
+            observe_request(
+                method,
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status_code,
+                time.perf_counter() - started,
+            )
+
+
+# ──────────────────────────────
+# Экспозиция
+# ──────────────────────────────
+
+def require_metrics_token(request: Request) -> None:
+    """Зависимость ``/api/metrics``: при заданном METRICS_TOKEN нужен Bearer-токен."""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Текст метрик в формате Prometheus и его content-type."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Хук для gunicorn ``child_exit``: убрать live-gauge умершего воркера."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
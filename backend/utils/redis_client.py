@@ -0,0 +1,36 @@
+"""
+Асинхронный Redis-клиент для модулей NeuroExpert.
+
+Таймауты задаёт вызывающий: кэшу намерений нужны десятки миллисекунд
+(медленный Redis не должен тормозить классификацию), аренде сессий —
+секунды (удалённый или managed Redis отвечает дольше 50 мс, а отказ
+выключает сериализацию ходов между воркерами).
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger("neuroexpert.redis")
+
+
+def build_redis(
+    url: Optional[str],
+    socket_timeout: float,
+    connect_timeout: float,
+    setting: str = "REDIS_URL",
+) -> Any:
+    """
+    ``redis.asyncio.Redis`` для ``url`` или None, если URL не задан либо
+    пакет redis не установлен. ``setting`` — переменная окружения с URL
+    (для сообщения в логе).
+    """
+    if not url:
+        return None
+    try:
+        from redis.asyncio import Redis
+    except ImportError:
+        logger.warning("%s задан, но пакет redis не установлен", setting)
+        return None
+    return Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=connect_timeout)
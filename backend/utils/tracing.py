@@ -0,0 +1,374 @@
+"""
+Лёгкая трассировка стадий запроса
+=================================
+Без внешнего коллектора и без зависимостей от OpenTelemetry SDK:
+
+* ``TracingMiddleware`` (чистый ASGI) открывает трассу на каждый HTTP-запрос
+  и кладёт её в ``scope["state"]["trace"]`` — оттуда её читает access-лог
+  (``RequestLoggingMiddleware`` добавляет поле ``stages``);
+* ``span(name)`` — вложенный участок внутри текущей трассы (через
+  ``contextvars``, работает в async-коде и в потоках ``to_thread``);
+  вне запроса — почти бесплатный no-op;
+* опционально заголовок ``Server-Timing`` (видно в DevTools браузера);
+* сэмплированные трассы экспортируются в локальный JSONL-файл в формате
+  OTLP/JSON (одна строка — один ``ExportTraceServiceRequest``), запись
+  в фоновом потоке через ограниченную очередь (переполнение — отброс).
+
+Флаг ``sampled`` входящего ``traceparent`` может только выключить запись:
+иначе любой клиент с ``…-01`` экспортировал бы каждый свой запрос мимо
+``TRACE_SAMPLE_RATE``. Включать запись по флагу можно за собственным
+шлюзом (``TRACE_TRUST_PARENT=1``).
+
+Настройка через окружение:
+    TRACE_SERVER_TIMING=1
+    TRACE_SAMPLE_RATE=0.05
+    TRACE_EXPORT_FILE=/var/log/neuroexpert/traces.jsonl
+    TRACE_EXPORT_QUEUE_SIZE=1000
+    TRACE_TRUST_PARENT=0
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator, MutableMapping, Optional
+
+import orjson
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger("neuroexpert.tracing")
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+TRACE_CONFIG = {
+    'server_timing': os.getenv('TRACE_SERVER_TIMING', '0').lower() in ('1', 'true', 'yes'),
+    'sample_rate': float(os.getenv('TRACE_SAMPLE_RATE', '0')),
+    'export_file': os.getenv('TRACE_EXPORT_FILE', ''),
+    'export_queue_size': int(os.getenv('TRACE_EXPORT_QUEUE_SIZE', '1000')),
+    'trust_parent': os.getenv('TRACE_TRUST_PARENT', '0').lower() in ('1', 'true', 'yes'),
+    'service_name': os.getenv('TRACE_SERVICE_NAME', 'neuroexpert-api'),
+}
+
+# OTLP SpanKind / StatusCode
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+_STATUS_ERROR = 2
+
+
+def _new_id(n_bytes: int) -> str:
+    return random.getrandbits(n_bytes * 8).to_bytes(n_bytes, "big").hex()
+
+
+# ──────────────────────────────
+# Модель данных
+# ──────────────────────────────
+@dataclass(slots=True)
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+@dataclass(slots=True)
+class Trace:
+    trace_id: str
+    sampled: bool
+    root: Span
+    spans: list[Span] = field(default_factory=list)
+    wall_start_ns: int = field(default_factory=time.time_ns)
+
+    @classmethod
+    def start(cls, name: str, trace_id: Optional[str] = None, sampled: bool = False) -> "Trace":
+        root = Span(name=name, span_id=_new_id(8), parent_id=None, start_ns=time.perf_counter_ns())
+        return cls(trace_id=trace_id or _new_id(16), sampled=sampled, root=root)
+
+    def finish(self) -> None:
+        if not self.root.end_ns:
+            self.root.end_ns = time.perf_counter_ns()
+
+    def summary(self) -> dict[str, float]:
+        """Длительности стадий в мс (повторяющиеся имена суммируются) — для лога."""
+        result: dict[str, float] = {}
+        for item in self.spans:
+            if item.end_ns:
+                result[item.name] = round(result.get(item.name, 0.0) + item.duration_ms, 2)
+        return result
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing по завершённым стадиям."""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.summary().items()]
+        parts.append(f"total;dur={(time.perf_counter_ns() - self.root.start_ns) / 1e6:.1f}")
+        return ", ".join(parts)
+
+    def to_otlp(self, service_name: str) -> dict[str, Any]:
+        """OTLP/JSON ``ExportTraceServiceRequest`` с одной трассой."""
+        offset = self.wall_start_ns - self.root.start_ns
+        spans = []
+        for item in (self.root, *self.spans):
+            if not item.end_ns:
+                continue
+            otlp_span: dict[str, Any] = {
+                "traceId": self.trace_id,
+                "spanId": item.span_id,
+                "name": item.name,
+                "kind": _KIND_SERVER if item is self.root else _KIND_INTERNAL,
+                "startTimeUnixNano": str(item.start_ns + offset),
+                "endTimeUnixNano": str(item.end_ns + offset),
+                "attributes": [_otlp_attribute(k, v) for k, v in item.attributes.items()],
+            }
+            if item.parent_id:
+                otlp_span["parentSpanId"] = item.parent_id
+            if item.error:
+                otlp_span["status"] = {"code": _STATUS_ERROR, "message": item.error}
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+                "scopeSpans": [{"scope": {"name": "neuroexpert.tracing"}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# ──────────────────────────────
+# Текущая трасса и вложенные участки
+# ──────────────────────────────
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("neuroexpert_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("neuroexpert_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Участок внутри текущей трассы; без активной трассы ничего не записывает."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _current_span.get() or trace.root
+    item = Span(
+        name=name,
+        span_id=_new_id(8),
+        parent_id=parent.span_id,
+        start_ns=time.perf_counter_ns(),
+        attributes=attributes,
+    )
+    trace.spans.append(item)
+    token = _current_span.set(item)
+    try:
+        yield item
+    except BaseException as exc:
+        item.error = type(exc).__name__
+        raise
+    finally:
+        item.end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
+
+
+def parse_traceparent(header: Optional[str]) -> tuple[Optional[str], Optional[bool]]:
+    """W3C ``traceparent`` → (trace_id, sampled); при ошибке формата (None, None)."""
+    if not header:
+        return None, None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or parts[1] == "0" * 32:
+        return None, None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16)
+    except ValueError:
+        return None, None
+    return parts[1].lower(), bool(flags & 0x01)
+
+
+# ──────────────────────────────
+# Экспорт
+# ──────────────────────────────
+class OTLPFileExporter:
+    """
+    Дозапись трасс в JSONL (OTLP/JSON) из фонового потока.
+
+    Горячий путь — только ``queue.put_nowait``; сериализация и I/O вне event
+    loop. Если поток не успевает, трасса отбрасывается (``dropped``), а не
+    копится в памяти.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        service_name: str = TRACE_CONFIG['service_name'],
+        max_queue: int = TRACE_CONFIG['export_queue_size'],
+    ) -> None:
+        self.path = Path(path)
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue: queue.Queue[Optional[Trace]] = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Очередь экспорта трасс переполнена, отброшено трасс: %s", self.dropped)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                return
+            batch = [trace]
+            # Дописываем всё, что успело накопиться, одним write
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch: list[Trace]) -> None:
+        payload = b"".join(orjson.dumps(t.to_otlp(self.service_name), default=str) + b"\n" for t in batch)
+        try:
+            with open(self.path, "ab") as fh:
+                fh.write(payload)
+        except OSError as exc:
+            logger.warning("Не удалось записать %s трасс в %s: %s", len(batch), self.path, exc)
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        """Дописать очередь и остановить поток."""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Экспорт трасс не успел дописать очередь до остановки")
+        thread.join(timeout)
+        self._thread = None
+
+
+def build_exporter() -> Optional[OTLPFileExporter]:
+    """Экспортёр по TRACE_EXPORT_FILE (None, если экспорт выключен)."""
+    path = TRACE_CONFIG['export_file']
+    return OTLPFileExporter(path) if path else None
+
+
+# ──────────────────────────────
+# ASGI middleware
+# ──────────────────────────────
+class TracingMiddleware:
+    """
+    Трасса на каждый HTTP-запрос.
+
+    Регистрируется внутри ``RequestLoggingMiddleware``, чтобы тот видел
+    ``scope["state"]["trace"]`` при записи access-лога.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        server_timing: bool = TRACE_CONFIG['server_timing'],
+        sample_rate: float = TRACE_CONFIG['sample_rate'],
+        exporter: Optional[OTLPFileExporter] = None,
+        trust_parent: bool = TRACE_CONFIG['trust_parent'],
+    ) -> None:
+        self.app = app
+        self.server_timing = server_timing
+        self.sample_rate = sample_rate
+        self.trust_parent = trust_parent
+        self.exporter = exporter if exporter is not None else build_exporter()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_sampled = parse_traceparent(_header(scope, b"traceparent"))
+        if parent_sampled is False or (parent_sampled and self.trust_parent):
+            sampled = parent_sampled
+        else:
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace = Trace.start(f"{scope['method']} {scope['path']}", trace_id=trace_id, sampled=sampled)
+        trace.root.attributes.update({"http.method": scope["method"], "http.target": scope["path"]})
+        scope.setdefault("state", {})["trace"] = trace
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                trace.root.attributes["http.status_code"] = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            trace.root.error = type(exc).__name__
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.finish()
+            route = scope.get("route")
+            if route is not None:
+                trace.root.name = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+            if trace.sampled and self.exporter is not None:
+                self.exporter.export(trace)
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
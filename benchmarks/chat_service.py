@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк ядра чата (services.chat_service)
+==========================================
+Гоняет ``ChatService.chat`` и ``ChatService.submit_contact`` — тот же код,
+что монтируют backend/server.py и Vercel-функция — на in-memory
+зависимостях: коллекции в памяти, LLM-заглушка с настраиваемой задержкой,
+уведомления без сети. Оптимизации ядра измеряются здесь один раз для
+обеих точек входа.
+
+Запуск:
+    python benchmarks/chat_service.py --conversations 50 --turns 4
+    python benchmarks/chat_service.py --llm-latency-ms 0 --json > chat.json
+
+``--llm-latency-ms 0`` оставляет только собственные накладные расходы
+ядра (промпт, стадии, метрики, запись в БД).
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from services.chat_service import ChatRequest, ChatService, ContactRequest  # noqa: E402
+from services.llm import LLMRequest  # noqa: E402
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.documents = []
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self.chat_messages = MemoryCollection()
+        self.contact_forms = MemoryCollection()
+
+
+class StubLLM:
+    """Детерминированный ответ после ``latency`` секунд."""
+
+    is_configured = True
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    async def complete(self, request: LLMRequest) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return f"[{request.model}] {request.message[:40]}"
+
+
+class NullNotifier:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, text: str) -> None:
+        self.sent += 1
+
+
+class MemoryContext:
+    """История из коллекции в памяти (без токенизатора и Redis)."""
+
+    def __init__(self, db: MemoryDatabase, limit: int = 10):
+        self.db = db
+        self.limit = limit
+
+    async def get_context(self, session_id, db=None, query=None):
+        messages = []
+        for record in self.db.chat_messages.documents:
+            if record["session_id"] == session_id:
+                messages.append({"role": "user", "content": record["user_message"]})
+                messages.append({"role": "assistant", "content": record["ai_response"]})
+        return messages[-self.limit:]
+
+
+def build_service(llm_latency: float) -> ChatService:
+    db = MemoryDatabase()
+    return ChatService(
+        database=lambda: db,
+        llm=StubLLM(llm_latency),
+        notifier=NullNotifier(),
+        context=MemoryContext(db),
+    )
+
+
+async def conversation(service, index, turns, timings):
+    for turn in range(turns):
+        user_data = {"name": "Bench", "contact": "+70000000000"} if turn == turns - 1 else None
+        started = time.perf_counter()
+        await service.chat(ChatRequest(f"bench-{index}", f"Сколько стоит сайт? Вопрос {turn}", user_data=user_data))
+        timings["chat"].append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    await service.submit_contact(ContactRequest("Bench", "+70000000000", "website", "bench"))
+    timings["contact"].append((time.perf_counter() - started) * 1000)
+
+
+async def run(service, conversations, turns, concurrency):
+    timings = {"chat": [], "contact": []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(index):
+        async with semaphore:
+            await conversation(service, index, turns, timings)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(guarded(i) for i in range(conversations)))
+    elapsed = time.perf_counter() - started
+    report = {name: summarize(values, elapsed) for name, values in timings.items()}
+    report["elapsed_s"] = round(elapsed, 3)
+    return report
+
+
+def summarize(timings, elapsed):
+    ordered = sorted(timings)
+
+    def pct(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+    return {
+        "count": len(ordered),
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    service = build_service(args.llm_latency_ms / 1000)
+    report = asyncio.run(run(service, args.conversations, args.turns, args.concurrency))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'operation':<10} {'count':>6} {'rps':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9}")
+    for name in ("chat", "contact"):
+        stats = report[name]
+        print(
+            f"{name:<10} {stats['count']:>6} {stats['rps']:>8} {stats['p50_ms']:>9} "
+            f"{stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
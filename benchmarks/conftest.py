@@ -0,0 +1,72 @@
+"""
+Общие фикстуры бенчмарков горячих путей (pytest-benchmark).
+
+Синтетические русскоязычные диалоги детерминированы (фиксированный seed),
+поэтому замеры разных коммитов сопоставимы.
+"""
+
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from memory import smart_context as smart_context_module  # noqa: E402
+
+TURN_COUNTS = (10, 100, 1_000, 10_000)
+
+_QUESTIONS = (
+    "Сколько стоит разработка корпоративного сайта под ключ?",
+    "Нужен чат-бот для интернет-магазина, какие сроки запуска?",
+    "Можно ли провести цифровой аудит нашего отдела продаж?",
+    "Какие гарантии вы даёте на поддержку после запуска?",
+    "Интересует интеграция ИИ-ассистента в CRM и телефонию.",
+    "Как вы считаете окупаемость автоматизации для малого бизнеса?",
+    "Привет, подскажите по мобильному приложению.",
+    "А если бюджет ограничен, что можно сделать в первую очередь?",
+)
+_ANSWERS = (
+    "Для вашей задачи подойдёт корпоративный сайт: стоимость от 150 до 300 тысяч рублей, срок 3–6 недель.",
+    "Чат-бот на базе Claude запускаем за 2–3 недели, включая интеграцию с каталогом и оплатой.",
+    "Цифровой аудит занимает 5–7 дней: анализируем воронку, CRM и скорость обработки заявок.",
+    "Даём 30–90 дней гарантийной поддержки и фиксируем сроки в договоре с компенсацией.",
+    "Интеграция ассистента с CRM снижает время ответа клиенту в среднем в 4 раза.",
+    "Окупаемость считаем по стоимости лида и конверсии; обычно проект окупается за полгода.",
+)
+
+
+def make_conversation(turns: int, seed: int = 42) -> list[dict]:
+    """Документы chat_messages в формате ChatService (один документ — один ход)."""
+    rng = random.Random(seed)
+    started = datetime(2025, 1, 1, 9, 0)
+    docs = []
+    for turn in range(turns):
+        docs.append({
+            "timestamp": started + timedelta(seconds=30 * turn),
+            "importance": round(rng.random(), 3) if rng.random() < 0.2 else 0.0,
+            "tags": ["lead"] if rng.random() < 0.05 else [],
+            "user_message": f"{rng.choice(_QUESTIONS)} (ход {turn})",
+            "ai_response": " ".join(rng.sample(_ANSWERS, k=rng.randint(1, 3))),
+        })
+    return docs
+
+
+@pytest.fixture(scope="session", autouse=True)
+def offline_tokenizer():
+    """
+    Без сети: если BPE-файлы не завендорены (scripts/vendor_tiktoken.py),
+    подсчёт токенов сразу идёт приближённой оценкой, а не попыткой скачать.
+    """
+    vendored = Path(smart_context_module.VENDORED_TIKTOKEN_DIR)
+    if not vendored.is_dir() or not any(vendored.iterdir()):
+        smart_context_module._unavailable_encodings.update({"o200k_base", "cl100k_base"})
+    return "approx" if smart_context_module._unavailable_encodings else "tiktoken"
+
+
+@pytest.fixture(scope="session")
+def conversations():
+    return {turns: make_conversation(turns) for turns in TURN_COUNTS}
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный стенд API в процессе
+================================
+Поднимает FastAPI-приложение Vercel-функции (frontend/api/index.py) со
+всеми middleware в том же процессе и гоняет через httpx.ASGITransport
+N одновременных диалогов — без сети и без удалённого preview-стенда
+(в отличие от backend_test.py / quick_backend_test.py).
+
+Подмены зависимостей:
+
+* LLM — детерминированная заглушка: задержка до первого токена и
+  потоковая выдача ответа токенами с заданным интервалом;
+* MongoDB — mongomock-motor (или локальный mongod через ``--mongo-url``);
+* Redis — fakeredis (кэш контекстов SmartContext и L2 кэша интентов);
+* Telegram — уведомления считаются, но не отправляются.
+
+Результат — JSON-артефакт с RPS и p50/p95/p99 по каждому эндпоинту;
+ключи отсортированы, поэтому отчёты разных коммитов удобно сравнивать
+(``--baseline`` печатает дельты к прошлому отчёту).
+
+Запуск:
+    python benchmarks/load_harness.py --conversations 50 --turns 4
+    python benchmarks/load_harness.py --first-token-ms 300 --token-ms 15 --output load.json
+    python benchmarks/load_harness.py --mongo-url mongodb://localhost:27017 --baseline load.json
+
+Требует mongomock-motor и fakeredis (dev-зависимости:
+``pip install -r backend/requirements-dev.txt``).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Окружение до импорта приложения: конфигурация читается при импорте
+os.environ.setdefault("MONGO_URL", "mongodb://load-harness:27017")
+os.environ.setdefault("DB_NAME", "load_harness")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["HEALTH_BACKGROUND"] = "0"
+for _name in ("YANDEX_API_KEY", "YANDEX_FOLDER_ID", "TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "REDIS_URL"):
+    os.environ.pop(_name, None)
+
+sys.path.insert(0, str(ROOT / "frontend" / "api"))
+sys.path.insert(0, str(ROOT / "backend"))
+
+import httpx  # noqa: E402
+
+from chat_service import summarize  # noqa: E402  (benchmarks/chat_service.py)
+from services.chat_service import ChatService  # noqa: E402
+from services.llm import LLMRequest  # noqa: E402
+
+CHAT_MESSAGES = (
+    "Здравствуйте! Сколько стоит разработка корпоративного сайта?",
+    "Нужен чат-бот для интернет-магазина, какие сроки?",
+    "Можно ли сделать цифровой аудит нашего бизнеса?",
+    "Какие гарантии вы даёте на разработку?",
+    "Интересует интеграция AI в CRM, сколько это будет стоить?",
+    "Какой рецепт борща самый вкусный?",
+)
+
+
+class StreamingStubLLM:
+    """
+    Детерминированная заглушка LLM-провайдера.
+
+    Ответ зависит только от сообщения; задержка — время до первого токена
+    плюс ``tokens`` × интервал между токенами (как у потокового ответа).
+    """
+
+    is_configured = True
+
+    def __init__(self, first_token: float = 0.0, token_interval: float = 0.0, tokens: int = 40):
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.tokens = tokens
+        self.calls = 0
+
+    async def stream(self, request: LLMRequest):
+        digest = hashlib.sha1(request.message.encode("utf-8")).hexdigest()
+        if self.first_token:
+            await asyncio.sleep(self.first_token)
+        for index in range(self.tokens):
+            if index and self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            yield f"{digest[index % len(digest)]}{index} "
+
+    async def complete(self, request: LLMRequest) -> str:
+        self.calls += 1
+        parts = [token async for token in self.stream(request)]
+        return "".join(parts).strip()
+
+
+class CountingNotifier:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, text: str) -> None:
+        self.sent += 1
+
+
+def build_database(mongo_url):
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        return AsyncIOMotorClient(mongo_url)[os.environ["DB_NAME"]]
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient()[os.environ["DB_NAME"]]
+
+
+def build_app(args):
+    """Приложение index.py с ChatService на подменённых зависимостях."""
+    import fakeredis
+
+    import index
+    import routes
+    from config.loader import config
+    from memory.smart_context import SmartContext
+    from utils.health import HealthMonitor, HealthProbe
+    from utils.intent_cache import IntentCache
+    from utils.intent_checker import HybridIntentChecker, IntentResult
+
+    redis = fakeredis.FakeAsyncRedis()
+    database = build_database(args.mongo_url)
+    llm = StreamingStubLLM(args.first_token_ms / 1000, args.token_ms / 1000, args.tokens)
+    notifier = CountingNotifier()
+
+    routes._chat_service = ChatService(
+        database=lambda: database,
+        llm=llm,
+        notifier=notifier,
+        context=SmartContext(redis_client=redis),
+        intent_checker=HybridIntentChecker(cache=IntentCache(IntentResult, redis_client=redis)),
+        config=config,
+    )
+
+    async def ping():
+        await database.command("ping")
+
+    index.health_monitor = HealthMonitor([HealthProbe("mongodb", ping, critical=True)])
+    return index.app, config, llm, notifier
+
+
+async def conversation(client, index, args, timings, errors):
+    async def call(endpoint, method, path, payload=None):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=payload)
+            ok = response.status_code < 400
+        except Exception:  # noqa: BLE001
+            ok = False
+        timings[endpoint].append((time.perf_counter() - started) * 1000)
+        if not ok:
+            errors[endpoint] += 1
+
+    session_id = f"load-{index}"
+    for turn in range(args.turns):
+        message = CHAT_MESSAGES[(index + turn) % len(CHAT_MESSAGES)]
+        user_data = {"name": "Load", "contact": "+70000000000"} if turn == args.turns - 1 else None
+        await call("POST /api/chat", "POST", "/api/chat", {
+            "session_id": session_id, "message": message, "user_data": user_data,
+        })
+        await call("GET /api/health", "GET", "/api/health")
+    await call("POST /api/contact", "POST", "/api/contact", {
+        "name": "Load", "contact": "+70000000000", "service": "website", "message": session_id,
+    })
+
+
+async def run(args):
+    app, config, llm, notifier = build_app(args)
+    await config.load_async()
+
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=60) as client:
+        async def guarded(index):
+            async with semaphore:
+                await conversation(client, index, args, timings, errors)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(guarded(i) for i in range(args.conversations)))
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for endpoint, values in sorted(timings.items()):
+        stats = summarize(values, elapsed)
+        stats["errors"] = errors[endpoint]
+        endpoints[endpoint] = stats
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "mongo": "mongod" if args.mongo_url else "mongomock",
+        },
+        "params": {
+            "conversations": args.conversations,
+            "turns": args.turns,
+            "concurrency": args.concurrency,
+            "first_token_ms": args.first_token_ms,
+            "token_ms": args.token_ms,
+            "tokens": args.tokens,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "endpoints": endpoints,
+        "llm_calls": llm.calls,
+        "notifications": notifier.sent,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report, baseline=None):
+    print(f"{report['meta']['revision']}: {report['elapsed_s']} s, llm_calls={report['llm_calls']}")
+    print(f"{'endpoint':<20} {'count':>6} {'err':>4} {'rps':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        line = (
+            f"{endpoint:<20} {stats['count']:>6} {stats['errors']:>4} {stats['rps']:>8} "
+            f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+        )
+        previous = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if previous:
+            line += f"   p95 {stats['p95_ms'] - previous['p95_ms']:+.3f} ms, rps {stats['rps'] - previous['rps']:+.1f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=0.0, help="задержка LLM до первого токена")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="интервал между токенами ответа")
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--mongo-url", default=None, help="локальный mongod вместо mongomock-motor")
+    parser.add_argument("--output", type=Path, default=None, help="записать JSON-отчёт в файл")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON-отчёт для сравнения")
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print_report(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк накладных расходов middleware логирования запросов
+============================================================
+Сравнивает три варианта одного и того же ASGI-приложения с пустым
+эндпоинтом:
+
+* ``bare``   — без middleware (нижняя граница);
+* ``before`` — прежний RequestLoggingMiddleware на BaseHTTPMiddleware
+  с синхронным JSONFormatter → StreamHandler;
+* ``after``  — чистый ASGI middleware (frontend/api/middleware.py)
+  с передачей записей через QueueHandler.
+
+Запросы подаются напрямую в ASGI-приложение (без сети и httpx), поэтому
+разница между вариантами — это именно стоимость middleware.
+
+Запуск:
+    python benchmarks/middleware_overhead.py --requests 5000
+    python benchmarks/middleware_overhead.py --json > middleware.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "frontend" / "api"))
+
+from middleware import RequestLoggingMiddleware  # noqa: E402
+
+
+class JSONFormatter(logging.Formatter):
+    """Копия прежнего форматтера из index.py."""
+
+    def format(self, record):
+        log_data = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        for key in ("request_id", "duration_ms", "status_code"):
+            if hasattr(record, key):
+                log_data[key] = getattr(record, key)
+        return orjson.dumps(log_data).decode("utf-8")
+
+
+def make_legacy_middleware(logger):
+    """Прежняя реализация на BaseHTTPMiddleware (для сравнения)."""
+
+    class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            request_id = str(uuid.uuid4())
+            request.state.request_id = request_id
+            start_time = time.time()
+            logger.info(
+                f"→ {request.method} {request.url.path}",
+                extra={"request_id": request_id, "method": request.method, "path": request.url.path},
+            )
+            try:
+                response = await call_next(request)
+                duration_ms = round((time.time() - start_time) * 1000, 2)
+                response.headers["X-Request-ID"] = request_id
+                response.headers["X-Response-Time"] = f"{duration_ms}ms"
+                logger.info(
+                    f"← {request.method} {request.url.path} {response.status_code}",
+                    extra={"request_id": request_id, "status_code": response.status_code, "duration_ms": duration_ms},
+                )
+                return response
+            except Exception as exc:
+                return JSONResponse(status_code=500, content={"error": str(exc)})
+
+    return LegacyRequestLoggingMiddleware
+
+
+def make_logger(name, queued):
+    devnull = open(os.devnull, "w")
+    stream = logging.StreamHandler(devnull)
+    stream.setFormatter(JSONFormatter())
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener = None
+    if queued:
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, stream)
+        listener.start()
+    else:
+        logger.addHandler(stream)
+    return logger, listener
+
+
+def make_app(variant):
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    listener = None
+    if variant == "before":
+        logger, _ = make_logger("bench.before", queued=False)
+        app.add_middleware(make_legacy_middleware(logger))
+    elif variant == "after":
+        logger, listener = make_logger("bench.after", queued=True)
+        app.add_middleware(RequestLoggingMiddleware, logger=logger)
+    return app, listener
+
+
+async def drive(app, requests):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/api/ping", "raw_path": b"/api/ping",
+        "query_string": b"", "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        return None
+
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        await app(dict(scope), receive, send)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        "mean_us": round(statistics.fmean(ordered), 1),
+        "p50_us": round(ordered[len(ordered) // 2], 1),
+        "p99_us": round(ordered[int(len(ordered) * 0.99) - 1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for variant in ("bare", "before", "after"):
+        app, listener = make_app(variant)
+        asyncio.run(drive(app, args.warmup))
+        results[variant] = summarize(asyncio.run(drive(app, args.requests)))
+        if listener is not None:
+            listener.stop()
+
+    for variant in ("before", "after"):
+        results[variant]["overhead_us"] = round(results[variant]["mean_us"] - results["bare"]["mean_us"], 1)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'variant':<8} {'mean, us':>10} {'p50, us':>10} {'p99, us':>10} {'overhead, us':>14}")
+    for variant, stats in results.items():
+        print(
+            f"{variant:<8} {stats['mean_us']:>10} {stats['p50_us']:>10} {stats['p99_us']:>10} "
+            f"{stats.get('overhead_us', 0.0):>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Бенчмарки горячих путей чата (pytest-benchmark)
+===============================================
+SmartContext (нормализация, сборка контекста, обрезка по бюджету,
+подсчёт токенов, кодек Redis-кэша, retrieval по эмбеддингам), правила
+IntentChecker и текст услуг
+ConfigLoader на синтетических диалогах от 10 до 10 000 ходов. Сеть не
+нужна: без завендоренных BPE-файлов токены считаются приближённо
+(``extra_info["tokenizer"]``).
+
+Сохранить базовую линию и сравнить с ней:
+
+    python -m pytest benchmarks -p no:cacheprovider --no-cov \\
+        --benchmark-storage=benchmarks/baselines --benchmark-save=baseline
+    python -m pytest benchmarks -p no:cacheprovider --no-cov \\
+        --benchmark-storage=benchmarks/baselines --benchmark-compare \\
+        --benchmark-compare-fail=median:40%
+
+Эти тесты не входят в основной прогон (testpaths = api tests).
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from config.loader import ConfigLoader, config  # noqa: E402
+from memory.retrieval import top_k  # noqa: E402
+from memory.smart_context import ChatMessage, SmartContext, _MessageEnvelope  # noqa: E402
+from utils.intent_checker import IntentChecker  # noqa: E402
+
+from conftest import TURN_COUNTS  # noqa: E402
+
+# 10 000 ходов собираются долго — меньше раундов, чтобы прогон укладывался в минуты
+ROUNDS = {10: 200, 100: 50, 1_000: 10, 10_000: 3}
+
+
+def run_rounds(benchmark, turns, func, *args):
+    return benchmark.pedantic(func, args=args, rounds=ROUNDS[turns], iterations=1, warmup_rounds=1)
+
+
+@pytest.fixture
+def context():
+    return SmartContext()
+
+
+@pytest.mark.parametrize("turns", TURN_COUNTS)
+class TestSmartContextBench:
+    """Сборка контекста из истории разной длины"""
+
+    def test_normalize_messages(self, benchmark, context, conversations, turns, offline_tokenizer):
+        benchmark.extra_info["tokenizer"] = offline_tokenizer
+        timeline = run_rounds(benchmark, turns, context._normalize_messages, conversations[turns])
+        assert len(timeline) == 2 * turns
+
+    def test_build_context(self, benchmark, context, conversations, turns, offline_tokenizer):
+        benchmark.extra_info["tokenizer"] = offline_tokenizer
+        loop = asyncio.new_event_loop()
+        try:
+            result, tokens = run_rounds(
+                benchmark, turns, lambda docs: loop.run_until_complete(context._build_context(docs)),
+                conversations[turns],
+            )
+        finally:
+            loop.close()
+        assert result and tokens <= context.max_tokens
+
+    def test_trim_to_budget(self, benchmark, context, conversations, turns, offline_tokenizer):
+        benchmark.extra_info["tokenizer"] = offline_tokenizer
+        envelopes = [
+            _MessageEnvelope(message=msg, tokens=context.count_tokens(msg["content"]))
+            for msg in context._normalize_messages(conversations[turns])
+        ][::-1]
+        kept, consumed = run_rounds(benchmark, turns, context._trim_to_budget, envelopes, context.max_tokens)
+        assert consumed <= context.max_tokens
+
+    def test_count_tokens_cold(self, benchmark, context, conversations, turns, offline_tokenizer):
+        benchmark.extra_info["tokenizer"] = offline_tokenizer
+        texts = [msg["content"] for msg in context._normalize_messages(conversations[turns])]
+
+        def count_all():
+            return sum(context.count_tokens(text) for text in texts)
+
+        benchmark.pedantic(
+            count_all,
+            setup=SmartContext._count_tokens_cached.cache_clear,
+            rounds=ROUNDS[turns],
+            iterations=1,
+        )
+
+    def test_count_tokens_warm(self, benchmark, context, conversations, turns, offline_tokenizer):
+        benchmark.extra_info["tokenizer"] = offline_tokenizer
+        # Уникальных текстов в синтетике меньше размера LRU — после прогрева всё из кэша
+        texts = [msg["content"] for msg in context._normalize_messages(conversations[turns])][-2000:]
+        for text in texts:
+            context.count_tokens(text)
+
+        run_rounds(benchmark, turns, lambda: sum(context.count_tokens(text) for text in texts))
+
+    def test_cache_codec_round_trip(self, benchmark, context, conversations, turns):
+        # Тот же кодек, что _store_in_cache/_try_load_from_cache (JSON ↔ ChatMessage)
+        messages = context._normalize_messages(conversations[turns])
+
+        def round_trip():
+            payload = json.dumps(messages, ensure_ascii=False)
+            return [ChatMessage(**msg) for msg in json.loads(payload)]
+
+        decoded = run_rounds(benchmark, turns, round_trip)
+        assert decoded == messages
+
+
+class TestRetrievalBench:
+    """Top-k поиск по окну из 400 сообщений (db_fetch_limit) с сохранёнными векторами"""
+
+    def test_top_k_400_messages(self, benchmark, context, conversations):
+        messages = context._normalize_messages(conversations[1_000])[-context.db_fetch_limit:]
+        vectors = [context.embedder.from_bytes(context.embedder.encode(msg["content"])) for msg in messages]
+        query = context.embedder.embed("Сколько стоит интеграция ассистента с CRM?")
+
+        indices = benchmark(top_k, query, vectors, context.retrieval_top_k, context.retrieval_min_score)
+        assert indices and "CRM" in messages[indices[0]]["content"]
+
+
+class TestRulesBench:
+    """Правила релевантности и текст услуг для промпта"""
+
+    def test_intent_checker_is_relevant(self, benchmark, conversations):
+        checker = IntentChecker()
+        messages = [doc["user_message"] for doc in conversations[1_000]]
+        relevant = benchmark(lambda: sum(checker.is_relevant(message) for message in messages))
+        assert relevant == len(messages)
+
+    def test_services_text_uncached(self, benchmark):
+        config.load_sync()
+        text = benchmark(ConfigLoader.get_all_services_text.__wrapped__, config)
+        assert text != "Услуги не загружены"
+
+    def test_services_text_cached(self, benchmark):
+        config.load_sync()
+        assert benchmark(config.get_all_services_text) != "Услуги не загружены"
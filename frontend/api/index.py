@@ -6,8 +6,6 @@ Vercel Serverless Function с enterprise-grade security & performance
 
 import os
 import sys
-import time
-import uuid
 import logging
 from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any
@@ -15,16 +13,30 @@ from datetime import datetime, timezone
 
 # Добавляем корневую директорию в PYTHONPATH для импорта backend модулей
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
 
-import orjson
-from fastapi import FastAPI, Request, Response, HTTPException, status
+from fastapi import Depends, FastAPI, Request, Response, HTTPException, status
 from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 
+# Холодный старт: aiohttp, cachetools, tiktoken, numpy, redis, httpx и
+# emergentintegrations импортируются при первом использовании
+# (tests/test_startup_imports.py). motor/pymongo и prometheus_client
+# остаются при загрузке модуля: lifespan создаёт MongoDB-клиент до первого
+# запроса, а MetricsMiddleware и счётчики модулей учитывают уже первый
+# запрос — отложенный импорт лишь перенёс бы ту же цену в этот запрос.
+from db.connection import MONGO_CONFIG, client_options, close_client, connect, get_client
+from middleware import RequestLoggingMiddleware
+from utils.health import HEALTH_CONFIG, HealthMonitor, HealthProbe, http_probe, mongo_probe, redis_probe
+from utils.intent_cache import INTENT_CACHE_CONFIG, build_redis_client
+from utils.log_pipeline import configure_logging
+from utils.metrics import MetricsMiddleware, render_metrics, require_metrics_token
+from utils.tracing import TracingMiddleware
+
 # ============================================================================
 # CONFIGURATION & ENVIRONMENT VALIDATION
 # ============================================================================
@@ -41,6 +53,8 @@ OPTIONAL_ENV = {
     "SENTRY_DSN": None,
     "VERCEL_ENV": "development",
     "LOG_LEVEL": "INFO",
+    "METRICS_TOKEN": None,
+    "TRACE_SERVER_TIMING": "0",
 }
 
 # Валидация критических переменных
@@ -58,6 +72,8 @@ CLIENT_ORIGIN = os.getenv("CLIENT_ORIGIN_URL", OPTIONAL_ENV["CLIENT_ORIGIN_URL"]
 VERCEL_ENV = os.getenv("VERCEL_ENV", "development")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 SENTRY_DSN = os.getenv("SENTRY_DSN")
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
 
 # Production mode detection
 IS_PRODUCTION = VERCEL_ENV == "production"
@@ -66,41 +82,33 @@ IS_PRODUCTION = VERCEL_ENV == "production"
 # STRUCTURED LOGGING SETUP
 # ============================================================================
 
-class JSONFormatter(logging.Formatter):
-    """Structured JSON logging для production monitoring"""
-    
-    def format(self, record: logging.LogRecord) -> str:
-        log_data = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "level": record.levelname,
-            "logger": record.name,
-            "message": record.getMessage(),
-            "module": record.module,
-            "function": record.funcName,
-            "line": record.lineno,
-        }
-        
-        # Добавляем exception info если есть
-        if record.exc_info:
-            log_data["exception"] = self.formatException(record.exc_info)
-        
-        # Добавляем дополнительные поля из extra
-        if hasattr(record, "request_id"):
-            log_data["request_id"] = record.request_id
-        if hasattr(record, "duration_ms"):
-            log_data["duration_ms"] = record.duration_ms
-        if hasattr(record, "status_code"):
-            log_data["status_code"] = record.status_code
-            
-        return orjson.dumps(log_data).decode("utf-8")
-
-# Настройка logger
+# Очередь + фоновый поток (utils.log_pipeline): в event loop запись только
+# кладётся в очередь, orjson-форматирование и запись в stderr — вне его
+configure_logging(level=LOG_LEVEL)
+
 logger = logging.getLogger("neuroexpert")
-logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 
-handler = logging.StreamHandler()
-handler.setFormatter(JSONFormatter())
-logger.addHandler(handler)
+# ============================================================================
+# HEALTH MONITOR
+# ============================================================================
+
+def _build_health_monitor() -> HealthMonitor:
+    """Пробы зависимостей: MongoDB — критичная, остальные — если настроены."""
+    probes = [HealthProbe("mongodb", mongo_probe(get_client), critical=True)]
+    redis_client = build_redis_client(INTENT_CACHE_CONFIG['redis_url'])
+    if redis_client is not None:
+        probes.append(HealthProbe("redis", redis_probe(redis_client)))
+    if HEALTH_CONFIG['llm_url']:
+        probes.append(HealthProbe("llm_gateway", http_probe(HEALTH_CONFIG['llm_url'])))
+    if TELEGRAM_BOT_TOKEN:
+        probes.append(HealthProbe(
+            "telegram",
+            http_probe(f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getMe", expect_ok=True),
+        ))
+    return HealthMonitor(probes)
+
+
+health_monitor = _build_health_monitor()
 
 # ============================================================================
 # MONGODB CONNECTION POOL (Lifespan Context)
@@ -111,32 +119,25 @@ async def lifespan(app: FastAPI):
     """
     FastAPI lifespan context для управления MongoDB connection pool
     https://fastapi.tiangolo.com/advanced/events/
+
+    Клиент общий для всего процесса (db.connection). Профиль MONGO_PROFILE:
+    serverless — ленивое подключение и маленький пул без прогрева (холодный
+    старт Vercel не открывает соединений до первого запроса), server —
+    прогретый пул и ping при старте.
     """
     # STARTUP: Инициализация MongoDB клиента
     logger.info("🚀 Starting NeuroExpert API", extra={"environment": VERCEL_ENV})
     
     try:
-        app.state.mongo_client = AsyncIOMotorClient(
-            MONGO_URL,
-            maxPoolSize=50,          # Максимум 50 соединений в пуле
-            minPoolSize=10,          # Минимум 10 ready connections
-            maxIdleTimeMS=30000,     # Закрывать idle connections через 30s
-            serverSelectionTimeoutMS=5000,  # Таймаут выбора сервера 5s
-            connectTimeoutMS=10000,  # Таймаут подключения 10s
-            socketTimeoutMS=30000,   # Таймаут socket операций 30s
-            retryWrites=True,        # Автоматический retry для write операций
-            retryReads=True,         # Автоматический retry для read операций
-        )
-        
-        app.state.db = app.state.mongo_client[DB_NAME]
-        
-        # Real health check - пингуем MongoDB
-        await app.state.mongo_client.admin.command("ping")
+        # Базу не храним в app.state: клиент пересоздаётся при смене event
+        # loop, обработчики берут её через db.connection.get_database
+        await connect()
         logger.info(
-            "✅ MongoDB connected successfully",
+            "✅ MongoDB client ready",
             extra={
                 "database": DB_NAME,
-                "pool_size": 50,
+                "profile": MONGO_CONFIG['profile'],
+                "pool_size": client_options()["maxPoolSize"],
             }
         )
         
@@ -147,13 +148,24 @@ async def lifespan(app: FastAPI):
         )
         raise RuntimeError(f"MongoDB connection failed: {e}")
     
+    # При заданном lifespan Starlette не вызывает startup/shutdown обработчики,
+    # зарегистрированные через add_event_handler (routes.setup_routes) — запускаем сами
+    for startup_handler in app.router.on_startup:
+        await startup_handler()
+
+    # Долгоживущий процесс опрашивает зависимости в фоне; в serverless
+    # снимок обновляется по обращению к /api/health (HEALTH_BACKGROUND)
+    if HEALTH_CONFIG['background']:
+        health_monitor.start()
+    
     yield  # API работает здесь
     
     # SHUTDOWN: Закрытие соединений
     logger.info("🛑 Shutting down NeuroExpert API")
-    if hasattr(app.state, "mongo_client"):
-        app.state.mongo_client.close()
-        logger.info("✅ MongoDB connection closed")
+    await health_monitor.stop()
+    for shutdown_handler in app.router.on_shutdown:
+        await shutdown_handler()
+    close_client()
 
 # ============================================================================
 # FASTAPI APPLICATION
@@ -210,100 +222,59 @@ app.add_middleware(
 # CUSTOM MIDDLEWARE
 # ============================================================================
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """
-    Логирование всех запросов с timing и request_id
-    """
-    async def dispatch(self, request: Request, call_next):
-        request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
-        
-        start_time = time.time()
-        
-        # Логируем входящий запрос
-        logger.info(
-            f"→ {request.method} {request.url.path}",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "client_ip": request.client.host if request.client else "unknown",
-            }
-        )
-        
-        try:
-            response = await call_next(request)
-            
-            duration_ms = round((time.time() - start_time) * 1000, 2)
-            
-            # Добавляем headers для tracing
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Response-Time"] = f"{duration_ms}ms"
-            
-            # Логируем ответ
-            logger.info(
-                f"← {request.method} {request.url.path} {response.status_code}",
-                extra={
-                    "request_id": request_id,
-                    "status_code": response.status_code,
-                    "duration_ms": duration_ms,
-                }
-            )
-            
-            return response
-            
-        except Exception as exc:
-            duration_ms = round((time.time() - start_time) * 1000, 2)
-            
-            logger.error(
-                f"✗ {request.method} {request.url.path} failed",
-                extra={
-                    "request_id": request_id,
-                    "error": str(exc),
-                    "duration_ms": duration_ms,
-                },
-                exc_info=True,
-            )
-            
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={
-                    "error": "Internal server error",
-                    "request_id": request_id,
-                    "message": str(exc) if not IS_PRODUCTION else "An error occurred",
-                }
-            )
-
-app.add_middleware(RequestLoggingMiddleware)
+# Трасса стадий запроса (utils.tracing): регистрируется до логирования,
+# т.е. внутри него — access-лог получает поле stages. Server-Timing отдаём
+# вне production или при TRACE_SERVER_TIMING=1
+app.add_middleware(TracingMiddleware, server_timing=TRACE_SERVER_TIMING or not IS_PRODUCTION)
+
+# Чистый ASGI middleware (см. middleware.py): не оборачивает тело ответа
+# и не ломает streaming; очередь логов — в configure_logging выше
+app.add_middleware(RequestLoggingMiddleware, logger=logger, expose_errors=not IS_PRODUCTION)
+
+# RED-метрики по шаблонам маршрутов (utils.metrics); добавлен последним —
+# внешний слой, поэтому учитывает и время остальных middleware
+app.add_middleware(MetricsMiddleware)
 
 # ============================================================================
 # HEALTH CHECK ENDPOINT
 # ============================================================================
 
 @app.get("/api/health", tags=["monitoring"])
-async def health_check(request: Request) -> Dict[str, Any]:
+async def health_check(request: Request, deep: bool = False) -> Dict[str, Any]:
     """
-    Real health check с проверкой MongoDB connectivity
+    Health check из снимка HealthMonitor (без обращения к БД на каждый опрос).
+    `?deep=1` — синхронная проверка всех зависимостей; только с
+    `Authorization: Bearer <HEALTH_TOKEN>`. Без токена ошибки проверок
+    отдаются без подробностей.
     """
+    token = HEALTH_CONFIG['token']
+    authorized = bool(token) and request.headers.get("authorization") == f"Bearer {token}"
+    if deep and not authorized:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    snapshot = await health_monitor.current(deep=deep, detail=authorized)
+    mongo = snapshot["checks"]["mongodb"]
+
     health_status = {
-        "status": "healthy",
+        "status": snapshot["status"],
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "version": "3.0.0",
         "environment": VERCEL_ENV,
+        "mongodb": "connected" if mongo["status"] == "ok" else "disconnected",
+        "checks": snapshot["checks"],
     }
-    
-    # Проверяем MongoDB connection
-    try:
-        await request.app.state.mongo_client.admin.command("ping")
-        health_status["mongodb"] = "connected"
-    except Exception as e:
-        health_status["status"] = "degraded"
-        health_status["mongodb"] = "disconnected"
-        health_status["mongodb_error"] = str(e)
-        logger.error(f"MongoDB health check failed: {e}")
+    if "error" in mongo:
+        health_status["mongodb_error"] = mongo["error"]
     
     return health_status
 
+@app.get("/api/metrics", tags=["monitoring"], include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics() -> Response:
+    """
+    Prometheus exposition endpoint (multiprocess-aware через PROMETHEUS_MULTIPROC_DIR)
+    """
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 # ============================================================================
 # IMPORT ROUTES FROM BACKEND
 # ============================================================================
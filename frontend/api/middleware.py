@@ -0,0 +1,127 @@
+"""
+ASGI middleware для NeuroExpert API
+===================================
+Чистый ASGI (без BaseHTTPMiddleware): не создаёт отдельную задачу и не
+оборачивает тело ответа в поток, поэтому не ломает StreamingResponse и
+почти ничего не добавляет к латентности запроса.
+"""
+
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, MutableMapping, Optional
+
+import orjson
+from starlette.datastructures import MutableHeaders
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class RequestLoggingMiddleware:
+    """
+    Логирование всех запросов с timing и request_id.
+
+    * `X-Request-ID` / `X-Response-Time` добавляются в заголовки на
+      `http.response.start` (время до первого байта ответа);
+    * access-лог пишется после отправки тела, с полной длительностью;
+    * request_id доступен обработчикам как `request.state.request_id`.
+
+    Записи логов передаются через QueueHandler (utils.log_pipeline),
+    форматирование и запись выполняются вне event loop; access-записи
+    помечены `sample_key="http.access"` и сэмплируются по LOG_SAMPLE_RATES.
+
+    Если внутри зарегистрирован TracingMiddleware (utils.tracing), итоговая
+    запись получает поле `stages` — длительности стадий запроса в мс.
+    """
+
+    def __init__(self, app: ASGIApp, logger: Optional[logging.Logger] = None, expose_errors: bool = False) -> None:
+        self.app = app
+        self.logger = logger or logging.getLogger("neuroexpert")
+        self.expose_errors = expose_errors
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = str(uuid.uuid4())
+        scope.setdefault("state", {})["request_id"] = request_id
+        method = scope["method"]
+        path = scope["path"]
+        start_time = time.perf_counter()
+
+        client = scope.get("client")
+        self.logger.info(
+            "→ %s %s", method, path,
+            extra={
+                "request_id": request_id,
+                "method": method,
+                "path": path,
+                "client_ip": client[0] if client else "unknown",
+                "sample_key": "http.access",
+            },
+        )
+
+        status_code = 500
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", request_id)
+                headers.append("X-Response-Time", f"{(time.perf_counter() - start_time) * 1000:.2f}ms")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            duration_ms = round((time.perf_counter() - start_time) * 1000, 2)
+            self.logger.error(
+                "✗ %s %s failed", method, path,
+                extra={
+                    "request_id": request_id,
+                    "error": str(exc),
+                    "duration_ms": duration_ms,
+                },
+                exc_info=True,
+            )
+            if response_started:
+                raise
+            await self._send_error(send, request_id, exc)
+            return
+
+        extra = {
+            "request_id": request_id,
+            "status_code": status_code,
+            "duration_ms": round((time.perf_counter() - start_time) * 1000, 2),
+            "sample_key": "http.access",
+        }
+        trace = scope["state"].get("trace")
+        if trace is not None:
+            extra["trace_id"] = trace.trace_id
+            extra["stages"] = trace.summary()
+        self.logger.info("← %s %s %s", method, path, status_code, extra=extra)
+
+    async def _send_error(self, send: Send, request_id: str, exc: Exception) -> None:
+        body = orjson.dumps({
+            "error": "Internal server error",
+            "request_id": request_id,
+            "message": str(exc) if self.expose_errors else "An error occurred",
+        })
+        await send({
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-request-id", request_id.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
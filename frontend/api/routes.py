@@ -3,18 +3,10 @@ Backend routes for FastAPI
 Defines all API endpoints for chat and contact functionality
 """
 
-import os
 import sys
-import uuid
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any
 from pathlib import Path
-
-import aiohttp
-from fastapi import APIRouter, HTTPException, Request
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pydantic import BaseModel
+from typing import Optional
 
 # Ensure backend modules can be imported when running from Vercel
 backend_dir = Path(__file__).resolve().parent.parent.parent / "backend"
@@ -23,277 +15,88 @@ if str(backend_dir) not in sys.path:
 
 try:
     from config.loader import config
-    from utils.intent_checker import intent_checker
-    from memory.smart_context import smart_context
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    from utils.intent_logs import build_sink as build_intent_log_sink
+    from db.connection import close_client, get_database
 except ImportError as exc:
     logging.warning("Failed to import backend modules: %s", exc)
     config = None
-    intent_checker = None
-    smart_context = None
-    LlmChat = None
-    UserMessage = None
+    build_intent_log_sink = None
+    close_client = None
+    get_database = None
 
-logger = logging.getLogger("neuroexpert.routes")
+from services.chat_service import ChatService, build_chat_service
+from services.router import create_router
 
-# Environment variables
-MONGO_URL = os.environ.get("MONGO_URL")
-DB_NAME = os.environ.get("DB_NAME")
-EMERGENT_LLM_KEY = os.environ.get("EMERGENT_LLM_KEY")
-TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
+logger = logging.getLogger("neuroexpert.routes")
 
-_client: Optional[AsyncIOMotorClient] = None
-_db: Optional[AsyncIOMotorDatabase] = None
 _shutdown_registered: bool = False
 
-router = APIRouter(prefix="/api")
-
-
-class ContactForm(BaseModel):
-    name: str
-    contact: str
-    service: str
-    message: Optional[str] = ""
+# Сервис собирается при первом запросе: SmartContext, классификатор и
+# LLM-клиент не нужны на холодном старте функции
+_chat_service: Optional[ChatService] = None
 
 
-class ChatMessage(BaseModel):
-    session_id: str
-    message: str
-    model: Optional[str] = "claude-sonnet"
-    user_data: Optional[Dict[str, Any]] = None
+def get_chat_service() -> ChatService:
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = build_chat_service()
+    return _chat_service
 
 
-class ChatResponse(BaseModel):
-    response: str
-    session_id: str
+router = create_router(get_chat_service)
 
 
-async def _get_database(request: Request) -> AsyncIOMotorDatabase:
-    """Return AsyncIOMotorDatabase instance from app state or fallback client."""
-    db = getattr(request.app.state, "db", None)
-    if db is not None:
-        return db
+async def _close_client() -> None:
+    if close_client is not None:
+        close_client()
 
-    if not MONGO_URL or not DB_NAME:
-        raise HTTPException(status_code=503, detail="Database is not configured")
 
-    global _client, _db
-    if _db is None:
-        _client = AsyncIOMotorClient(MONGO_URL)
-        _db = _client[DB_NAME]
-        logger.info("Initialized fallback MongoDB client for routes")
+async def _startup_llm_gateway() -> None:
+    """Create long-lived provider clients (keep-alive pools) once per process."""
+    from services.llm_gateway import get_gateway
 
-    return _db
+    await get_gateway().start()
 
 
-async def _close_fallback_client() -> None:
-    global _client, _db
-    if _client is not None:
-        _client.close()
-        _client = None
-        _db = None
-        logger.info("Closed fallback MongoDB client")
+async def _flush_chat_writes() -> None:
+    """Write out buffered chat_messages records before the process exits."""
+    writer = getattr(_chat_service, "writer", None)
+    if writer is not None:
+        await writer.stop()
 
 
-async def send_telegram_notification(message: str) -> None:
-    """Send notification to Telegram bot."""
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        logger.debug("Skipping Telegram notification: not configured")
-        return
+async def _startup_notifier() -> None:
+    """Start the notification outbox poller if the chat service already exists.
 
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url,
-                json={
-                    "chat_id": TELEGRAM_CHAT_ID,
-                    "text": message,
-                    "parse_mode": "HTML",
-                },
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as response:
-                if response.status != 200:
-                    text = await response.text()
-                    logger.error(
-                        "Telegram notification failed: status=%s response=%s",
-                        response.status,
-                        text,
-                    )
-    except Exception as exc:
-        logger.exception("Error sending Telegram notification: %s", exc)
-
-
-@router.get("/")
-async def root() -> Dict[str, str]:
-    return {"message": "NeuroExpert API", "status": "healthy"}
-
-
-@router.post("/contact")
-async def submit_contact_form(form_data: ContactForm, request: Request) -> Dict[str, Any]:
-    try:
-        db = await _get_database(request)
-
-        form_dict = form_data.dict()
-        form_dict["id"] = str(uuid.uuid4())
-        form_dict["timestamp"] = datetime.utcnow()
-        form_dict["status"] = "new"
+    The service is built lazily on cold start; otherwise the poller starts
+    with the first notification.
+    """
+    notifier = getattr(_chat_service, "notifier", None)
+    if hasattr(notifier, "start"):
+        notifier.start()
 
-        await db.contact_forms.insert_one(form_dict)
 
-        telegram_message = f"""
-<b>🎯 Новая заявка NeuroExpert!</b>
-
-<b>Имя:</b> {form_data.name}
-<b>Контакт:</b> {form_data.contact}
-<b>Услуга:</b> {form_data.service}
-<b>Сообщение:</b> {form_data.message or 'Не указано'}
-"""
+async def _shutdown_notifier() -> None:
+    """Deliver queued Telegram notifications; the rest stays in the outbox."""
+    notifier = getattr(_chat_service, "notifier", None)
+    if hasattr(notifier, "stop"):
+        await notifier.stop()
 
-        await send_telegram_notification(telegram_message)
-        logger.info("Contact form stored", extra={"service": form_data.service})
 
-        return {
-            "success": True,
-            "message": "Спасибо! Мы свяжемся с вами в течение 15 минут",
-        }
-    except HTTPException:
-        raise
-    except Exception as exc:
-        logger.exception("Contact form error: %s", exc)
-        raise HTTPException(status_code=500, detail="Ошибка отправки заявки")
+async def _shutdown_llm_gateway() -> None:
+    from services.llm_gateway import close_gateway
 
+    await close_gateway()
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(chat_request: ChatMessage, request: Request) -> ChatResponse:
-    if not all([config, intent_checker, smart_context, LlmChat, UserMessage]):
-        raise HTTPException(status_code=503, detail="AI chat service temporarily unavailable")
-
-    if not EMERGENT_LLM_KEY:
-        raise HTTPException(status_code=503, detail="AI service not configured")
 
+def _intent_checker():
+    """Классификатор намерений (импорт aiohttp и кэша — при старте, не при загрузке модуля)."""
     try:
-        db = await _get_database(request)
-
-        try:
-            if not intent_checker.is_relevant(chat_request.message):
-                fallback_msg = "Извините, я могу помочь только с вопросами, связанными с digital-трансформацией и нашими услугами. Чем могу помочь?"
-                return ChatResponse(
-                    response=fallback_msg,
-                    session_id=chat_request.session_id,
-                )
-        except Exception as exc:
-            logger.warning("Intent checker issue: %s", exc)
-
-        try:
-            initial_messages = await smart_context.get_context(
-                session_id=chat_request.session_id,
-                db=db,
-            )
-        except Exception as exc:
-            logger.warning("Smart context unavailable: %s", exc)
-            initial_messages = []
-
-        model_config = {
-            "claude-sonnet": ("anthropic", "claude-3-7-sonnet-20250219"),
-            "gpt-4o": ("openai", "gpt-4o"),
-        }
-
-        selected_model = chat_request.model or "claude-sonnet"
-        provider, model_name = model_config.get(selected_model, model_config["claude-sonnet"])
-
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=chat_request.session_id,
-            system_message=_build_system_prompt(),
-            initial_messages=initial_messages,
-        ).with_model(provider, model_name)
-
-        user_message = UserMessage(text=chat_request.message)
-        response_text = await chat.send_message(user_message)
-
-        message_record = {
-            "id": str(uuid.uuid4()),
-            "session_id": chat_request.session_id,
-            "user_message": chat_request.message,
-            "ai_response": response_text,
-            "model": selected_model,
-            "timestamp": datetime.utcnow(),
-            "user_data": chat_request.user_data,
-        }
-        await db.chat_messages.insert_one(message_record)
-
-        if chat_request.user_data and chat_request.user_data.get("contact"):
-            telegram_message = f"""
-<b>💬 Лид из AI-чата!</b>
-
-<b>Модель:</b> {selected_model}
-<b>Имя:</b> {chat_request.user_data.get('name', 'Не указано')}
-<b>Контакт:</b> {chat_request.user_data.get('contact')}
-<b>Сообщение:</b> {chat_request.message}
-"""
-            await send_telegram_notification(telegram_message)
-
-        return ChatResponse(response=response_text, session_id=chat_request.session_id)
-    except HTTPException:
-        raise
-    except Exception as exc:
-        logger.exception("AI chat error: %s", exc)
-        raise HTTPException(status_code=500, detail="Ошибка обработки сообщения")
-
-
-def _build_system_prompt() -> str:
-    if not config or not config.data:
-        return "Вы — AI-консультант NeuroExpert. Помогите клиенту и будьте вежливы."
-
-    return f"""# IDENTITY & CORE ROLE
-
-Вы — **AI-Консультант {config.data['company']['name']}**, первая точка контакта клиента с экосистемой digital-трансформации. 
-
-**Ваша личность:**
-- Эксперт в digital-трансформации с 10+ лет опыта
-- Консультант-партнер, а не продавец: сначала глубокая диагностика, потом персонализированное решение
-- Говорите живым, понятным языком, адаптируясь к собеседнику
-- Дружелюбны, эмпатичны, но профессиональны
-- Всегда помните контекст разговора и возвращайтесь к важным деталям
-- Ориентированы на реальную пользу для клиента, а не на продажу
-
-**Стиль общения:**
-- Отвечайте развернуто (3-6 предложений), но структурированно
-- Задавайте уточняющие вопросы для понимания контекста
-- Используйте примеры из практики
-- Объясняйте технические термины простым языком
-- Будьте конкретны в цифрах и сроках
-- Проявляйте живой интерес к проблеме клиента
-
-## НАШИ УСЛУГИ
-{config.get_all_services_text()}
-
-## КОНТАКТЫ
-Телефон: {config.data['company']['phone']}
-Email: {config.data['company']['email']}
-Завершённых проектов: {config.data['company']['completed_projects']}
-
-## ТЕХНОЛОГИЧЕСКИЙ СТЕК
-
-**Frontend:** React.js/Next.js 15, Vue.js/Nuxt.js, TailwindCSS
-**Backend:** Node.js, Python/FastAPI, Golang
-**AI/ML:** Claude Sonnet 4, GPT-4o, Gemini Pro, LangChain
-**БД:** PostgreSQL, MongoDB, Redis, Vector DB
-**Безопасность:** SSL/TLS, WAF, Cloudflare Protection, GDPR/152-ФЗ compliance
-
-## ПРОЦЕСС РАБОТЫ
-
-1. Бесплатная консультация (30 мин) — разбор задачи, первичная оценка
-2. Аудит/ТЗ — глубокий анализ, проработка решения
-3. Дизайн — прототипы, UX/UI (с участием клиента)
-4. Разработка — спринты по 1-2 недели, регулярные демо
-5. Тестирование — QA, нагрузочные тесты
-6. Запуск — поэтапный deployment, обучение команды
-7. Поддержка — мониторинг, оптимизация, развитие
-
-Будьте живым, полезным экспертом, который искренне хочет помочь решить задачу клиента!"""
+        from utils.intent_checker import intent_checker
+    except ImportError as exc:
+        logger.warning("Intent checker unavailable: %s", exc)
+        return None
+    return intent_checker
 
 
 async def _startup_load_config() -> None:
@@ -311,7 +114,41 @@ def setup_routes(app):
     global _shutdown_registered
     app.include_router(router)
 
+    async def _startup_intent_logs() -> None:
+        """Start background flushing of intent classification telemetry."""
+        intent_checker = _intent_checker()
+        if intent_checker is None or build_intent_log_sink is None:
+            return
+        intent_checker.classification_logs.start(build_intent_log_sink(get_database))
+
+    async def _shutdown_intent_logs() -> None:
+        intent_checker = _intent_checker()
+        if intent_checker is not None:
+            await intent_checker.classification_logs.stop()
+
+    async def _startup_context_watcher() -> None:
+        """Tail chat_messages changes to keep cached contexts fresh."""
+        from memory.change_watcher import build_change_watcher
+
+        app.state.context_watcher = build_change_watcher(get_database)
+        if app.state.context_watcher is not None:
+            app.state.context_watcher.start()
+
+    async def _shutdown_context_watcher() -> None:
+        watcher = getattr(app.state, "context_watcher", None)
+        if watcher is not None:
+            await watcher.stop()
+
     if not _shutdown_registered:
         app.add_event_handler("startup", _startup_load_config)
-        app.add_event_handler("shutdown", _close_fallback_client)
+        app.add_event_handler("startup", _startup_intent_logs)
+        app.add_event_handler("startup", _startup_llm_gateway)
+        app.add_event_handler("startup", _startup_context_watcher)
+        app.add_event_handler("startup", _startup_notifier)
+        app.add_event_handler("shutdown", _shutdown_context_watcher)
+        app.add_event_handler("shutdown", _shutdown_intent_logs)
+        app.add_event_handler("shutdown", _shutdown_llm_gateway)
+        app.add_event_handler("shutdown", _flush_chat_writes)
+        app.add_event_handler("shutdown", _shutdown_notifier)
+        app.add_event_handler("shutdown", _close_client)
         _shutdown_registered = True
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { motion } from 'framer-motion';
 import { Input } from './ui/input';
 import { Textarea } from './ui/textarea';
@@ -10,6 +10,9 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID?.() ?? `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
 const ContactForm = () => {
   const [formData, setFormData] = useState({
     name: '',
@@ -18,6 +21,8 @@ const ContactForm = () => {
     message: ''
   });
   const [loading, setLoading] = useState(false);
+  // Один ключ на заполненную форму: повтор после ошибки сети не создаст вторую заявку
+  const submission = useRef(null);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -28,11 +33,19 @@ const ContactForm = () => {
     }
 
     setLoading(true);
+
+    const payload = JSON.stringify(formData);
+    if (!submission.current || submission.current.payload !== payload) {
+      submission.current = { payload, key: newIdempotencyKey() };
+    }
     
     try {
-      const response = await axios.post(`${API}/contact`, formData);
+      const response = await axios.post(`${API}/contact`, formData, {
+        headers: { 'Idempotency-Key': submission.current.key }
+      });
       
       if (response.data.success) {
+        submission.current = null;
         toast.success(response.data.message || 'Спасибо! Мы свяжемся с вами в течение 15 минут');
         setFormData({ name: '', contact: '', service: '', message: '' });
         
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Отчёт о стоимости импорта при холодном старте
+=============================================
+Запускает ``python -X importtime`` для модуля Vercel-функции в чистом
+процессе и агрегирует время по пакетам верхнего уровня. Результат
+дописывается в историю (JSONL), чтобы видеть, какие изменения
+удорожают холодный старт.
+
+    python scripts/importtime_report.py                     # frontend/api/index.py
+    python scripts/importtime_report.py --module server     # backend/server.py
+    python scripts/importtime_report.py --top 15 --budget-ms 800
+    python scripts/importtime_report.py --no-history --json
+
+Замер делается несколько раз (``--runs``), берётся медиана: первый
+запуск часто включает прогрев файлового кэша ОС.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_HISTORY = ROOT / "benchmarks" / "importtime_history.jsonl"
+
+TARGETS = {
+    "index": ROOT / "frontend" / "api",
+    "server": ROOT / "backend",
+}
+
+# import time:       self [us] |  cumulative | imported package
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str, python: str = sys.executable) -> dict:
+    """Один замер: суммарное время и self-время по пакетам верхнего уровня (мкс)."""
+    cwd = TARGETS.get(module, ROOT)
+    env = dict(os.environ)
+    # index.py проверяет обязательные переменные при импорте; подключения ленивые
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "importtime")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "backend"), str(cwd), env.get("PYTHONPATH")]))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.splitlines()[-15:])
+        raise RuntimeError(f"import {module} failed:\n{tail}")
+
+    packages: dict[str, int] = defaultdict(int)
+    total = 0
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us)
+        if len(indent) == 1 and name == module:
+            total = int(cumulative_us)
+    if not total:
+        total = sum(packages.values())
+    return {"total_us": total, "packages": dict(packages)}
+
+
+def summarize(runs: list[dict], top: int) -> dict:
+    totals = [r["total_us"] for r in runs]
+    names = set().union(*(r["packages"] for r in runs))
+    packages = {
+        name: statistics.median(r["packages"].get(name, 0) for r in runs)
+        for name in names
+    }
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": round(statistics.median(totals) / 1000, 1),
+        "top": [{"package": name, "ms": round(us / 1000, 1)} for name, us in ranked],
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_last(history: Path, module: str) -> dict | None:
+    if not history.exists():
+        return None
+    last = None
+    for line in history.read_text(encoding="utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("module") == module:
+            last = record
+    return last
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cold-start import cost report")
+    parser.add_argument("--module", default="index", help="index (Vercel function) or server")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument("--no-history", action="store_true")
+    parser.add_argument("--budget-ms", type=float, default=None, help="exit 1 if median total exceeds the budget")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = summarize([measure(args.module) for _ in range(max(1, args.runs))], args.top)
+    report.update({
+        "module": args.module,
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+    })
+    previous = None if args.no_history else load_last(args.history, args.module)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        delta = ""
+        if previous:
+            diff = report["total_ms"] - previous["total_ms"]
+            delta = f" ({diff:+.1f} ms vs {previous['revision']})"
+        print(f"import {args.module}: {report['total_ms']:.1f} ms{delta}")
+        for item in report["top"]:
+            print(f"  {item['package']:<28} {item['ms']:>8.1f} ms")
+
+    if not args.no_history:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"✗ over budget: {report['total_ms']:.1f} ms > {args.budget_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,6 +33,27 @@ fi
 
 echo ""
 
+# Test 1b: Deep Health Check (synchronous probe of all dependencies)
+# Deep mode requires the HEALTH_TOKEN (or METRICS_TOKEN) configured on the server
+echo -e "${YELLOW}Test 1b: Deep Health Check${NC}"
+if [ -z "$HEALTH_TOKEN" ]; then
+    echo -e "${YELLOW}- Skipped: set HEALTH_TOKEN to run the deep check${NC}"
+else
+    DEEP_RESPONSE=$(curl -s -w "\n%{http_code}" -H "Authorization: Bearer $HEALTH_TOKEN" "$API_URL/api/health?deep=1")
+    HTTP_CODE=$(echo "$DEEP_RESPONSE" | tail -n 1)
+    BODY=$(echo "$DEEP_RESPONSE" | head -n -1)
+
+    if [ "$HTTP_CODE" == "200" ]; then
+        echo -e "${GREEN}✓ Deep health check returned 200 OK${NC}"
+        echo "Response: $BODY"
+    else
+        echo -e "${RED}✗ Deep health check failed with status $HTTP_CODE${NC}"
+        echo "Response: $BODY"
+    fi
+fi
+
+echo ""
+
 # Test 2: Root API Endpoint  
 echo -e "${YELLOW}Test 2: Root API Endpoint${NC}"
 ROOT_RESPONSE=$(curl -s -w "\n%{http_code}" "$API_URL/api/")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Вендоринг BPE-файлов tiktoken
+=============================
+Скачивает файлы кодировок в ``backend/vendor/tiktoken_cache`` в формате
+кэша tiktoken (имя файла — sha1 URL). ``memory/smart_context.py`` при
+наличии каталога выставляет ``TIKTOKEN_CACHE_DIR``, и холодный старт
+Vercel-функции не ходит в сеть за BPE (o200k_base ≈ 3.6 МБ).
+
+Каталог коммитится в репозиторий вместе с изменением версии tiktoken
+или списка моделей; запускать на машине с доступом в интернет:
+
+    python scripts/vendor_tiktoken.py
+    python scripts/vendor_tiktoken.py --encodings cl100k_base o200k_base
+    python scripts/vendor_tiktoken.py --check      # только проверить наличие
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_TARGET = ROOT / "backend" / "vendor" / "tiktoken_cache"
+# gpt-4o → o200k_base, остальные модели и fallback SmartContext → cl100k_base
+DEFAULT_ENCODINGS = ("o200k_base", "cl100k_base")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Vendor tiktoken BPE files for offline cold starts")
+    parser.add_argument("--target", type=Path, default=DEFAULT_TARGET)
+    parser.add_argument("--encodings", nargs="+", default=list(DEFAULT_ENCODINGS))
+    parser.add_argument("--check", action="store_true", help="load from the vendored cache only, no downloads")
+    args = parser.parse_args(argv)
+
+    args.target.mkdir(parents=True, exist_ok=True)
+    # Должно быть выставлено до первого обращения tiktoken к кэшу
+    os.environ["TIKTOKEN_CACHE_DIR"] = str(args.target)
+    before = {p.name for p in args.target.iterdir()}
+
+    import tiktoken
+
+    failed = []
+    for name in args.encodings:
+        try:
+            encoding = tiktoken.get_encoding(name)
+        except Exception as exc:  # noqa: BLE001
+            print(f"✗ {name}: {exc}", file=sys.stderr)
+            failed.append(name)
+            continue
+        print(f"✓ {name}: {encoding.n_vocab} tokens")
+
+    added = sorted({p.name for p in args.target.iterdir()} - before)
+    if args.check and added:
+        print(f"✗ cache was incomplete, downloaded: {', '.join(added)}", file=sys.stderr)
+        return 1
+    for name in added:
+        size_mb = (args.target / name).stat().st_size / 1e6
+        print(f"  + {name} ({size_mb:.1f} MB)")
+    print(f"Cache dir: {args.target}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Общие настройки pytest: модули backend и frontend/api импортируются так же,
+как в приложении; общие фейки тестов — фикстуры.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+for path in (ROOT_DIR / "backend", ROOT_DIR / "frontend" / "api"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+# ──────────────────────────────
+# Общие фейки
+# ──────────────────────────────
+
+class FakeClock:
+    """Часы, которые двигает тест (``clock.now = 5``)."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.documents = []
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+
+
+class MemoryDatabase:
+    """Коллекции ChatService в памяти (только insert_one)."""
+
+    def __init__(self):
+        self.chat_messages = MemoryCollection()
+        self.contact_forms = MemoryCollection()
+
+
+class StubLLM:
+    def __init__(self):
+        self.is_configured = True
+        self.fail = False
+        self.requests = []
+
+    async def complete(self, request):
+        self.requests.append(request)
+        if self.fail:
+            raise TimeoutError("provider timeout")
+        return f"ответ на: {request.message}"
+
+
+class RecordingNotifier:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, text):
+        self.messages.append(text)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def memory_db():
+    return MemoryDatabase()
+
+
+@pytest.fixture
+def llm():
+    return StubLLM()
+
+
+@pytest.fixture
+def notifier():
+    return RecordingNotifier()
+
+
+@pytest.fixture
+def make_service(memory_db, llm, notifier):
+    """Фабрика ChatService: база в памяти, заглушка LLM и notifier; зависимости переопределяются."""
+    from services.chat_service import ChatService
+
+    def factory(**overrides):
+        deps = {"database": lambda: memory_db, "llm": llm, "notifier": notifier}
+        deps.update(overrides)
+        return ChatService(**deps)
+
+    return factory
@@ -0,0 +1,83 @@
+"""
+Локальный фейковый Telegram Bot API для тестов уведомлений.
+
+Настоящий HTTP-сервер aiohttp на 127.0.0.1 (порт выбирает ОС) с
+``/bot<token>/sendMessage``: ведёт себя как Telegram там, где это важно
+очереди уведомлений — предел 4096 символов (400), rate limit на чат
+(429 с ``parameters.retry_after``) и заранее заданные сбои.
+
+    async with FakeTelegram(per_chat_limit=2, window=1) as telegram:
+        notifier = TelegramNotifier("token", "42", api_url=telegram.url)
+"""
+
+import math
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, per_chat_limit=None, window=1.0, max_chars=4096):
+        self.per_chat_limit = per_chat_limit
+        self.window = window
+        self.max_chars = max_chars
+        # (status, retry_after) для следующих запросов, по порядку
+        self.script = deque()
+        self.messages = []
+        self.requests = []
+        self._sent_at = defaultdict(deque)
+        self._runner = None
+        self.url = None
+
+    def fail_next(self, status, retry_after=0):
+        self.script.append((status, retry_after))
+
+    def texts(self, chat_id="42"):
+        return [text for chat, text in self.messages if chat == chat_id]
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self._send_message)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    async def _send_message(self, request):
+        payload = await request.json()
+        chat_id = str(payload["chat_id"])
+        text = payload["text"]
+        self.requests.append((chat_id, text))
+
+        if self.script:
+            status, retry_after = self.script.popleft()
+            return self._error(status, "Scripted failure", retry_after)
+        if len(text.encode("utf-16-le")) // 2 > self.max_chars:
+            return self._error(400, "Bad Request: message is too long")
+
+        if self.per_chat_limit is not None:
+            now = time.monotonic()
+            sent = self._sent_at[chat_id]
+            while sent and sent[0] <= now - self.window:
+                sent.popleft()
+            if len(sent) >= self.per_chat_limit:
+                retry_after = max(1, math.ceil(sent[0] + self.window - now))
+                return self._error(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+            sent.append(now)
+
+        self.messages.append((chat_id, text))
+        return web.json_response({"ok": True, "result": {"message_id": len(self.messages), "text": text}})
+
+    @staticmethod
+    def _error(status, description, retry_after=0):
+        payload = {"ok": False, "error_code": status, "description": description}
+        if retry_after:
+            payload["parameters"] = {"retry_after": retry_after}
+        return web.json_response(payload, status=status)
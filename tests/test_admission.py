@@ -0,0 +1,120 @@
+"""
+Тесты admission control LLM-вызовов (backend/services/admission.py).
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services.admission import AdmissionControlledClient, AdmissionRejected, ProviderAdmission, TokenBucket
+from services.llm import LLMRequest
+from services.llm_gateway import LLMProviderError
+from services.llm_router import LLMRouter
+from services.router import create_router
+
+
+class SlowLLM:
+    is_configured = True
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def complete(self, request):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return "ok"
+
+
+def admission(**overrides):
+    settings = {"rate": 1000, "burst": 1000, "concurrency": 2, "queue_size": 10, "max_wait": 1}
+    settings.update(overrides)
+    return ProviderAdmission("anthropic", **settings)
+
+
+def request():
+    return LLMRequest("s1", "prompt", "Сколько стоит сайт?", model="claude-sonnet")
+
+
+class TestTokenBucket:
+    """Скорость и ёмкость"""
+
+    def test_burst_then_refill(self, clock):
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+        assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+        assert bucket.take() == pytest.approx(0.5)
+        clock.now = 0.5
+        assert bucket.take() == 0
+
+
+class TestProviderAdmission:
+    """Семафор, очередь и быстрый отказ"""
+
+    def test_concurrency_is_bounded(self):
+        llm = SlowLLM()
+        client = AdmissionControlledClient(llm, {"anthropic": admission(concurrency=2)})
+
+        async def scenario():
+            return await asyncio.gather(*(client.complete(request()) for _ in range(6)))
+
+        assert asyncio.run(scenario()) == ["ok"] * 6
+        assert llm.peak == 2
+
+    def test_full_queue_rejects_immediately(self):
+        client = AdmissionControlledClient(SlowLLM(delay=0.2), {"anthropic": admission(concurrency=1, queue_size=1)})
+
+        async def scenario():
+            return await asyncio.gather(*(client.complete(request()) for _ in range(4)), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        rejected = [r for r in results if isinstance(r, AdmissionRejected)]
+        assert results.count("ok") == 2
+        assert len(rejected) == 2 and rejected[0].reason == "queue_full"
+        assert rejected[0].retry_after >= 1
+
+    def test_wait_timeout(self):
+        client = AdmissionControlledClient(SlowLLM(delay=0.3), {"anthropic": admission(concurrency=1, max_wait=0.05)})
+
+        async def scenario():
+            return await asyncio.gather(client.complete(request()), client.complete(request()), return_exceptions=True)
+
+        ok, rejected = asyncio.run(scenario())
+        assert ok == "ok"
+        assert isinstance(rejected, AdmissionRejected) and rejected.reason == "timeout"
+
+
+class TestOverloadResponse:
+    """Перегрузка — 503 с Retry-After, а не 500"""
+
+    def test_chat_returns_503_with_retry_after(self, make_service):
+        class RejectingLLM:
+            is_configured = True
+
+            async def complete(self, request):
+                raise AdmissionRejected("anthropic", "queue_full", retry_after=2.4)
+
+        service = make_service(llm=RejectingLLM())
+        app = FastAPI()
+        app.include_router(create_router(lambda: service))
+
+        response = TestClient(app).post("/api/chat", json={"session_id": "s1", "message": "Нужен сайт"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "3"
+
+    def test_rejection_survives_failed_failover(self):
+        class PartlyConfiguredLLM:
+            is_configured = True
+
+            async def complete(self, request):
+                if request.model == "claude-sonnet":
+                    raise AdmissionRejected("anthropic", "queue_full", retry_after=2)
+                raise LLMProviderError(request.model, "provider is not configured")
+
+        router = LLMRouter(PartlyConfiguredLLM(), {"deadline": 5, "hedge": False})
+        with pytest.raises(AdmissionRejected):
+            asyncio.run(router.complete(LLMRequest("s1", "prompt", "Нужен сайт", model="claude-sonnet")))
@@ -0,0 +1,183 @@
+"""
+Тесты наблюдателя change stream (backend/memory/change_watcher.py).
+
+Интеграционный тест с настоящим change stream запускается при заданном
+``CONTEXT_WATCHER_TEST_MONGO_URL`` — локальный single-node replica set:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+    CONTEXT_WATCHER_TEST_MONGO_URL=mongodb://localhost:27017/?directConnection=true pytest tests/test_change_watcher.py
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from memory.change_watcher import ContextChangeWatcher
+
+
+class RecordingContext:
+    retrieval = False
+
+    def __init__(self):
+        self.invalidated = []
+        self.built = []
+
+    async def invalidate_session(self, session_id):
+        self.invalidated.append(session_id)
+
+    async def get_context(self, session_id, db, query=None):
+        self.built.append(session_id)
+        return []
+
+
+def insert(doc_id, session_id):
+    return {
+        "operationType": "insert",
+        "ns": {"coll": "chat_messages"},
+        "documentKey": {"_id": doc_id},
+        "fullDocument": {"_id": doc_id, "session_id": session_id},
+        "_id": {"_data": f"token-{doc_id}"},
+    }
+
+
+def delete(doc_id):
+    return {"operationType": "delete", "ns": {"coll": "chat_messages"}, "documentKey": {"_id": doc_id}}
+
+
+class FakeStream:
+    def __init__(self, events, error=None):
+        self.events = list(events)
+        self.error = error
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.events:
+            event = self.events.pop(0)
+            self.resume_token = event["_id"]
+            return event
+        raise self.error or StopAsyncIteration
+
+
+class FakeDB:
+    """watch() отдаёт заранее заданные потоки по очереди."""
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.resume_tokens = []
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resume_tokens.append(resume_after)
+        return self.streams.pop(0)
+
+
+class TestHandle:
+    """Сброс, удаления и прогрев активных сессий"""
+
+    def test_insert_invalidates_and_prewarms_once(self):
+        context = RecordingContext()
+        watcher = ContextChangeWatcher(lambda: None, context, prewarm_delay=0.01)
+
+        async def scenario():
+            for doc_id in range(3):
+                await watcher.handle(insert(doc_id, "s1"))
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+        assert context.invalidated == ["s1"] * 3
+        assert context.built == ["s1"]
+        assert watcher.active_sessions() == ["s1"]
+
+    def test_delete_resolves_session_from_seen_inserts(self):
+        context = RecordingContext()
+        watcher = ContextChangeWatcher(lambda: None, context, prewarm=False)
+
+        async def scenario():
+            await watcher.handle(insert("a", "s1"))
+            return await watcher.handle(delete("a")), await watcher.handle(delete("unknown"))
+
+        assert asyncio.run(scenario()) == ("s1", None)
+        assert context.invalidated == ["s1", "s1"]
+
+    def test_inactive_sessions_expire(self):
+        now = [0.0]
+        watcher = ContextChangeWatcher(lambda: None, RecordingContext(), prewarm=False, active_window=60, clock=lambda: now[0])
+        asyncio.run(watcher.handle(insert(1, "s1")))
+        now[0] = 61
+        assert watcher.active_sessions() == []
+
+
+class TestStream:
+    """Возобновление после обрыва и отключение без replica set"""
+
+    def test_resumes_from_last_token(self):
+        context = RecordingContext()
+        db = FakeDB([
+            FakeStream([insert(1, "s1")], error=AutoReconnect("primary stepped down")),
+            FakeStream([insert(2, "s2")], error=OperationFailure("not a replica set", code=40573)),
+        ])
+        watcher = ContextChangeWatcher(lambda: db, context, prewarm=False, retry_backoff=0)
+
+        asyncio.run(asyncio.wait_for(watcher._run(), 1))
+        assert db.resume_tokens == [None, {"_data": "token-1"}]
+        assert context.invalidated == ["s1", "s2"]
+
+
+    def test_failed_event_does_not_stop_stream(self):
+        class FlakyContext(RecordingContext):
+            async def invalidate_session(self, session_id):
+                if session_id == "s1":
+                    raise ConnectionError("redis down")
+                await super().invalidate_session(session_id)
+
+        context = FlakyContext()
+        db = FakeDB([
+            FakeStream([insert(1, "s1"), insert(2, "s2")], error=OperationFailure("not a replica set", code=40573)),
+        ])
+        watcher = ContextChangeWatcher(lambda: db, context, prewarm=False, retry_backoff=0)
+
+        asyncio.run(asyncio.wait_for(watcher._run(), 1))
+        assert context.invalidated == ["s2"]
+        assert watcher.resume_token == {"_data": "token-2"}
+
+
+@pytest.mark.skipif(not os.getenv("CONTEXT_WATCHER_TEST_MONGO_URL"), reason="нужен replica set")
+class TestReplicaSet:
+    """Настоящий change stream локального replica set"""
+
+    def test_insert_from_another_writer_invalidates(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def scenario():
+            client = AsyncIOMotorClient(os.environ["CONTEXT_WATCHER_TEST_MONGO_URL"])
+            db = client[f"watcher_test_{uuid.uuid4().hex[:8]}"]
+            context = RecordingContext()
+            watcher = ContextChangeWatcher(lambda: db, context, prewarm_delay=0)
+            watcher.start()
+            try:
+                await asyncio.sleep(0.5)
+                await db.chat_messages.insert_one({"session_id": "s1", "user_message": "привет"})
+                for _ in range(50):
+                    if context.built:
+                        break
+                    await asyncio.sleep(0.1)
+            finally:
+                await watcher.stop()
+                await client.drop_database(db.name)
+                client.close()
+            return context
+
+        context = asyncio.run(scenario())
+        assert context.invalidated == ["s1"] and context.built == ["s1"]
@@ -0,0 +1,101 @@
+"""
+Тесты ядра чата (backend/services/chat_service.py) и общего роутера.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services.chat_service import ChatRequest, ContactRequest, ServiceUnavailableError
+from services.prompts import IRRELEVANT_RESPONSE
+from services.router import create_router
+
+
+class StaticIntent:
+    def __init__(self, relevant):
+        self.relevant = relevant
+
+    async def classify_async(self, message):
+        return SimpleNamespace(is_relevant=self.relevant)
+
+
+class TestChatService:
+    """Стадии чата и заявки без транспорта"""
+
+    def test_irrelevant_message_skips_llm(self, make_service, llm, memory_db):
+        service = make_service(intent_checker=StaticIntent(False))
+
+        reply = asyncio.run(service.chat(ChatRequest("s1", "рецепт борща")))
+        assert reply.response == IRRELEVANT_RESPONSE
+        assert reply.relevant is False
+        assert llm.requests == [] and memory_db.chat_messages.documents == []
+
+    def test_chat_stores_message_and_notifies_lead(self, make_service, llm, notifier, memory_db):
+        service = make_service(intent_checker=StaticIntent(True))
+
+        request = ChatRequest("s1", "Нужен сайт <b>", model="gpt-4o", user_data={"name": "Анна", "contact": "+7900"})
+        reply = asyncio.run(service.chat(request))
+
+        assert reply.response == "ответ на: Нужен сайт <b>"
+        assert reply.model == "gpt-4o"
+        assert llm.requests[0].provider == "openai"
+        [record] = memory_db.chat_messages.documents
+        assert record["session_id"] == "s1" and record["model"] == "gpt-4o"
+        [lead] = notifier.messages
+        assert "Нужен сайт &lt;b&gt;" in lead
+
+    def test_unknown_model_falls_back_to_default(self, make_service, notifier):
+        service = make_service()
+        reply = asyncio.run(service.chat(ChatRequest("s1", "Сколько стоит аудит?", model="gemini-pro")))
+        assert reply.model == "claude-sonnet"
+        assert notifier.messages == []
+
+    def test_unconfigured_llm_is_unavailable(self, make_service, llm):
+        llm.is_configured = False
+        service = make_service()
+        try:
+            asyncio.run(service.chat(ChatRequest("s1", "Привет")))
+        except ServiceUnavailableError as exc:
+            assert exc.status_code == 503
+        else:
+            raise AssertionError("ServiceUnavailableError expected")
+
+    def test_submit_contact(self, make_service, notifier, memory_db):
+        service = make_service()
+        result = asyncio.run(service.submit_contact(ContactRequest("Иван", "ivan@example.com", "website")))
+        assert result["success"] is True
+        assert memory_db.contact_forms.documents[0]["status"] == "new"
+        assert "Не указано" in notifier.messages[0]
+
+
+class TestChatRouter:
+    """Отображение ошибок ядра в HTTP-статусы"""
+
+    def make_client(self, service):
+        app = FastAPI()
+        app.include_router(create_router(lambda: service))
+        return TestClient(app)
+
+    def test_chat_endpoint(self, make_service):
+        service = make_service()
+        response = self.make_client(service).post("/api/chat", json={"session_id": "s1", "message": "Нужен бот"})
+        assert response.status_code == 200
+        assert response.json() == {"response": "ответ на: Нужен бот", "session_id": "s1"}
+
+    def test_llm_failure_is_500(self, make_service, llm):
+        llm.fail = True
+        service = make_service()
+        response = self.make_client(service).post("/api/chat", json={"session_id": "s1", "message": "Нужен бот"})
+        assert response.status_code == 500
+        assert response.json()["detail"] == "Ошибка обработки сообщения"
+
+    def test_missing_database_is_503(self, make_service):
+        def no_database():
+            raise ServiceUnavailableError("Database is not configured")
+
+        service = make_service(database=no_database)
+        client = self.make_client(service)
+        response = client.post("/api/contact", json={"name": "Иван", "contact": "+7900", "service": "bot"})
+        assert response.status_code == 503
@@ -0,0 +1,98 @@
+"""
+Тесты circuit breaker'а и адаптивного таймаута (utils.circuit_breaker).
+"""
+
+import asyncio
+
+import pytest
+
+from utils.circuit_breaker import AdaptiveTimeout, CircuitBreaker, CircuitState
+from utils.intent_checker import YAGPT_CONFIG, HybridIntentChecker
+
+
+class TestCircuitBreaker:
+    """Переходы closed → open → half-open → closed"""
+
+    def make(self, clock):
+        return CircuitBreaker(name="test", window_seconds=10, min_requests=4,
+                              error_rate_threshold=0.5, open_seconds=5, clock=clock)
+
+    def test_trips_on_error_rate(self, clock):
+        breaker = self.make(clock)
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state is CircuitState.CLOSED
+
+        breaker.record_failure()
+        assert breaker.state is CircuitState.OPEN
+        assert breaker.allow() is False
+
+    def test_old_events_leave_window(self, clock):
+        breaker = self.make(clock)
+        for _ in range(3):
+            breaker.record_failure()
+        clock.now = 20
+        breaker.record_failure()
+        assert breaker.state is CircuitState.CLOSED
+
+    def test_half_open_allows_single_probe(self, clock):
+        breaker = self.make(clock)
+        for _ in range(4):
+            breaker.record_failure()
+
+        clock.now = 6
+        assert breaker.state is CircuitState.HALF_OPEN
+        assert breaker.allow() is True
+        assert breaker.allow() is False
+
+        breaker.record_success()
+        assert breaker.state is CircuitState.CLOSED
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = self.make(clock)
+        for _ in range(4):
+            breaker.record_failure()
+        clock.now = 6
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state is CircuitState.OPEN
+
+
+class TestAdaptiveTimeout:
+    """Таймаут следует за p95 в заданных границах"""
+
+    def test_uses_initial_until_enough_samples(self):
+        timeout = AdaptiveTimeout(initial=0.3, min_samples=5)
+        timeout.observe(0.01)
+        assert timeout.current == 0.3
+
+    def test_tracks_p95_with_bounds(self):
+        timeout = AdaptiveTimeout(minimum=0.1, maximum=1.0, multiplier=2.0, min_samples=10)
+        for _ in range(95):
+            timeout.observe(0.1)
+        for _ in range(5):
+            timeout.observe(0.4)
+        assert timeout.current == pytest.approx(0.2)
+
+        for _ in range(100):
+            timeout.observe(5.0)
+        assert timeout.current == 1.0
+
+
+class TestHybridWithOpenCircuit:
+    """Разомкнутая цепь — мгновенный fallback без сети"""
+
+    def test_open_circuit_skips_network(self):
+        checker = HybridIntentChecker()
+        checker.ai.config = {**YAGPT_CONFIG, "api_key": "key", "folder_id": "folder"}
+        checker.ai.breaker._state = CircuitState.OPEN
+        checker.ai.breaker._opened_at = checker.ai.breaker.clock()
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("сеть не должна вызываться")
+
+        checker.ai._call_api_with_retry = fail
+        result = asyncio.run(checker.classify_async("Сколько стоит сайт?"))
+        assert result.confidence == 0.5
+        assert checker.classification_logs[-1]["fallback_used"] is True
@@ -0,0 +1,87 @@
+"""
+Тесты общего MongoDB-клиента (backend/db/connection.py).
+"""
+
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+from pymongo import monitoring
+
+from db import connection
+
+
+@pytest.fixture(autouse=True)
+def reset_client():
+    connection.close_client()
+    yield
+    connection.close_client()
+
+
+class TestProfiles:
+    """Параметры пула по профилю развёртывания"""
+
+    def test_serverless_is_lazy_and_small(self):
+        options = connection.client_options("serverless")
+        assert options["minPoolSize"] == 0
+        assert options["maxPoolSize"] < connection.client_options("server")["maxPoolSize"]
+
+    def test_env_overrides(self, monkeypatch):
+        monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "4")
+        monkeypatch.setenv("MONGO_MIN_POOL_SIZE", "8")
+        options = connection.client_options("server")
+        assert options["maxPoolSize"] == 4
+        assert options["minPoolSize"] == 4
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            connection.client_options("lambda")
+
+
+class TestSharedClient:
+    """Один клиент на процесс, пересоздание при смене event loop"""
+
+    def test_reused_within_loop(self):
+        async def grab():
+            return connection.get_client("mongodb://localhost:1"), connection.get_client()
+
+        first, second = asyncio.run(grab())
+        assert first is second
+
+    def test_recreated_for_new_loop(self):
+        async def grab():
+            return connection.get_client("mongodb://localhost:1")
+
+        first = asyncio.run(grab())
+        second = asyncio.run(grab())
+        assert first is not second
+
+    def test_sink_follows_recreated_client(self, monkeypatch):
+        from utils.intent_logs import MongoLogSink
+
+        monkeypatch.setenv("DB_NAME", "sink_test")
+        sink = MongoLogSink(connection.get_database)
+
+        async def target():
+            connection.get_client("mongodb://localhost:1")
+            return sink.database()[sink.collection].database.client
+
+        first = asyncio.run(target())
+        second = asyncio.run(target())
+        # держатели берут базу через get_database — не закрытый старый клиент
+        assert second is connection.get_client() and second is not first
+
+
+class TestPoolMetrics:
+    """Ожидание выдачи соединения из пула"""
+
+    def test_checkout_wait_observed(self):
+        listener = connection.PoolMetricsListener()
+        address = ("localhost", 27017)
+        before = REGISTRY.get_sample_value("mongo_pool_checkout_wait_seconds_count") or 0.0
+
+        listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+        listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1, None))
+
+        assert REGISTRY.get_sample_value("mongo_pool_checkout_wait_seconds_count") - before == 1
+        assert listener.checkouts == 1
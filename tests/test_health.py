@@ -0,0 +1,93 @@
+"""
+Тесты фонового мониторинга зависимостей (backend/utils/health.py).
+"""
+
+import asyncio
+
+from utils.health import HealthMonitor, HealthProbe
+
+
+def counting_probe(calls, fail=False, delay=0.0):
+    async def check():
+        calls.append(1)
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise ConnectionError("refused")
+    return check
+
+
+class TestHealthMonitor:
+    """Снимок, статусы и обновление по требованию"""
+
+    def test_snapshot_served_without_probing(self, clock):
+        calls = []
+        monitor = HealthMonitor([HealthProbe("mongodb", counting_probe(calls), critical=True)], interval=10, clock=clock)
+
+        async def scenario():
+            first = await monitor.current()
+            for _ in range(5):
+                await monitor.current()
+            return first
+
+        snapshot = asyncio.run(scenario())
+        assert len(calls) == 1
+        assert snapshot["status"] == "healthy"
+        assert snapshot["checks"]["mongodb"]["p95_ms"] is not None
+
+    def test_deep_and_stale_refresh(self, clock):
+        calls = []
+        monitor = HealthMonitor([HealthProbe("mongodb", counting_probe(calls))], interval=10, clock=clock)
+
+        async def scenario():
+            await monitor.current()
+            await monitor.current(deep=True)
+            clock.now = 11
+            await monitor.current()      # устарел: обновление в фоне
+            await asyncio.sleep(0.01)
+            await monitor.stop()
+
+        asyncio.run(scenario())
+        assert len(calls) == 3
+
+    def test_statuses_and_timeout(self):
+        monitor = HealthMonitor(
+            [
+                HealthProbe("mongodb", counting_probe([]), critical=True),
+                HealthProbe("telegram", counting_probe([], delay=0.2)),
+            ],
+            timeout=0.01,
+        )
+        snapshot = asyncio.run(monitor.probe_all())
+        assert snapshot["status"] == "degraded"
+        assert "timeout" in snapshot["checks"]["telegram"]["error"]
+
+        monitor.probes[0].check = counting_probe([], fail=True)
+        snapshot = asyncio.run(monitor.probe_all())
+        assert snapshot["status"] == "unhealthy"
+        assert snapshot["checks"]["mongodb"]["consecutive_failures"] == 1
+
+    def test_concurrent_deep_rounds_are_coalesced(self):
+        calls = []
+        monitor = HealthMonitor([HealthProbe("telegram", counting_probe(calls, delay=0.05))])
+
+        async def scenario():
+            await asyncio.gather(*(monitor.current(deep=True) for _ in range(20)))
+            await monitor.current(deep=True)
+
+        asyncio.run(scenario())
+        # 20 одновременных deep-запросов — один раунд, следующий — свой
+        assert len(calls) == 2
+
+    def test_errors_are_redacted_without_detail(self):
+        async def check():
+            raise ConnectionError("mongodb://admin@10.0.0.5:27017 refused")
+
+        monitor = HealthMonitor([HealthProbe("mongodb", check, critical=True)])
+
+        async def scenario():
+            return await monitor.current(), await monitor.current(detail=True)
+
+        public, detailed = asyncio.run(scenario())
+        assert public["checks"]["mongodb"]["error"] == "ConnectionError"
+        assert "10.0.0.5" in detailed["checks"]["mongodb"]["error"]
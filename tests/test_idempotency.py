@@ -0,0 +1,153 @@
+"""
+Тесты идемпотентности /api/contact (backend/services/idempotency.py).
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import fakeredis.aioredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from services.chat_service import ContactRequest
+from services.idempotency import ContactDeduplicator, RecentKeys
+from services.router import create_router
+
+
+class CountingDatabase:
+    """Фабрика базы, считающая обращения (повтор не должен доходить до MongoDB)."""
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.db
+
+
+@pytest.fixture
+def contact_service(make_service):
+    """Сервис заявок над mongomock; все экземпляры шлют в общий notifier."""
+    def factory(db=None, recent=None, **dedup):
+        database = CountingDatabase(db if db is not None else AsyncMongoMockClient()["contact_test"])
+        service = make_service(
+            database=database,
+            llm=None,
+            contact_dedup=ContactDeduplicator(recent if recent is not None else RecentKeys(), **dedup),
+        )
+        return service, database
+    return factory
+
+
+def form(contact="+7 (900) 123-45-67", name="Иван"):
+    return ContactRequest(name, contact, "Чат-бот", "Перезвоните")
+
+
+class TestReplay:
+    """Повтор возвращает исходный ответ без записи и уведомления"""
+
+    def test_idempotency_key_replay_skips_mongo_and_telegram(self, contact_service, notifier):
+        service, database = contact_service()
+
+        async def scenario():
+            first = await service.submit_contact(form(), "click-1")
+            calls = database.calls
+            second = await service.submit_contact(form(), "click-1")
+            return first, second, calls, await database.db.contact_forms.count_documents({})
+
+        first, second, calls, documents = asyncio.run(scenario())
+        assert second == first and first["success"] is True
+        assert database.calls == calls
+        assert documents == 1 and len(notifier.messages) == 1
+
+    def test_content_hash_ignores_phone_formatting(self, contact_service, notifier):
+        service, database = contact_service()
+
+        async def scenario():
+            await service.submit_contact(form("+7 (900) 123-45-67"))
+            await service.submit_contact(form("+7900-123-4567", name="  иван "))
+            await service.submit_contact(form("+79001234568"))
+            return await database.db.contact_forms.count_documents({})
+
+        assert asyncio.run(scenario()) == 2
+        assert len(notifier.messages) == 2
+
+    def test_concurrent_double_click_creates_one_record(self, contact_service, notifier):
+        service, database = contact_service()
+
+        async def scenario():
+            responses = await asyncio.gather(*(service.submit_contact(form()) for _ in range(5)))
+            return responses, await database.db.contact_forms.count_documents({})
+
+        responses, documents = asyncio.run(scenario())
+        assert documents == 1 and len(notifier.messages) == 1
+        assert len({response["id"] for response in responses}) == 1
+
+
+class TestAcrossProcesses:
+    """Другой процесс узнаёт повтор по уникальному индексу или общему Redis"""
+
+    def test_unique_index_catches_replay_in_another_process(self, contact_service, notifier):
+        db = AsyncMongoMockClient()["contact_test"]
+        first_service, _ = contact_service(db)
+        second_service, _ = contact_service(db)
+
+        async def scenario():
+            first = await first_service.submit_contact(form(), "retry-7")
+            second = await second_service.submit_contact(form(), "retry-7")
+            return first, second, await db.contact_forms.count_documents({})
+
+        first, second, documents = asyncio.run(scenario())
+        assert second == first and documents == 1
+        assert len(notifier.messages) == 1
+
+    def test_shared_redis_answers_without_mongo(self, contact_service):
+        redis = fakeredis.aioredis.FakeRedis()
+        db = AsyncMongoMockClient()["contact_test"]
+        first_service, _ = contact_service(db, RecentKeys(redis=redis))
+        second_service, second_database = contact_service(db, RecentKeys(redis=redis))
+
+        async def scenario():
+            first = await first_service.submit_contact(form())
+            return first, await second_service.submit_contact(form())
+
+        first, second = asyncio.run(scenario())
+        assert second == first and second_database.calls == 0
+
+    def test_key_expires_after_window(self, contact_service):
+        db = AsyncMongoMockClient()["contact_test"]
+        service, _ = contact_service(db, window=60)
+
+        async def scenario():
+            await service.submit_contact(form())
+            # заявка час назад и другой процесс без набора недавних ключей
+            await db.contact_forms.update_many({}, {"$set": {"timestamp": datetime.utcnow() - timedelta(hours=1)}})
+            other, _ = contact_service(db, window=60)
+            await other.submit_contact(form())
+            return await db.contact_forms.find().to_list(None)
+
+        documents = asyncio.run(scenario())
+        assert len(documents) == 2
+        assert len({document["idempotency_key"] for document in documents}) == 2
+
+
+class TestRouter:
+    """Заголовок Idempotency-Key в /api/contact"""
+
+    def test_reused_key_with_other_content_is_422(self, contact_service):
+        service, _ = contact_service()
+        app = FastAPI()
+        app.include_router(create_router(lambda: service))
+        client = TestClient(app)
+        payload = {"name": "Иван", "contact": "+7900", "service": "bot"}
+
+        first = client.post("/api/contact", json=payload, headers={"Idempotency-Key": "abc"})
+        replay = client.post("/api/contact", json=payload, headers={"Idempotency-Key": "abc"})
+        conflict = client.post("/api/contact", json={**payload, "service": "site"}, headers={"Idempotency-Key": "abc"})
+
+        assert first.status_code == replay.status_code == 200
+        assert replay.json() == first.json()
+        assert conflict.status_code == 422
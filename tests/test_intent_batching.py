@@ -0,0 +1,85 @@
+"""
+Тесты микро-батчинга запросов к YandexGPT (BatchingIntentClassifier).
+"""
+
+import asyncio
+import json
+
+from utils.intent_checker import YAGPT_CONFIG, BatchingIntentClassifier
+
+
+def make_classifier(**overrides):
+    config = {**YAGPT_CONFIG, "api_key": "test", "folder_id": "test", **overrides}
+    return BatchingIntentClassifier(config)
+
+
+class TestBatchingIntentClassifier:
+    """Сообщения в пределах окна уходят одним запросом"""
+
+    def test_concurrent_messages_share_one_request(self):
+        classifier = make_classifier(batch_window_ms=20, batch_max_size=10)
+        prompts = []
+
+        async def fake_call(prompt, attempts=2, max_tokens=None):
+            prompts.append(prompt)
+            return json.dumps([
+                {"index": 1, "intent": "GREETING", "confidence": 90, "is_relevant": True},
+                {"index": 0, "intent": "PRICE_INQUIRY", "confidence": 80, "is_relevant": True},
+            ])
+
+        classifier._call_api_with_retry = fake_call
+
+        async def run():
+            return await asyncio.gather(
+                classifier.classify("Сколько стоит сайт?"),
+                classifier.classify("Привет"),
+                classifier.classify("Сколько стоит сайт?"),
+            )
+
+        price, greeting, price_again = asyncio.run(run())
+
+        assert len(prompts) == 1
+        assert price.primary_intent == "PRICE_INQUIRY"
+        assert price.confidence == 0.8
+        assert greeting.primary_intent == "GREETING"
+        assert price_again == price
+
+    def test_max_batch_size_flushes_immediately(self):
+        classifier = make_classifier(batch_window_ms=10_000, batch_max_size=2)
+
+        async def fake_call(prompt, attempts=2, max_tokens=None):
+            return json.dumps([
+                {"intent": "GREETING", "confidence": 0.9, "is_relevant": True},
+                {"intent": "SPAM", "confidence": 0.9, "is_relevant": False},
+            ])
+
+        classifier._call_api_with_retry = fake_call
+
+        async def run():
+            return await asyncio.wait_for(
+                asyncio.gather(classifier.classify("привет"), classifier.classify("купи крипту")),
+                timeout=1,
+            )
+
+        greeting, spam = asyncio.run(run())
+        assert greeting.primary_intent == "GREETING"
+        assert spam.is_relevant is False
+
+    def test_missing_items_and_errors_propagate(self):
+        classifier = make_classifier(batch_window_ms=5)
+
+        async def fake_call(prompt, attempts=2, max_tokens=None):
+            return json.dumps([{"index": 0, "intent": "GREETING", "confidence": 90, "is_relevant": True}])
+
+        classifier._call_api_with_retry = fake_call
+
+        async def run():
+            return await asyncio.gather(
+                classifier.classify("привет"),
+                classifier.classify("непонятно"),
+                return_exceptions=True,
+            )
+
+        greeting, missing = asyncio.run(run())
+        assert greeting.primary_intent == "GREETING"
+        assert isinstance(missing, RuntimeError)
@@ -0,0 +1,127 @@
+"""
+Тесты кэша классификации намерений (utils.intent_cache).
+"""
+
+import asyncio
+
+import pytest
+
+from utils.intent_cache import IntentCache, normalize_key
+from utils.intent_checker import IntentResult
+
+RESULT = IntentResult(primary_intent="GREETING", confidence=0.9, entities={}, is_relevant=True)
+
+
+class TestNormalizeKey:
+    """Нормализация ключа кэша"""
+
+    def test_case_punctuation_and_whitespace(self):
+        assert normalize_key("Привет!") == normalize_key("  привет ") == "привет"
+        assert normalize_key("Сколько   стоит, сайт?") == "сколько стоит сайт"
+        assert normalize_key("Ёлка") == normalize_key("елка")
+
+    def test_symbols_are_kept(self):
+        assert normalize_key("Пишете на C++?") != normalize_key("Пишете на C?")
+        assert normalize_key("Цена в $") != normalize_key("Цена в ₽")
+
+    def test_long_text_is_hashed(self):
+        key = normalize_key("сайт " * 100)
+        assert key.startswith("h:")
+        assert len(key) == 42
+
+
+class TestIntentCache:
+    """TTL по источнику результата и статистика попаданий"""
+
+    def test_fallback_results_expire_faster(self):
+        now = [0.0]
+        cache = IntentCache(IntentResult, ai_ttl=100, fallback_ttl=1, timer=lambda: now[0])
+
+        cache.set("Привет", RESULT, source="ai")
+        cache.set("погода", RESULT, source="rules")
+        now[0] = 5.0
+
+        assert cache.get("привет!") == RESULT
+        assert cache.get("погода") is None
+
+    def test_hit_ratio(self):
+        cache = IntentCache(IntentResult)
+        cache.set("Привет", RESULT)
+        cache.get("привет")
+        cache.get("пока")
+
+        stats = cache.stats()
+        assert stats["hits_l1"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_redis_l2_is_shared_between_workers(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+
+        async def run():
+            first = IntentCache(IntentResult, redis_client=fakeredis.FakeAsyncRedis(server=server))
+            second = IntentCache(IntentResult, redis_client=fakeredis.FakeAsyncRedis(server=server))
+            await first.aset("Сколько стоит сайт?", RESULT, source="ai")
+            return await second.aget("сколько стоит сайт"), second.stats()
+
+        result, stats = asyncio.run(run())
+        assert result == RESULT
+        assert stats["hits_l2"] == 1
+
+    def test_redis_client_is_rebuilt_per_event_loop(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        clients = []
+
+        def factory():
+            clients.append(fakeredis.FakeAsyncRedis(server=server))
+            return clients[-1]
+
+        cache = IntentCache(IntentResult, redis_factory=factory)
+
+        async def write():
+            await cache.aset("Сколько стоит сайт?", RESULT)
+            await cache.aset("А сроки?", RESULT)
+
+        async def read():
+            cache.clear()
+            return await cache.aget("сколько стоит сайт")
+
+        # как is_relevant: каждый asyncio.run — новый event loop
+        asyncio.run(write())
+        assert asyncio.run(read()) == RESULT
+        assert len(clients) == 2
+
+    def test_previous_loop_client_is_closed(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        closed = []
+
+        class ClosingRedis(fakeredis.FakeAsyncRedis):
+            async def aclose(self, *args, **kwargs):
+                closed.append(self)
+                await super().aclose(*args, **kwargs)
+
+        clients = []
+
+        def factory():
+            clients.append(ClosingRedis(server=server))
+            return clients[-1]
+
+        cache = IntentCache(IntentResult, redis_factory=factory)
+
+        async def lookup():
+            return await cache.aget("сколько стоит сайт")
+
+        for _ in range(3):
+            asyncio.run(lookup())
+        # пул клиента прошлого loop освобождается, а не копится
+        assert closed == clients[:2]
+
+        async def lookup_and_close():
+            await lookup()
+            await cache.aclose()
+
+        asyncio.run(lookup_and_close())
+        assert closed == clients
@@ -0,0 +1,110 @@
+"""
+Тесты буфера телеметрии классификации (utils.intent_logs).
+"""
+
+import asyncio
+import json
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from utils.intent_logs import ClassificationLogBuffer, FileLogSink, MongoLogSink, parse_sample_rates
+
+
+class ListSink:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def write(self, records):
+        if self.fail:
+            raise ConnectionError("mongo down")
+        self.batches.append(list(records))
+
+
+class PartiallyFailingCollection:
+    """Первая вставка записывает одну запись и падает на остальных."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.failed = False
+
+    async def insert_many(self, records, ordered=True):
+        if self.failed:
+            return await self.collection.insert_many(records, ordered=ordered)
+        self.failed = True
+        await self.collection.insert_many(records[:1])
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 91, "errmsg": "shutdown in progress"}]})
+
+
+class TestClassificationLogBuffer:
+    """Фиксированная память, сэмплирование и сброс пачками"""
+
+    def test_buffer_is_bounded(self):
+        buffer = ClassificationLogBuffer(maxlen=3, sample_rates={})
+        for i in range(5):
+            buffer.add({"message": str(i), "source": "ai"})
+
+        assert len(buffer) == 3
+        assert [record["message"] for record in buffer] == ["2", "3", "4"]
+        assert buffer.stats()["dropped"] == 2
+
+    def test_sampling_by_source(self):
+        buffer = ClassificationLogBuffer(sample_rates={"local": 0.0})
+        assert buffer.add({"source": "local"}) is False
+        assert buffer.add({"source": "ai"}) is True
+        assert buffer.stats()["sampled_out"] == 1
+
+    def test_flush_in_batches(self):
+        buffer = ClassificationLogBuffer(maxlen=100, flush_batch=4, sample_rates={})
+        sink = ListSink()
+        buffer.sink = sink
+        for i in range(10):
+            buffer.add({"message": str(i)})
+
+        assert asyncio.run(buffer.flush()) == 10
+        assert [len(batch) for batch in sink.batches] == [4, 4, 2]
+        assert len(buffer) == 0
+
+    def test_failed_flush_keeps_records(self):
+        buffer = ClassificationLogBuffer(maxlen=10, sample_rates={})
+        buffer.sink = ListSink(fail=True)
+        for i in range(3):
+            buffer.add({"message": str(i)})
+
+        assert asyncio.run(buffer.flush()) == 0
+        assert [record["message"] for record in buffer] == ["0", "1", "2"]
+
+    def test_requeued_batch_drains_after_partial_write(self):
+        collection = AsyncMongoMockClient()["intent_test"].intent_logs
+        buffer = ClassificationLogBuffer(maxlen=10, sample_rates={})
+        database = {"intent_logs": PartiallyFailingCollection(collection)}
+        buffer.sink = MongoLogSink(lambda: database)
+        for i in range(3):
+            buffer.add({"message": str(i)})
+
+        async def run():
+            first = await buffer.flush()
+            # первая запись уже в базе со своим _id — повтор не падает на E11000
+            second = await buffer.flush()
+            return first, second, await collection.count_documents({})
+
+        assert asyncio.run(run()) == (0, 3, 3)
+        assert len(buffer) == 0
+
+    def test_stop_flushes_to_jsonl_file(self, tmp_path):
+        path = tmp_path / "intent_logs.jsonl"
+        buffer = ClassificationLogBuffer(flush_interval=60, sample_rates={})
+
+        async def run():
+            buffer.start(FileLogSink(path))
+            buffer.add({"message": "Привет", "primary_intent": "GREETING"})
+            await buffer.stop()
+
+        asyncio.run(run())
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert json.loads(lines[0])["message"] == "Привет"
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("ai=1, local=0.1,bad,rules=2") == {"ai": 1.0, "local": 0.1, "rules": 1.0}
@@ -0,0 +1,92 @@
+"""
+Тесты локального классификатора намерений (utils.intent_model)
+и его интеграции в HybridIntentChecker.
+"""
+
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.intent_checker import HybridIntentChecker, INTENT_TYPES  # noqa: E402
+from utils.intent_model import LocalIntentModel, iter_training_samples, train  # noqa: E402
+
+SAMPLES = [
+    ("Сколько стоит разработка сайта?", "PRICE_INQUIRY"),
+    ("Какая цена аудита?", "PRICE_INQUIRY"),
+    ("Сколько стоит чат-бот для магазина", "PRICE_INQUIRY"),
+    ("Какая стоимость поддержки сайта", "PRICE_INQUIRY"),
+    ("Привет!", "GREETING"),
+    ("Здравствуйте", "GREETING"),
+    ("Добрый день", "GREETING"),
+    ("Привет, как дела", "GREETING"),
+    ("Какая завтра погода в Москве", "OFF_TOPIC"),
+    ("Посоветуй рецепт борща", "OFF_TOPIC"),
+    ("Кто выиграл футбольный матч", "OFF_TOPIC"),
+    ("Что посмотреть в кино", "OFF_TOPIC"),
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    return train(SAMPLES, list(INTENT_TYPES.keys()), n_features=1 << 12, epochs=60)
+
+
+class TestLocalIntentModel:
+    """Обучение, предсказание и формат файла модели"""
+
+    def test_fits_training_data(self, model):
+        for text, label in SAMPLES:
+            assert model.predict(text)[0] == label
+
+    def test_probabilities_are_normalized(self, model):
+        proba = model.predict_proba("сколько стоит аудит")
+        assert proba.shape == (len(INTENT_TYPES),)
+        assert proba.sum() == pytest.approx(1.0, abs=1e-5)
+
+    def test_empty_message_falls_back_to_bias(self, model):
+        label, confidence = model.predict("")
+        assert label in INTENT_TYPES
+        assert 0.0 <= confidence <= 1.0
+
+    def test_save_and_load_memory_maps_weights(self, model, tmp_path):
+        model.save(tmp_path / "intent_model")
+        loaded = LocalIntentModel.load(tmp_path / "intent_model")
+
+        assert isinstance(loaded.weights, np.memmap)
+        assert loaded.labels == model.labels
+        for text, _ in SAMPLES:
+            assert loaded.predict(text) == pytest.approx(model.predict(text))
+
+    def test_training_samples_skip_fallback_and_local(self):
+        records = [
+            {"message": "Привет", "primary_intent": "GREETING", "confidence": 0.9},
+            {"message": "погода", "primary_intent": "OFF_TOPIC", "confidence": 0.5, "fallback_used": True},
+            {"message": "цена", "primary_intent": "PRICE_INQUIRY", "confidence": 0.99, "source": "local"},
+            {"message": "что-то", "primary_intent": "UNKNOWN", "confidence": 0.9},
+            {"message": "сайт", "primary_intent": "WEBSITE_DEV", "confidence": 0.3},
+        ]
+        samples = list(iter_training_samples(records, list(INTENT_TYPES.keys())))
+        assert samples == [("Привет", "GREETING")]
+
+
+class TestHybridLocalTier:
+    """Уверенные ответы локальной модели не доходят до YandexGPT"""
+
+    def test_confident_local_result_skips_ai(self, model):
+        checker = HybridIntentChecker(local_model=model, local_min_confidence=0.3)
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("YandexGPT не должен вызываться")
+
+        checker.ai.classify = fail
+        result = asyncio.run(checker.classify_async("Какая погода завтра?"))
+
+        assert result.primary_intent == "OFF_TOPIC"
+        assert result.is_relevant is False
+        assert checker.classification_logs[-1]["source"] == "local"
+
+    def test_low_confidence_escalates(self, model):
+        checker = HybridIntentChecker(local_model=model, local_min_confidence=1.01)
+        assert checker._classify_local("Привет!") is None
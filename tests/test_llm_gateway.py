@@ -0,0 +1,115 @@
+"""
+Тесты LLM-шлюза (backend/services/llm_gateway.py).
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from services.llm import LLMRequest
+from services.llm_gateway import AnthropicProvider, LLMGateway, LLMProviderError, OpenAIProvider, ProviderClient
+
+HISTORY = [
+    {"role": "system", "content": "Сводка: клиент спрашивал про сайт"},
+    {"role": "user", "content": "Сколько стоит сайт?"},
+    {"role": "assistant", "content": "От 150 тысяч"},
+]
+
+
+def recording_transport(calls, reply, status=200):
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(status, json=reply)
+    return httpx.MockTransport(handler)
+
+
+class StubFallback:
+    is_configured = True
+
+    async def complete(self, request):
+        return "fallback"
+
+
+class TestProviders:
+    """Формат запросов и переиспользование клиента"""
+
+    def test_anthropic_request_and_client_reuse(self):
+        calls = []
+        provider = AnthropicProvider(
+            "key", "https://anthropic.test",
+            transport=recording_transport(calls, {"content": [{"type": "text", "text": "Здравствуйте"}]}),
+        )
+        request = LLMRequest("s1", "Промпт", "А сроки?", model="claude-sonnet", history=HISTORY)
+
+        async def scenario():
+            replies = [await provider.complete(request) for _ in range(3)]
+            await provider.aclose()
+            return replies
+
+        assert asyncio.run(scenario()) == ["Здравствуйте"] * 3
+        assert provider.clients_created == 1
+        body = json.loads(calls[0].content)
+        assert calls[0].url.path == "/v1/messages"
+        assert calls[0].headers["x-api-key"] == "key"
+        assert body["model"] == "claude-3-7-sonnet-20250219"
+        assert body["system"].startswith("Промпт") and "Сводка" in body["system"]
+        assert [m["role"] for m in body["messages"]] == ["user", "assistant", "user"]
+
+    def test_openai_request(self):
+        calls = []
+        provider = OpenAIProvider(
+            "key", "https://openai.test/v1",
+            transport=recording_transport(calls, {"choices": [{"message": {"content": "Ответ"}}]}),
+        )
+        request = LLMRequest("s1", "Промпт", "А сроки?", model="gpt-4o", history=HISTORY)
+
+        assert asyncio.run(provider.complete(request)) == "Ответ"
+        body = json.loads(calls[0].content)
+        assert calls[0].url.path == "/v1/chat/completions"
+        assert calls[0].headers["authorization"] == "Bearer key"
+        assert [m["role"] for m in body["messages"]] == ["system", "system", "user", "assistant", "user"]
+
+    def test_rate_limit_is_retryable(self):
+        provider = OpenAIProvider("key", "https://openai.test/v1", transport=recording_transport([], {}, status=429))
+        with pytest.raises(LLMProviderError) as excinfo:
+            asyncio.run(provider.complete(LLMRequest("s1", "p", "m", model="gpt-4o")))
+        assert excinfo.value.retryable and excinfo.value.status == 429
+
+    def test_provider_must_implement_complete(self):
+        class Incomplete(ProviderClient):
+            name = "incomplete"
+
+        with pytest.raises(TypeError):
+            Incomplete("key", "https://llm.invalid")
+
+
+class TestGateway:
+    """Маршрутизация по провайдеру модели"""
+
+    def test_unconfigured_provider_uses_fallback(self):
+        calls = []
+        anthropic = AnthropicProvider(
+            "key", "https://anthropic.test",
+            transport=recording_transport(calls, {"content": [{"type": "text", "text": "claude"}]}),
+        )
+        gateway = LLMGateway({"anthropic": anthropic}, fallback=StubFallback())
+
+        async def scenario():
+            await gateway.start()
+            replies = (
+                await gateway.complete(LLMRequest("s1", "p", "m", model="claude-sonnet")),
+                await gateway.complete(LLMRequest("s1", "p", "m", model="gpt-4o")),
+            )
+            await gateway.aclose()
+            return replies
+
+        assert asyncio.run(scenario()) == ("claude", "fallback")
+        assert anthropic.clients_created == 1 and len(calls) == 1
+
+    def test_no_provider_and_no_fallback(self):
+        gateway = LLMGateway({})
+        assert gateway.is_configured is False
+        with pytest.raises(LLMProviderError):
+            asyncio.run(gateway.complete(LLMRequest("s1", "p", "m")))
@@ -0,0 +1,103 @@
+"""
+Тесты политики маршрутизации LLM (backend/services/llm_router.py).
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from services.llm import LLMRequest
+from services.llm_gateway import LLMProviderError
+from services.llm_router import LLMDeadlineExceeded, LLMRouter
+
+
+class ScriptedLLM:
+    """Поведение по модели: задержка и/или ошибка."""
+
+    is_configured = True
+
+    def __init__(self, delays=None, failures=()):
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.calls = []
+        self.cancelled = []
+
+    async def complete(self, request):
+        self.calls.append(request.model)
+        try:
+            await asyncio.sleep(self.delays.get(request.model, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(request.model)
+            raise
+        if request.model in self.failures:
+            raise LLMProviderError(request.model, "HTTP 529", status=529, retryable=True)
+        return f"ответ {request.model}"
+
+
+def request(model="claude-sonnet"):
+    return LLMRequest("s1", "prompt", "Сколько стоит сайт?", model=model)
+
+
+class TestFailover:
+    """Дедлайн и переключение на другого провайдера"""
+
+    def test_error_fails_over_to_alternate(self):
+        llm = ScriptedLLM(failures={"claude-sonnet"})
+        router = LLMRouter(llm, {"deadline": 1, "hedge": False, "min_attempt": 0})
+        assert asyncio.run(router.complete(request())) == "ответ gpt-4o"
+        assert llm.calls == ["claude-sonnet", "gpt-4o"]
+
+    def test_slow_primary_fails_over_to_fast_alternate(self):
+        llm = ScriptedLLM(delays={"claude-sonnet": 10, "gpt-4o": 0.05})
+        # настройки по умолчанию: дедлайн меньше LLM_MIN_ATTEMPT_SECONDS
+        router = LLMRouter(llm, {"deadline": 0.5, "hedge": False})
+        started = time.perf_counter()
+        assert asyncio.run(router.complete(request())) == "ответ gpt-4o"
+        assert llm.calls == ["claude-sonnet", "gpt-4o"] and llm.cancelled == ["claude-sonnet"]
+        assert time.perf_counter() - started < 0.6
+
+    def test_attempt_timeout_caps_primary(self):
+        llm = ScriptedLLM(delays={"claude-sonnet": 10, "gpt-4o": 0.05})
+        router = LLMRouter(llm, {"deadline": 25, "hedge": False, "attempt_timeout": 0.1})
+        assert asyncio.run(router.complete(request())) == "ответ gpt-4o"
+
+    def test_slow_primary_bounded_by_deadline(self):
+        llm = ScriptedLLM(delays={"claude-sonnet": 5, "gpt-4o": 5})
+        router = LLMRouter(llm, {"deadline": 0.1, "hedge": False, "min_attempt": 0})
+        started = time.perf_counter()
+        with pytest.raises(LLMDeadlineExceeded):
+            asyncio.run(router.complete(request()))
+        assert time.perf_counter() - started < 1
+
+    def test_failover_disabled(self):
+        llm = ScriptedLLM(failures={"claude-sonnet"})
+        router = LLMRouter(llm, {"deadline": 1, "hedge": False, "failover": False})
+        with pytest.raises(LLMProviderError):
+            asyncio.run(router.complete(request()))
+        assert llm.calls == ["claude-sonnet"]
+
+
+class TestHedging:
+    """Второй провайдер после порога, проигравший отменяется"""
+
+    def test_hedge_wins_and_cancels_primary(self):
+        llm = ScriptedLLM(delays={"claude-sonnet": 2, "gpt-4o": 0.01})
+        router = LLMRouter(llm, {"deadline": 3, "hedge": True, "hedge_after": 0.05})
+        started = time.perf_counter()
+        assert asyncio.run(router.complete(request())) == "ответ gpt-4o"
+        assert time.perf_counter() - started < 1
+        assert llm.cancelled == ["claude-sonnet"]
+
+    def test_fast_primary_is_not_hedged(self):
+        llm = ScriptedLLM(delays={"claude-sonnet": 0.01})
+        router = LLMRouter(llm, {"deadline": 3, "hedge": True, "hedge_after": 0.5})
+        assert asyncio.run(router.complete(request())) == "ответ claude-sonnet"
+        assert llm.calls == ["claude-sonnet"]
+
+    def test_hedge_threshold_tracks_p95(self):
+        router = LLMRouter(ScriptedLLM(), {"hedge_after": None, "hedge_default": 4, "hedge_min_samples": 5})
+        assert router.hedge_after("gpt-4o") == 4
+        for _ in range(10):
+            asyncio.run(router.complete(request("gpt-4o")))
+        assert router.hedge_after("gpt-4o") < 0.5
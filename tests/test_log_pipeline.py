@@ -0,0 +1,92 @@
+"""
+Тесты конвейера логирования (utils.log_pipeline).
+"""
+
+import json
+import logging
+import queue
+
+from utils.log_pipeline import (
+    HANDLER_NAME,
+    DeferredQueueHandler,
+    JSONFormatter,
+    SamplingFilter,
+    configure_logging,
+    shutdown_logging,
+)
+
+
+def make_record(level=logging.INFO, msg="→ %s %s", args=("GET", "/api/chat"), **extra):
+    record = logging.LogRecord("neuroexpert", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJSONFormatter:
+    """Все поля extra попадают в JSON"""
+
+    def test_includes_arbitrary_extra(self):
+        record = make_record(request_id="abc", duration_ms=12.5, path="/api/chat", sample_key="http.access")
+        data = json.loads(JSONFormatter().format(record))
+
+        assert data["message"] == "→ GET /api/chat"
+        assert data["request_id"] == "abc"
+        assert data["duration_ms"] == 12.5
+        assert data["path"] == "/api/chat"
+        assert "sample_key" not in data
+
+    def test_non_serializable_values_are_stringified(self):
+        record = make_record(client=object())
+        data = json.loads(JSONFormatter().format(record))
+        assert data["client"].startswith("<object")
+
+
+class TestSamplingFilter:
+    """Сэмплирование высокочастотных INFO-записей"""
+
+    def test_drops_sampled_info(self):
+        sampler = SamplingFilter({"http.access": 0.0})
+        assert sampler.filter(make_record(sample_key="http.access")) is False
+        assert sampler.filter(make_record(sample_key="other")) is True
+        assert sampler.filter(make_record()) is True
+
+    def test_never_drops_warnings(self):
+        sampler = SamplingFilter({"http.access": 0.0})
+        assert sampler.filter(make_record(level=logging.ERROR, sample_key="http.access")) is True
+
+
+class TestDeferredQueueHandler:
+    """Форматирование не выполняется в вызывающем потоке"""
+
+    def test_record_is_enqueued_unformatted(self):
+        log_queue = queue.SimpleQueue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.handle(make_record())
+
+        queued = log_queue.get_nowait()
+        assert queued.msg == "→ %s %s"
+        assert queued.args == ("GET", "/api/chat")
+
+
+class TestConfigureLogging:
+    """Заменяется только свой обработчик"""
+
+    def test_foreign_handlers_are_kept(self):
+        root = logging.getLogger()
+        level = root.level
+        foreign = logging.NullHandler()
+        stale = logging.NullHandler()
+        stale.set_name(HANDLER_NAME)
+        root.addHandler(foreign)
+        root.addHandler(stale)
+        shutdown_logging()
+        try:
+            configure_logging(level="WARNING")
+            names = [handler.get_name() for handler in root.handlers]
+            assert foreign in root.handlers and stale not in root.handlers
+            assert names.count(HANDLER_NAME) == 1
+        finally:
+            shutdown_logging()
+            root.removeHandler(foreign)
+            root.setLevel(level)
+        assert HANDLER_NAME not in [handler.get_name() for handler in root.handlers]
@@ -0,0 +1,91 @@
+"""
+Тесты Prometheus-метрик (backend/utils/metrics.py).
+"""
+
+import pytest
+from fastapi import Depends, FastAPI, Response
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from utils import metrics as metrics_module
+from utils.metrics import MetricsMiddleware, render_metrics, require_metrics_token, track_stage
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/fail")
+    async def fail():
+        raise RuntimeError("boom")
+
+    @app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+    async def metrics():
+        payload, content_type = render_metrics()
+        return Response(content=payload, media_type=content_type)
+
+    return TestClient(app, raise_server_exceptions=False)
+
+
+class TestMetricsMiddleware:
+    """RED-метрики по шаблону маршрута"""
+
+    def test_route_template_label(self):
+        client = make_client()
+        before = sample("http_requests_total", method="GET", route="/items/{item_id}", status="200")
+
+        client.get("/items/1")
+        client.get("/items/2")
+
+        after = sample("http_requests_total", method="GET", route="/items/{item_id}", status="200")
+        assert after - before == 2
+        assert sample("http_request_duration_seconds_count", method="GET", route="/items/{item_id}") >= 2
+
+    def test_errors_and_unmatched_routes(self):
+        client = make_client()
+        errors_before = sample("http_requests_total", method="GET", route="/fail", status="500")
+        missing_before = sample("http_requests_total", method="GET", route="<unmatched>", status="404")
+
+        client.get("/fail")
+        client.get("/no/such/path")
+
+        assert sample("http_requests_total", method="GET", route="/fail", status="500") - errors_before == 1
+        assert sample("http_requests_total", method="GET", route="<unmatched>", status="404") - missing_before == 1
+
+    def test_exposition(self):
+        response = make_client().get("/metrics")
+        assert response.status_code == 200
+        assert "http_requests_total" in response.text
+        assert "chat_stage_duration_seconds" in response.text
+
+    def test_exposition_requires_token_when_configured(self, monkeypatch):
+        monkeypatch.setattr(metrics_module, "METRICS_TOKEN", "secret")
+        client = make_client()
+        assert client.get("/metrics").status_code == 401
+        assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
+
+
+class TestTrackStage:
+    """Гистограмма стадий /api/chat"""
+
+    def test_observes_duration_and_errors(self):
+        count_before = sample("chat_stage_duration_seconds_count", stage="test_stage")
+        errors_before = sample("chat_stage_errors_total", stage="test_stage")
+
+        with track_stage("test_stage"):
+            pass
+        with pytest.raises(ValueError):
+            with track_stage("test_stage"):
+                raise ValueError("fail")
+
+        assert sample("chat_stage_duration_seconds_count", stage="test_stage") - count_before == 2
+        assert sample("chat_stage_errors_total", stage="test_stage") - errors_before == 1
@@ -0,0 +1,65 @@
+"""
+Тесты ASGI middleware логирования запросов (frontend/api/middleware.py).
+"""
+
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from middleware import RequestLoggingMiddleware
+
+
+def make_client(caplog):
+    app = FastAPI()
+    app.add_middleware(RequestLoggingMiddleware, logger=logging.getLogger("test.middleware"))
+
+    @app.get("/ok")
+    async def ok(request: Request):
+        return {"request_id": request.state.request_id}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for part in (b"a", b"b", b"c"):
+                yield part
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    caplog.set_level(logging.INFO, logger="test.middleware")
+    return TestClient(app, raise_server_exceptions=False)
+
+
+class TestRequestLoggingMiddleware:
+    """Заголовки трассировки, streaming и обработка ошибок"""
+
+    def test_adds_tracing_headers(self, caplog):
+        response = make_client(caplog).get("/ok")
+
+        assert response.status_code == 200
+        assert response.headers["X-Request-ID"] == response.json()["request_id"]
+        assert response.headers["X-Response-Time"].endswith("ms")
+
+    def test_logs_request_and_response(self, caplog):
+        make_client(caplog).get("/ok")
+
+        messages = [record.getMessage() for record in caplog.records]
+        assert messages == ["→ GET /ok", "← GET /ok 200"]
+        assert caplog.records[1].status_code == 200
+        assert caplog.records[1].duration_ms >= 0
+
+    def test_streaming_response_passes_through(self, caplog):
+        response = make_client(caplog).get("/stream")
+        assert response.text == "abc"
+        assert "X-Request-ID" in response.headers
+
+    def test_unhandled_error_returns_json_500(self, caplog):
+        response = make_client(caplog).get("/boom")
+
+        assert response.status_code == 500
+        assert response.json()["request_id"] == response.headers["X-Request-ID"]
+        assert any(record.levelno == logging.ERROR for record in caplog.records)
@@ -0,0 +1,190 @@
+"""
+Тесты очереди уведомлений Telegram (backend/services/notification_queue.py)
+против локального фейкового Bot API (tests/fake_telegram.py).
+"""
+
+import asyncio
+import time
+from datetime import datetime
+
+from mongomock_motor import AsyncMongoMockClient
+
+from services.notification_queue import BatchingNotifier
+from services.notifier import (
+    TelegramNotifier,
+    format_contact_message,
+    format_digest,
+    message_length,
+    pack_digest,
+    truncate_message,
+)
+from tests.fake_telegram import FakeTelegram
+
+
+def make_notifier(telegram, database=None, **overrides):
+    settings = {"rate_per_minute": 600, "burst": 3, "coalesce_window": 0.05, "retry_backoff": 0.05}
+    settings.update(overrides)
+    sender = TelegramNotifier("token", "42", timeout=2, api_url=telegram.url)
+    return BatchingNotifier(sender, database, **settings)
+
+
+def contact(i):
+    return format_contact_message(f"Клиент {i}", f"+7900000{i:04d}", "Аудит", "Хочу консультацию " * 5)
+
+
+async def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+class TestDigest:
+    """Склейка и обрезка в пределах 4096 символов"""
+
+    def test_pack_respects_limit(self):
+        texts = [contact(i) for i in range(100)]
+        count = pack_digest(texts)
+        assert 1 < count < 100
+        assert message_length(format_digest(texts[:count])) <= 4096
+        assert message_length(format_digest(texts[:count + 1])) > 4096
+
+    def test_truncate_keeps_markup_valid(self):
+        text = format_contact_message("Имя", "@nick", "Чат-бот", "<&> " * 3000)
+        short = truncate_message(text, 200)
+        assert message_length(short) <= 200 and short.endswith("…")
+        assert short.count("<b>") == short.count("</b>")
+        assert not short[:-1].rstrip().endswith(("&", "&l", "&lt", "&g", "&a", "&am"))
+
+
+class TestBatchingNotifier:
+    """Пачки, rate limit и retry_after против фейкового Telegram"""
+
+    def test_idle_chat_is_notified_inline(self):
+        db = AsyncMongoMockClient()["notify_test"]
+
+        async def scenario():
+            async with FakeTelegram() as telegram:
+                notifier = make_notifier(telegram, lambda: db, coalesce_window=10)
+                await notifier.send(contact(1))
+                # serverless-функцию могут заморозить сразу после ответа
+                delivered = list(telegram.messages)
+                await notifier.stop()
+                return delivered, await db.notification_outbox.count_documents({})
+
+        delivered, outbox = asyncio.run(scenario())
+        assert len(delivered) == 1 and outbox == 0
+
+    def test_burst_is_coalesced_into_digests(self):
+        async def scenario():
+            async with FakeTelegram(per_chat_limit=20, window=60) as telegram:
+                notifier = make_notifier(telegram)
+                await asyncio.gather(*(notifier.send(contact(i)) for i in range(60)))
+                await wait_for(lambda: sum(text.count("Новая заявка") for text in telegram.texts()) == 60)
+                await notifier.stop()
+                return telegram
+
+        telegram = asyncio.run(scenario())
+        delivered = telegram.texts()
+        assert sum(text.count("Новая заявка") for text in delivered) == 60
+        # 60 заявок: первые TELEGRAM_BURST сразу, остальные — несколько дайджестов
+        assert len(telegram.requests) <= 8
+        assert all(message_length(text) <= 4096 for text in delivered)
+
+    def test_honours_retry_after(self):
+        async def scenario():
+            async with FakeTelegram() as telegram:
+                telegram.fail_next(429, retry_after=0.3)
+                notifier = make_notifier(telegram, max_attempts=1)
+                started = time.monotonic()
+                await notifier.send(contact(1))
+                await wait_for(lambda: telegram.messages)
+                return telegram, time.monotonic() - started
+
+        telegram, elapsed = asyncio.run(scenario())
+        # 429 не считается попыткой: max_attempts=1 не помешал доставке
+        assert len(telegram.messages) == 1 and len(telegram.requests) == 2
+        assert elapsed >= 0.3
+
+    def test_rejected_digest_is_resent_one_by_one(self):
+        async def scenario():
+            # фейк принимает не больше 400 символов: дайджест из двух — 400
+            async with FakeTelegram(max_chars=400) as telegram:
+                notifier = make_notifier(telegram, burst=1)
+                for i in range(3):
+                    await notifier.send(contact(i))
+                await wait_for(lambda: len(telegram.messages) == 3)
+                return telegram
+
+        telegram = asyncio.run(scenario())
+        assert [text.count("Новая заявка") for _, text in telegram.requests] == [1, 2, 1, 1]
+
+
+class TestOutbox:
+    """Недоставленное переживает процесс и уходит из outbox"""
+
+    def test_failed_delivery_survives_restart(self):
+        db = AsyncMongoMockClient()["notify_test"]
+
+        async def first_process(telegram):
+            for _ in range(3):
+                telegram.fail_next(502)
+            notifier = make_notifier(telegram, lambda: db, retry_backoff=10, stop_timeout=0.2)
+            await notifier.send(contact(1))
+            await wait_for(lambda: telegram.requests)
+            await notifier.stop()
+
+        async def second_process(telegram):
+            notifier = make_notifier(telegram, lambda: db)
+            claimed = await notifier.claim_outbox()
+            await wait_for(lambda: telegram.messages)
+            await notifier.stop()
+            return claimed
+
+        async def scenario():
+            async with FakeTelegram() as telegram:
+                await first_process(telegram)
+                [pending] = await db.notification_outbox.find().to_list(None)
+                claimed = await second_process(telegram)
+                remaining = await db.notification_outbox.count_documents({})
+                return telegram, pending, claimed, remaining
+
+        telegram, pending, claimed, remaining = asyncio.run(scenario())
+        assert pending["status"] == "pending" and pending["attempts"] == 1
+        assert pending["next_attempt_at"] <= datetime.utcnow()
+        assert claimed == 1 and remaining == 0
+        assert len(telegram.messages) == 1
+
+    def test_exhausted_attempts_are_kept_as_failed(self):
+        db = AsyncMongoMockClient()["notify_test"]
+
+        async def scenario():
+            async with FakeTelegram() as telegram:
+                for _ in range(2):
+                    telegram.fail_next(500)
+                notifier = make_notifier(telegram, lambda: db, max_attempts=2, retry_backoff=0.01)
+                await notifier.send(contact(1))
+                await wait_for(lambda: len(telegram.requests) == 2)
+                await notifier.stop()
+                return await db.notification_outbox.find_one({})
+
+        document = asyncio.run(scenario())
+        assert document["status"] == "failed" and "Scripted failure" in document["error"]
+
+    def test_blocked_bot_is_not_retried(self):
+        db = AsyncMongoMockClient()["notify_test"]
+
+        async def scenario():
+            async with FakeTelegram() as telegram:
+                telegram.fail_next(403)
+                notifier = make_notifier(telegram, lambda: db, burst=1)
+                await notifier.send(contact(1))
+                await notifier.send(contact(2))
+                await wait_for(lambda: len(telegram.requests) == 2)
+                await asyncio.sleep(0.2)
+                await notifier.stop()
+                return telegram, await db.notification_outbox.find().to_list(None)
+
+        telegram, documents = asyncio.run(scenario())
+        # 403 на первом — без повторов; второе ушло из очереди
+        assert len(telegram.requests) == 2 and len(telegram.messages) == 1
+        assert documents == []
@@ -0,0 +1,157 @@
+"""
+Тесты кэша ответов на первые вопросы (backend/services/response_cache.py).
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from services.chat_service import ChatRequest
+from services.response_cache import ChatResponseCache, MinHasher, build_response_cache
+
+
+class FakeConfig:
+    """ConfigLoader в миниатюре: данные, текст услуг, подписчики сброса."""
+
+    def __init__(self, services_text="- Сайт: от 25 500 ₽"):
+        self.services_text = services_text
+        self.listeners = []
+        self.reload()
+
+    def reload(self):
+        company = SimpleNamespace(name="NeuroExpert", phone="+7", email="a@b.c", completed_projects=10)
+        self.data = SimpleNamespace(company=company)
+        for listener in self.listeners:
+            listener()
+
+    def get_all_services_text(self):
+        return self.services_text
+
+    def add_invalidation_listener(self, listener):
+        self.listeners.append(listener)
+
+
+class CountingLLM:
+    is_configured = True
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, request):
+        self.calls += 1
+        return f"ответ №{self.calls}"
+
+
+class StaticContext:
+    def __init__(self, history=()):
+        self.history = list(history)
+
+    async def get_context(self, session_id, db, query=None):
+        return self.history
+
+
+def ask(cache, message, history=(), model=None):
+    return asyncio.run(cache.lookup(ChatRequest("s1", message, model=model), list(history)))
+
+
+def remember(cache, message, response, history=()):
+    asyncio.run(cache.store(ChatRequest("s1", message), list(history), response))
+
+
+class TestExactMatch:
+    """Нормализация, история, версия конфигурации"""
+
+    def test_normalized_message_hits(self):
+        cache = ChatResponseCache(FakeConfig(), near_duplicates=False)
+        remember(cache, "Сколько стоит сайт?", "от 25 500 ₽")
+        assert ask(cache, "  сколько СТОИТ сайт ") == "от 25 500 ₽"
+        assert ask(cache, "Сколько стоит сайт?", model="gpt-4o") is None
+
+    def test_sessions_with_history_are_skipped(self):
+        cache = ChatResponseCache(FakeConfig())
+        history = [{"role": "user", "content": "Привет"}]
+        remember(cache, "Сколько стоит сайт?", "ответ", history=history)
+        assert ask(cache, "Сколько стоит сайт?") is None
+        remember(cache, "Сколько стоит сайт?", "ответ")
+        assert ask(cache, "Сколько стоит сайт?", history=history) is None
+        assert cache.stats()["skipped"] == 1
+
+    def test_config_reload_invalidates(self):
+        config = FakeConfig()
+        cache = build_response_cache(config)
+        remember(cache, "Что входит в аудит?", "старый ответ")
+        version = cache.config_version()
+
+        config.services_text = "- Аудит: от 9 900 ₽"
+        config.reload()
+        assert ask(cache, "Что входит в аудит?") is None
+        assert cache.config_version() != version
+        assert cache.stats()["size"] == 0
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = ChatResponseCache(FakeConfig(), ttl=60, timer=lambda: now[0])
+        remember(cache, "Сколько стоит сайт?", "ответ")
+        now[0] = 61
+        assert ask(cache, "Сколько стоит сайт?") is None
+
+
+class TestNearDuplicates:
+    """MinHash находит перефразированный вопрос, но не другой"""
+
+    def test_signature_similarity(self):
+        hasher = MinHasher(64)
+        same = MinHasher.similarity(hasher.signature("сколько стоит сайт"), hasher.signature("сколько стоит сайт"))
+        other = MinHasher.similarity(hasher.signature("сколько стоит сайт"), hasher.signature("что входит в аудит"))
+        assert same == 1.0 and other < 0.3
+
+    def test_rephrased_question_hits(self):
+        cache = ChatResponseCache(FakeConfig(), near_duplicates=True, similarity=0.7)
+        remember(cache, "Сколько стоит разработка сайта?", "от 25 500 ₽")
+        assert ask(cache, "а сколько стоит разработка сайта") == "от 25 500 ₽"
+        assert ask(cache, "Что входит в SEO-аудит?") is None
+        stats = cache.stats()
+        assert stats["near_hits"] == 1 and stats["misses"] == 1 and stats["hit_ratio"] == 0.5
+
+
+    def test_numbers_must_match(self):
+        cache = ChatResponseCache(FakeConfig(), near_duplicates=True)
+        remember(cache, "Нужен интернет-магазин на 100 товаров", "ответ про 100")
+        remember(cache, "нужен сайт за 50 тысяч", "ответ про 50")
+        assert ask(cache, "нужен интернет-магазин на 1000 товаров") is None
+        assert ask(cache, "нужен сайт за 500 тысяч") is None
+        assert ask(cache, "а нужен сайт за 50 тысяч") == "ответ про 50"
+
+
+class TestPersonalData:
+    """Сообщения с контактами и именем не кэшируются"""
+
+    def test_contacts_and_names_are_skipped(self):
+        cache = ChatResponseCache(FakeConfig())
+        for message in (
+            "Перезвоните мне: +7 (900) 123-45-67",
+            "пишите на ivan@example.com",
+            "мой телеграм @ivan_petrov",
+            "Меня зовут Анна, нужен сайт",
+        ):
+            remember(cache, message, "персональный ответ")
+            assert ask(cache, message) is None
+        assert cache.stats()["size"] == 0
+
+    def test_user_data_is_skipped(self):
+        cache = ChatResponseCache(FakeConfig())
+        request = ChatRequest("s1", "Сколько стоит сайт?", user_data={"name": "Анна"})
+        asyncio.run(cache.store(request, [], "ответ"))
+        assert cache.stats()["size"] == 0
+
+
+class TestChatServiceIntegration:
+    """Повторный первый вопрос не доходит до LLM"""
+
+    def test_first_turn_served_from_cache(self, make_service):
+        llm = CountingLLM()
+        service = make_service(llm=llm, context=StaticContext(), response_cache=ChatResponseCache(FakeConfig()))
+
+        first = asyncio.run(service.chat(ChatRequest("s1", "Сколько стоит сайт?")))
+        second = asyncio.run(service.chat(ChatRequest("s2", "сколько стоит сайт")))
+        assert llm.calls == 1
+        assert second.response == first.response and second.cached and not first.cached
@@ -0,0 +1,275 @@
+"""
+Тесты упорядочивания ходов сессии (backend/services/session_lock.py).
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from services.chat_service import ChatRequest
+from services.session_lock import (
+    SESSION_LOCK_CONFIG,
+    KeyedLock,
+    RedisLease,
+    SessionBusyError,
+    SessionSequencer,
+    build_session_sequencer,
+)
+
+
+class FakeRedis:
+    """SET NX PX, сравнение-удаление и сравнение-продление — всё, что нужно аренде."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _expire(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+
+    async def set(self, key, value, nx=False, px=None):
+        self._expire(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        if px is not None:
+            self.expires[key] = time.monotonic() + px / 1000
+        return True
+
+    async def eval(self, script, numkeys, key, token, *args):
+        self._expire(key)
+        if self.data.get(key) != token:
+            return 0
+        if "pexpire" in script:
+            self.expires[key] = time.monotonic() + int(args[0]) / 1000
+        else:
+            del self.data[key]
+            self.expires.pop(key, None)
+        return 1
+
+
+class BrokenRedis:
+    async def set(self, *args, **kwargs):
+        raise ConnectionError("redis down")
+
+    async def eval(self, *args):
+        raise ConnectionError("redis down")
+
+
+class HistoryLLM:
+    """LLM, запоминающий, сколько реплик истории он видел."""
+
+    is_configured = True
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+
+    async def complete(self, request):
+        self.calls.append((request.message, len(request.history)))
+        await asyncio.sleep(self.delay)
+        return f"ответ на: {request.message}"
+
+
+class MemoryContext:
+    """История прямо из коллекции — как SmartContext без кэша."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.invalidated = []
+
+    async def get_context(self, session_id, db, query=None):
+        return [d for d in self.collection.documents if d["session_id"] == session_id]
+
+    async def invalidate_session(self, session_id):
+        self.invalidated.append(session_id)
+
+
+@pytest.fixture
+def sequenced_service(make_service, memory_db):
+    def factory(sequencer, llm):
+        return make_service(llm=llm, context=MemoryContext(memory_db.chat_messages), sequencer=sequencer)
+    return factory
+
+
+class TestSequencer:
+    """Ходы одной сессии — по очереди, разных — параллельно"""
+
+    def test_same_session_turns_see_previous_turn(self, sequenced_service, memory_db):
+        llm = HistoryLLM()
+        service = sequenced_service(SessionSequencer(), llm)
+
+        async def scenario():
+            await asyncio.gather(
+                service.chat(ChatRequest("s1", "Сколько стоит сайт?")),
+                service.chat(ChatRequest("s1", "А сроки?")),
+            )
+
+        asyncio.run(scenario())
+        assert [seen for _, seen in llm.calls] == [0, 1]
+        assert len(memory_db.chat_messages.documents) == 2
+        assert service.context.invalidated == ["s1", "s1"]
+
+    def test_different_sessions_run_concurrently(self, sequenced_service):
+        llm = HistoryLLM(delay=0.2)
+        service = sequenced_service(SessionSequencer(), llm)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.gather(*(service.chat(ChatRequest(f"s{i}", "Нужен сайт")) for i in range(4)))
+            return loop.time() - started
+
+        assert asyncio.run(scenario()) < 0.6
+        assert len(service.sequencer.local) == 0
+
+    def test_wait_is_bounded(self):
+        sequencer = SessionSequencer(wait_timeout=0.05)
+
+        async def scenario():
+            async with sequencer.turn("s1"):
+                with pytest.raises(SessionBusyError) as info:
+                    async with sequencer.turn("s1"):
+                        pass
+            return info.value
+
+        error = asyncio.run(scenario())
+        assert error.status_code == 503 and error.retry_after == 1
+        assert len(sequencer.local) == 0
+
+
+class TestCoalescing:
+    """Сообщения, ждущие очереди, уходят в LLM одним вызовом"""
+
+    def test_rapid_messages_share_one_llm_call(self, sequenced_service, memory_db):
+        llm = HistoryLLM()
+        service = sequenced_service(SessionSequencer(coalesce=True, coalesce_window=0.02), llm)
+
+        async def scenario():
+            return await asyncio.gather(
+                service.chat(ChatRequest("s1", "Привет")),
+                service.chat(ChatRequest("s1", "Нужен лендинг", user_data={"contact": "@ivan"})),
+            )
+
+        first, second = asyncio.run(scenario())
+        assert llm.calls == [("Привет\nНужен лендинг", 0)]
+        assert first is second
+        assert memory_db.chat_messages.documents[0]["user_data"] == {"contact": "@ivan"}
+
+
+class TestRedisLease:
+    """Аренда между воркерами"""
+
+    def test_lease_serializes_sequencers_sharing_redis(self):
+        redis = FakeRedis()
+        workers = [SessionSequencer(lease=RedisLease(redis, retry_interval=0.005)) for _ in range(2)]
+        order = []
+
+        async def turn(sequencer, name):
+            async with sequencer.turn("s1"):
+                order.append(f"{name}:start")
+                await asyncio.sleep(0.03)
+                order.append(f"{name}:end")
+
+        async def scenario():
+            await asyncio.gather(turn(workers[0], "a"), turn(workers[1], "b"))
+
+        asyncio.run(scenario())
+        assert order in (["a:start", "a:end", "b:start", "b:end"], ["b:start", "b:end", "a:start", "a:end"])
+        assert redis.data == {}
+
+    def test_redis_outage_falls_back_to_local_lock(self, sequenced_service, memory_db):
+        llm = HistoryLLM()
+        service = sequenced_service(SessionSequencer(lease=RedisLease(BrokenRedis())), llm)
+
+        async def scenario():
+            await asyncio.gather(
+                service.chat(ChatRequest("s1", "Сколько стоит сайт?")),
+                service.chat(ChatRequest("s1", "А сроки?")),
+            )
+
+        asyncio.run(scenario())
+        # без 500: ходы прошли по очереди под локальной блокировкой
+        assert [seen for _, seen in llm.calls] == [0, 1]
+        assert len(memory_db.chat_messages.documents) == 2
+
+    def test_long_turn_keeps_its_lease(self):
+        redis = FakeRedis()
+        workers = [SessionSequencer(lease=RedisLease(redis, ttl=0.06, retry_interval=0.005)) for _ in range(2)]
+        order = []
+
+        async def turn(sequencer, name, delay=0):
+            await asyncio.sleep(delay)
+            async with sequencer.turn("s1"):
+                order.append(f"{name}:start")
+                # ход втрое дольше TTL аренды
+                await asyncio.sleep(0.2)
+                order.append(f"{name}:end")
+
+        async def scenario():
+            await asyncio.gather(turn(workers[0], "a"), turn(workers[1], "b", delay=0.01))
+
+        asyncio.run(scenario())
+        assert order == ["a:start", "a:end", "b:start", "b:end"]
+
+    def test_lease_is_held_until_records_settle(self):
+        redis = FakeRedis()
+
+        async def scenario():
+            flushed = asyncio.Event()
+
+            async def settle(session_id):
+                await flushed.wait()
+
+            sequencer = SessionSequencer(lease=RedisLease(redis), settle=settle)
+            async with sequencer.turn("s1"):
+                pass
+            # ответ вернулся, запись ещё в буфере — другой воркер ждёт
+            held = list(redis.data)
+            flushed.set()
+            await asyncio.gather(*sequencer._releases)
+            return held
+
+        assert asyncio.run(scenario()) == ["chat:session-lease:s1"]
+        assert redis.data == {}
+
+    def test_release_keeps_foreign_lease(self):
+        redis = FakeRedis()
+        lease = RedisLease(redis)
+
+        async def scenario():
+            await lease.acquire("s1")
+            await lease.release("s1", "not-my-token")
+
+        asyncio.run(scenario())
+        assert list(redis.data) == ["chat:session-lease:s1"]
+
+    def test_lease_client_has_its_own_timeouts(self, monkeypatch):
+        pytest.importorskip("redis")
+        monkeypatch.setitem(SESSION_LOCK_CONFIG, "redis_url", "redis://redis.internal:6379/0")
+        sequencer = build_session_sequencer()
+        options = sequencer.lease.redis.connection_pool.connection_kwargs
+        # не 50 мс кэша намерений: managed Redis не выключает аренду
+        assert options["socket_timeout"] == SESSION_LOCK_CONFIG["redis_timeout"] >= 1
+        assert options["socket_connect_timeout"] == SESSION_LOCK_CONFIG["redis_connect_timeout"]
+
+
+class TestKeyedLock:
+    """Записи не копятся"""
+
+    def test_cancelled_waiter_is_cleaned_up(self):
+        locks = KeyedLock()
+
+        async def scenario():
+            await locks.acquire("s1")
+            waiter = asyncio.create_task(locks.acquire("s1"))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            locks.release("s1")
+
+        asyncio.run(scenario())
+        assert len(locks) == 0
@@ -0,0 +1,167 @@
+"""
+Тесты загрузки истории SmartContext (backend/memory/smart_context.py).
+"""
+
+import asyncio
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from memory import smart_context as smart_context_module
+from memory.retrieval import numpy_available
+from memory.smart_context import SmartContext
+from services.chat_service import ChatRequest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class TestSmartContextHistory:
+    """История из chat_messages в формате ChatService"""
+
+    def test_context_from_stored_messages(self):
+        db = mongomock_motor.AsyncMongoMockClient()["smart_context_test"]
+        started = datetime(2025, 1, 1, 12, 0)
+
+        async def scenario():
+            for turn in range(3):
+                await db.chat_messages.insert_one({
+                    "id": str(turn),
+                    "session_id": "s1",
+                    "user_message": f"вопрос {turn}",
+                    "ai_response": f"ответ {turn}",
+                    "model": "claude-sonnet",
+                    "timestamp": started + timedelta(minutes=turn),
+                    "user_data": None,
+                })
+            await db.chat_messages.insert_one({
+                "session_id": "other", "user_message": "чужое", "ai_response": "-", "timestamp": started,
+            })
+            return await SmartContext().get_context("s1", db)
+
+        context = asyncio.run(scenario())
+        assert [msg["content"] for msg in context] == [
+            "вопрос 0", "ответ 0", "вопрос 1", "ответ 1", "вопрос 2", "ответ 2",
+        ]
+        assert context[0]["timestamp"] == started.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TestEncoding:
+    """BPE читается вне event loop"""
+
+    def test_encoding_is_loaded_in_worker_thread(self, monkeypatch):
+        threads = []
+
+        def resolve(name):
+            threads.append(threading.current_thread())
+            return None
+
+        monkeypatch.setattr(smart_context_module, "_resolve_encoding", resolve)
+        db = mongomock_motor.AsyncMongoMockClient()["smart_context_test"]
+        asyncio.run(SmartContext(model_name="gpt-4").get_context("s1", db))
+        assert threads and threads[0] is not threading.main_thread()
+
+
+class TestRetrieval:
+    """Старая реплика, относящаяся к вопросу, возвращается в контекст"""
+
+    @staticmethod
+    def conversation(started, turns=30):
+        context = SmartContext()
+        docs = [{
+            "session_id": "s1",
+            "user_message": "Сейчас конверсия около 0.5%, клиенты уходят без заявки",
+            "ai_response": "Понял, низкая конверсия — главный вопрос аудита.",
+            "timestamp": started,
+        }]
+        for turn in range(1, turns):
+            docs.append({
+                "session_id": "s1",
+                "user_message": f"Какие документы нужны для этапа {turn}?",
+                "ai_response": "Понадобятся доступы к CRM и аналитике.",
+                "timestamp": started + timedelta(minutes=turn),
+            })
+        for doc in docs:
+            context.index_record(doc)
+        return context, docs
+
+    def test_relevant_old_turn_is_retrieved(self):
+        db = mongomock_motor.AsyncMongoMockClient()["smart_context_retrieval"]
+        context, docs = self.conversation(datetime(2025, 1, 1, 12, 0))
+
+        async def scenario():
+            await db.chat_messages.insert_many(docs)
+            plain = await context.get_context("s1", db)
+            retrieved = await context.get_context("s1", db, query="Какая была моя конверсия?")
+            return plain, retrieved
+
+        plain, retrieved = asyncio.run(scenario())
+        old_message = docs[0]["user_message"]
+        assert old_message not in [msg["content"] for msg in plain]
+        contents = [msg["content"] for msg in retrieved]
+        assert old_message in contents
+        # retrieved-реплики идут перед последними сообщениями
+        assert contents.index(old_message) < contents.index(docs[-1]["user_message"])
+
+    def test_retrieval_runs_on_cached_context(self):
+        import fakeredis.aioredis
+
+        db = mongomock_motor.AsyncMongoMockClient()["smart_context_retrieval"]
+        context, docs = self.conversation(datetime(2025, 1, 1, 12, 0))
+        context.redis_client = fakeredis.aioredis.FakeRedis()
+
+        async def scenario():
+            await db.chat_messages.insert_many(docs)
+            await context.get_context("s1", db, query="Какие документы нужны?")
+            # второй ход не читает MongoDB: сводки и последние — из Redis
+            await db.chat_messages.delete_many({})
+            return await context.get_context("s1", db, query="Какая была моя конверсия?")
+
+        contents = [msg["content"] for msg in asyncio.run(scenario())]
+        assert docs[0]["user_message"] in contents
+        assert docs[-1]["ai_response"] == contents[-1]
+
+    def test_stored_embeddings_match_recomputed(self):
+        context = SmartContext()
+        record = {"user_message": "Нужен интернет-магазин электроники", "ai_response": "Поможем"}
+        context.index_record(record)
+        stored = context.embedder.from_bytes(record["embeddings"]["user"])
+        recomputed = context.embedder.embed(record["user_message"])
+        assert float(stored @ recomputed) == pytest.approx(1.0, abs=1e-3)
+
+
+class TestWithoutNumpy:
+    """Без numpy (serverless-манифест) чат пишет реплики и не теряет историю"""
+
+    @pytest.fixture
+    def no_numpy(self, monkeypatch):
+        # None в sys.modules: import numpy падает, как без пакета
+        monkeypatch.setitem(sys.modules, "numpy", None)
+
+    def test_retrieval_is_off_by_default(self, no_numpy):
+        assert numpy_available() is False
+
+    def test_chat_turn_and_history_survive(self, no_numpy, make_service):
+        db = mongomock_motor.AsyncMongoMockClient()["smart_context_no_numpy"]
+        started = datetime(2025, 1, 1, 12, 0)
+        docs = [{
+            "session_id": "s1",
+            "user_message": f"Вопрос {turn} про аудит сайта",
+            "ai_response": "Ответ консультанта",
+            "timestamp": started + timedelta(minutes=turn),
+        } for turn in range(30)]
+        # как при SMART_CONTEXT_RETRIEVAL=1 на хосте без numpy
+        context = SmartContext(retrieval=True)
+        service = make_service(database=lambda: db, context=context)
+
+        async def scenario():
+            await db.chat_messages.insert_many(docs)
+            reply = await service.chat(ChatRequest("s1", "Какая была моя конверсия?"))
+            history = await context.get_context("s1", db, query="Что с аудитом?")
+            return reply, history, await db.chat_messages.count_documents({})
+
+        reply, history, stored = asyncio.run(scenario())
+        assert reply.response == "ответ на: Какая была моя конверсия?"
+        assert stored == 31
+        assert history and history[-1]["content"] == reply.response
@@ -0,0 +1,45 @@
+"""
+Тесты холодного старта: тяжёлые модули не импортируются при загрузке API.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFERRED = ("tiktoken", "numpy", "redis", "emergentintegrations", "httpx", "aiohttp", "cachetools")
+
+
+def imported_after(statement: str, **environ: str) -> dict:
+    code = (
+        f"import sys; {statement}; import json; "
+        f"print(json.dumps({{name: name in sys.modules for name in {DEFERRED!r}}}))"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(ROOT / "backend"), str(ROOT / "frontend" / "api")])
+    env.pop("REDIS_URL", None)
+    env.pop("INTENT_CACHE_REDIS_URL", None)
+    env.pop("SMART_CONTEXT_REDIS_URL", None)
+    env.update(environ)
+    proc = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+class TestDeferredImports:
+    """index.py, routes.py и SmartContext не тянут тяжёлые зависимости при импорте"""
+
+    def test_routes_import_is_light(self):
+        loaded = imported_after("import routes")
+        assert not any(loaded.values()), loaded
+
+    def test_index_import_is_light(self):
+        # index.py проверяет обязательные переменные; подключение — в lifespan
+        loaded = imported_after("import index", MONGO_URL="mongodb://localhost:27017", DB_NAME="startup")
+        assert not any(loaded.values()), loaded
+
+    def test_smart_context_instance_is_lazy(self):
+        loaded = imported_after("from memory.smart_context import smart_context")
+        assert loaded["tiktoken"] is False
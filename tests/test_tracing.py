@@ -0,0 +1,122 @@
+"""
+Тесты трассировки стадий (backend/utils/tracing.py).
+"""
+
+import asyncio
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from middleware import RequestLoggingMiddleware
+from utils import tracing
+from utils.tracing import OTLPFileExporter, Trace, TracingMiddleware, parse_traceparent, span
+
+
+TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+class RecordingExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+def make_client(exporter=None, sample_rate=0.0, trust_parent=False):
+    app = FastAPI()
+    app.add_middleware(
+        TracingMiddleware, server_timing=True, sample_rate=sample_rate, exporter=exporter, trust_parent=trust_parent
+    )
+    app.add_middleware(RequestLoggingMiddleware, logger=logging.getLogger("test.tracing"))
+
+    @app.get("/chat")
+    async def chat():
+        with span("intent_check"):
+            await asyncio.sleep(0)
+        with span("llm_call"):
+            with span("llm_call.attempt", attempt=1):
+                await asyncio.sleep(0)
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+class TestSpans:
+    """Вложенность и работа вне трассы"""
+
+    def test_noop_without_trace(self):
+        with span("orphan") as item:
+            assert item is None
+
+    def test_nested_parent_ids(self):
+        trace = Trace.start("root")
+        token = tracing._current_trace.set(trace)
+        try:
+            with span("outer") as outer:
+                with span("inner") as inner:
+                    pass
+        finally:
+            tracing._current_trace.reset(token)
+
+        assert outer.parent_id == trace.root.span_id
+        assert inner.parent_id == outer.span_id
+        assert set(trace.summary()) == {"outer", "inner"}
+
+    def test_traceparent(self):
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert parse_traceparent(f"00-{trace_id}-00f067aa0ba902b7-01") == (trace_id, True)
+        assert parse_traceparent("garbage") == (None, None)
+
+
+class TestTracingMiddleware:
+    """Server-Timing, access-лог и OTLP-экспорт"""
+
+    def test_server_timing_and_log_stages(self, caplog):
+        caplog.set_level(logging.INFO, logger="test.tracing")
+        response = make_client().get("/chat")
+
+        timing = response.headers["server-timing"]
+        assert "intent_check;dur=" in timing
+        assert "llm_call.attempt;dur=" in timing
+        assert "total;dur=" in timing
+
+        access = [r for r in caplog.records if r.getMessage().startswith("←")][0]
+        assert set(access.stages) == {"intent_check", "llm_call", "llm_call.attempt"}
+
+    def test_sampled_export(self, tmp_path):
+        exporter = OTLPFileExporter(tmp_path / "traces.jsonl", service_name="test")
+        client = make_client(exporter=exporter, sample_rate=1.0)
+        client.get("/chat")
+        exporter.shutdown()
+
+        payload = json.loads((tmp_path / "traces.jsonl").read_text().splitlines()[0])
+        spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        by_name = {s["name"]: s for s in spans}
+        assert "GET /chat" in by_name
+        assert by_name["llm_call.attempt"]["parentSpanId"] == by_name["llm_call"]["spanId"]
+        assert int(by_name["GET /chat"]["endTimeUnixNano"]) >= int(by_name["llm_call"]["endTimeUnixNano"])
+
+    def test_client_flag_does_not_force_export(self):
+        exporter = RecordingExporter()
+        make_client(exporter=exporter).get("/chat", headers={"traceparent": TRACEPARENT})
+        assert exporter.traces == []
+
+    def test_trusted_parent_flag_is_honoured(self):
+        exporter = RecordingExporter()
+        make_client(exporter=exporter, trust_parent=True).get("/chat", headers={"traceparent": TRACEPARENT})
+        assert [trace.trace_id for trace in exporter.traces] == ["4bf92f3577b34da6a3ce929d0e0e4736"]
+
+
+class TestExporterQueue:
+    """Очередь экспорта ограничена: лишние трассы отбрасываются"""
+
+    def test_full_queue_drops(self, tmp_path):
+        exporter = OTLPFileExporter(tmp_path / "traces.jsonl", service_name="test", max_queue=2)
+        exporter._start = lambda: None  # поток-писатель не запущен: очередь не разбирается
+        for _ in range(5):
+            exporter.export(Trace.start("GET /chat", sampled=True))
+        assert exporter.dropped == 3
+        assert exporter._queue.qsize() == 2
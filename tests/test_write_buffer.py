@@ -0,0 +1,180 @@
+"""
+Тесты пакетной записи chat_messages (backend/services/write_buffer.py).
+"""
+
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import AutoReconnect
+
+from services.chat_service import ChatRequest, ChatService
+from services.write_buffer import ChatWriteBuffer
+
+
+class FakeCollection:
+    """insert_many с задержкой и заданным числом сбоев."""
+
+    def __init__(self, delay=0.01, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.batches = []
+
+    @property
+    def documents(self):
+        return [record for batch in self.batches for record in batch]
+
+    async def insert_many(self, records, ordered=True):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection reset")
+        self.batches.append(list(records))
+
+    async def insert_one(self, record):
+        await self.insert_many([record])
+
+
+def make_buffer(collection, tmp_path, **overrides):
+    settings = {"mode": "ack", "max_batch": 100, "flush_interval": 0.05, "retry_backoff": 0}
+    settings.update(overrides)
+    return ChatWriteBuffer(lambda: {"chat_messages": collection}, spill_path=tmp_path / "spill.jsonl", **settings)
+
+
+def record(i, session_id="s1"):
+    return {"id": str(i), "session_id": session_id, "user_message": f"вопрос {i}", "timestamp": datetime(2025, 1, 1)}
+
+
+class TestGroupCommit:
+    """ack: запрос ждёт своей пачки, пачки растут с нагрузкой"""
+
+    def test_concurrent_writes_share_batches(self, tmp_path):
+        collection = FakeCollection()
+        buffer = make_buffer(collection, tmp_path)
+
+        async def scenario():
+            await asyncio.gather(*(buffer.write(record(i, f"s{i}")) for i in range(50)))
+            # ack: к возврату write всё уже в коллекции
+            return len(collection.documents)
+
+        assert asyncio.run(scenario()) == 50
+        assert len(collection.batches) <= 2
+
+    def test_failure_reaches_caller(self, tmp_path):
+        buffer = make_buffer(FakeCollection(failures=1), tmp_path)
+
+        async def scenario():
+            try:
+                await buffer.write(record(1))
+            except AutoReconnect:
+                return "failed"
+
+        assert asyncio.run(scenario()) == "failed"
+
+
+class TestBuffered:
+    """buffered: ответ не ждёт записи, сбой повторяется или уходит в spill"""
+
+    def test_flush_by_time_and_settled(self, tmp_path):
+        collection = FakeCollection()
+        buffer = make_buffer(collection, tmp_path, mode="buffered")
+
+        async def scenario():
+            for i in range(3):
+                await buffer.write(record(i))
+            written_immediately = len(collection.documents)
+            await buffer.settled("s1")
+            return written_immediately
+
+        assert asyncio.run(scenario()) == 0
+        assert len(collection.batches) == 1 and len(collection.documents) == 3
+
+    def test_retries_then_spills_and_replays(self, tmp_path):
+        collection = FakeCollection(failures=2)
+        buffer = make_buffer(collection, tmp_path, mode="buffered", max_attempts=2, flush_interval=0)
+
+        async def scenario():
+            await buffer.write(record(1))
+            await buffer.settled("s1")
+
+        asyncio.run(scenario())
+        assert collection.documents == []
+        assert buffer.spilled == 1 and (tmp_path / "spill.jsonl").exists()
+
+        # Следующий процесс дописывает spill-файл при старте
+        restarted = make_buffer(collection, tmp_path, mode="buffered", flush_interval=0)
+
+        async def restart():
+            await restarted.write(record(2))
+            await restarted.stop()
+
+        asyncio.run(restart())
+        assert sorted(doc["id"] for doc in collection.documents) == ["1", "2"]
+        assert collection.documents[0]["timestamp"] == datetime(2025, 1, 1)
+        assert not (tmp_path / "spill.jsonl").exists()
+
+    def test_overflow_spills_and_stop_flushes(self, tmp_path):
+        collection = FakeCollection()
+        buffer = make_buffer(collection, tmp_path, mode="buffered", max_pending=2, flush_interval=10)
+
+        async def scenario():
+            for i in range(3):
+                await buffer.write(record(i))
+            await buffer.stop()
+
+        asyncio.run(scenario())
+        assert buffer.spilled == 1
+        # при остановке отложенная запись дописывается следом за очередью
+        assert [doc["id"] for doc in collection.documents] == ["0", "1", "2"]
+        assert not (tmp_path / "spill.jsonl").exists()
+
+    def test_unwritable_spill_does_not_hang_session(self, tmp_path):
+        # MongoDB недоступна, spill-файл записать нельзя (родитель — обычный файл)
+        (tmp_path / "blocked").write_text("")
+        collection = FakeCollection(failures=100)
+        buffer = ChatWriteBuffer(
+            lambda: {"chat_messages": collection}, mode="buffered", max_attempts=1, flush_interval=0,
+            retry_backoff=0, spill_path=tmp_path / "blocked" / "spill.jsonl", settle_timeout=1,
+        )
+
+        async def scenario():
+            await buffer.write(record(1))
+            await asyncio.wait_for(buffer.settled("s1"), 0.5)
+            # фоновая задача жива: следующая запись тоже отпускается
+            await buffer.write(record(2))
+            await asyncio.wait_for(buffer.settled("s1"), 0.5)
+            return buffer._task.done()
+
+        assert asyncio.run(scenario()) is False
+        assert buffer.spilled == 0 and collection.documents == []
+
+
+class TestChatServiceIntegration:
+    """Следующий ход сессии видит предыдущую реплику даже в режиме buffered"""
+
+    def test_next_turn_waits_for_buffered_write(self, tmp_path):
+        collection = FakeCollection(delay=0.02)
+
+        class Context:
+            async def get_context(self, session_id, db, query=None):
+                return [{"role": "user", "content": doc["user_message"]} for doc in collection.documents]
+
+        class LLM:
+            is_configured = True
+            seen = []
+
+            async def complete(self, request):
+                self.seen.append(len(request.history))
+                return "ответ"
+
+        llm = LLM()
+        writer = make_buffer(collection, tmp_path, mode="buffered", flush_interval=0.05)
+        service = ChatService(database=lambda: None, llm=llm, context=Context(), writer=writer)
+
+        async def scenario():
+            await service.chat(ChatRequest("s1", "Первый вопрос"))
+            await service.chat(ChatRequest("s1", "Второй вопрос"))
+            await writer.stop()
+
+        asyncio.run(scenario())
+        assert llm.seen == [0, 1]
+        assert len(collection.documents) == 2